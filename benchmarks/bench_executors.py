@@ -0,0 +1,72 @@
+"""
+Encryption throughput of each executor backend as the worker count grows.
+
+    uv run python benchmarks/bench_executors.py --size-mb 512 --chunk-mb 8
+"""
+import argparse
+import tempfile
+import time
+import os
+
+from secure_box.utils.lock import Lock
+from secure_box.utils.executors import gil_enabled
+
+
+def worker_counts(limit):
+    counts = []
+    n = 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    counts.append(limit)
+    return counts
+
+
+def bench(backend, workers, src, chunk_size, workdir):
+    locker = Lock("benchmark", workdir, os.path.join(workdir, "bench"), executor=backend)
+    locker.chunk_size = chunk_size
+    locker.max_workers = workers
+
+    out = os.path.join(workdir, "bench.bin")
+    start = time.perf_counter()
+    locker.encrypt_stream_parallel(src, out)
+    elapsed = time.perf_counter() - start
+
+    os.remove(out)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256, help="Plaintext size")
+    parser.add_argument("--chunk-mb", type=int, default=8, help="Chunk size")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(), help="Largest pool size")
+    parser.add_argument("--backends", nargs="+", default=["thread", "process"])
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="SECURE_BENCH_") as workdir:
+        src = os.path.join(workdir, "plain.dat")
+        with open(src, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        for backend in args.backends:
+            for workers in worker_counts(args.max_workers):
+                elapsed = bench(backend, workers, src, args.chunk_mb * 1024 * 1024, workdir)
+                results.append((backend, workers, size / elapsed / 1024**2))
+
+    print(f"\nGIL enabled: {gil_enabled()}, cores: {os.cpu_count()}, "
+          f"data: {args.size_mb} MB, chunk: {args.chunk_mb} MB\n")
+    print(f"{'backend':<10}{'workers':>8}{'MB/s':>12}{'speedup':>10}")
+
+    baseline = {}
+    for backend, workers, mbps in results:
+        baseline.setdefault(backend, mbps)
+        print(f"{backend:<10}{workers:>8}{mbps:>12.1f}{mbps / baseline[backend]:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Lock and unlock throughput across dataset shapes, chunk sizes and worker counts.
+
+    uv run python benchmarks/bench_lock_unlock.py run --size-mb 64 --out results.json
+    uv run python benchmarks/bench_lock_unlock.py compare results.json baseline.json
+
+Every stage (scan, lock, lock_tar, verify, decrypt, extract) is timed
+separately: wall and CPU time, MB/s, files/s and the peak RSS sampled while
+it ran. `lock` is the streaming lock, `lock_tar` the default one that writes
+a temporary TAR file first. `run` writes the results as JSON; `compare` flags
+the stages that got slower or bigger than a saved baseline and exits 1 when
+there are any.
+"""
+import argparse
+import platform
+import subprocess
+import threading
+import datetime
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+import psutil
+
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+from secure_box.utils.verify import Verifier
+from secure_box.utils.scanner import scan_folder
+from secure_box.utils.executors import gil_enabled
+from datasets import DATASETS, generate
+
+
+PASSWORD = "benchmark"
+RSS_INTERVAL = 0.01
+DEFAULT_THRESHOLD = 0.10   # relative slowdown / growth flagged by compare
+RSS_SLACK_MB = 16          # RSS growth below this is noise
+
+
+class NullSink:
+    """Writable that drops everything (decrypt speed without disk writes)"""
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class Stage:
+    """Time one stage: wall, CPU and the peak RSS sampled on a thread"""
+    def __init__(self):
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(RSS_INTERVAL):
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self.peak_rss = self.process.memory_info().rss
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+        self._stop.set()
+        self._sampler.join()
+        self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+
+def result(dataset, stage_name, stage, chunk_size, workers, compression, size, files):
+    return {
+        "dataset": dataset,
+        "stage": stage_name,
+        "chunk_size": chunk_size,
+        "workers": workers,
+        "compression": compression,
+        "bytes": size,
+        "files": files,
+        "wall_s": round(stage.wall, 4),
+        "cpu_s": round(stage.cpu, 4),
+        "mb_s": round(size / stage.wall / 1024**2, 2) if stage.wall else 0.0,
+        "files_s": round(files / stage.wall, 1) if stage.wall else 0.0,
+        "peak_rss_mb": round(stage.peak_rss / 1024**2, 1),
+    }
+
+
+def bench_once(dataset, folder, size, files, chunk_size, workers, compression, workdir):
+    """Run every stage once; returns {stage: (Stage, bytes)}"""
+    name = os.path.join(workdir, "bench")
+    box = name + ".bin"
+    stages = {}
+
+    with Stage() as stage:
+        scan_folder(folder)
+    stages["scan"] = stage
+
+    for stage_name, box_name, stream in (("lock", name, True), ("lock_tar", name + "_tar", False)):
+        locker = Lock(PASSWORD, folder, box_name, compression=compression)
+        locker.chunk_size = chunk_size
+        locker.max_workers = workers
+        with Stage() as stage:
+            locker.run(stream=stream)
+        stages[stage_name] = stage
+
+    with Stage() as stage:
+        report = Verifier(PASSWORD, name, max_workers=workers).verify()
+    if not report["ok"]:
+        raise RuntimeError(f"{dataset}: box failed verification")
+    stages["verify"] = stage
+
+    unlocker = Unlock(PASSWORD, name, max_workers=workers)
+    with Stage() as stage:
+        unlocker.decrypt_to(box, NullSink())
+    stages["decrypt"] = stage
+
+    out_dir = os.path.join(workdir, "out")
+    with Stage() as stage:
+        unlocker.decrypt_extract(box, out_dir)
+    stages["extract"] = stage
+
+    shutil.rmtree(out_dir)
+    for entry in os.listdir(workdir):
+        if entry.startswith(("bench.bin", "bench_tar.bin")):
+            os.remove(os.path.join(workdir, entry))
+    return stages
+
+
+def run(args):
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="SECURE_BENCH_") as workdir:
+        for dataset in args.datasets:
+            folder = os.path.join(workdir, dataset)
+            size, files = generate(dataset, folder, args.size_mb * 1024 * 1024, seed=args.seed)
+
+            for chunk_mb in args.chunk_mb:
+                for workers in args.workers:
+                    chunk_size = int(chunk_mb * 1024 * 1024)
+                    best = {}
+                    for _ in range(args.repeat):
+                        stages = bench_once(dataset, folder, size, files, chunk_size, workers,
+                                            args.compress, workdir)
+                        for stage_name, stage in stages.items():
+                            if stage_name not in best or stage.wall < best[stage_name].wall:
+                                best[stage_name] = stage
+
+                    for stage_name, stage in best.items():
+                        results.append(result(dataset, stage_name, stage, chunk_size, workers,
+                                              args.compress, size, files))
+                        print_row(results[-1])
+
+            shutil.rmtree(folder)
+
+    report = {"meta": environment(args), "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+    return 0
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cores": os.cpu_count(),
+        "memory_mb": psutil.virtual_memory().total // 1024**2,
+        "gil_enabled": gil_enabled(),
+        "size_mb": args.size_mb,
+        "repeat": args.repeat,
+        "seed": args.seed,
+    }
+
+
+def print_row(row):
+    print(f"{row['dataset']:<15}{row['stage']:<9}{row['chunk_size'] // 1024:>8}K{row['workers']:>4}"
+          f"{row['mb_s']:>10.1f} MB/s{row['files_s']:>11.0f} files/s"
+          f"{row['wall_s']:>9.2f}s{row['peak_rss_mb']:>8.0f} MB")
+
+
+def result_key(row):
+    return (row["dataset"], row["stage"], row["chunk_size"], row["workers"], row.get("compression", "none"))
+
+
+def find_regressions(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two result lists
+
+    Returns: [(row, baseline row, reason)] for every stage that got slower
+             or bigger by more than `threshold`
+    """
+    base = {result_key(row): row for row in baseline}
+    regressions = []
+
+    for row in current:
+        old = base.get(result_key(row))
+        if old is None:
+            continue
+
+        if old["mb_s"] and row["mb_s"] < old["mb_s"] * (1 - threshold):
+            regressions.append((row, old, f"{row['mb_s']:.1f} MB/s vs {old['mb_s']:.1f}"))
+        if row["peak_rss_mb"] > max(old["peak_rss_mb"] * (1 + threshold), old["peak_rss_mb"] + RSS_SLACK_MB):
+            regressions.append((row, old, f"peak RSS {row['peak_rss_mb']:.0f} MB vs {old['peak_rss_mb']:.0f}"))
+
+    return regressions
+
+
+def compare(args):
+    with open(args.results) as f:
+        current = json.load(f)["results"]
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = find_regressions(current, baseline, args.threshold)
+    matched = len({result_key(row) for row in current} & {result_key(row) for row in baseline})
+    print(f"{matched} stages compared, {len(regressions)} regressions (threshold {args.threshold:.0%})")
+
+    for row, _, reason in regressions:
+        print(f"  REGRESSION {row['dataset']}/{row['stage']} chunk={row['chunk_size'] // 1024}K "
+              f"workers={row['workers']}: {reason}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    run_parser.add_argument("--size-mb", type=int, default=64, help="Size of every dataset")
+    run_parser.add_argument("--chunk-mb", type=float, nargs="+", default=[1, 8], help="Chunk sizes")
+    run_parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()])
+    run_parser.add_argument("--compress", default="none", help="Per-chunk compression codec")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Runs per setting, the fastest counts")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--out", help="JSON results file")
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions against a baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Relative slowdown / RSS growth that counts as a regression")
+
+    args = parser.parse_args()
+    sys.exit(run(args) if args.command == "run" else compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Synthetic datasets for the benchmarks, generated from a fixed seed so every
+run (and every machine) measures the same bytes.
+
+    tiny            many files of 256 B - 4 KB (per-file overhead)
+    huge            two large files (raw chunk throughput)
+    deep            files spread over a deep directory tree (scan cost)
+    incompressible  random 1 MB files (compression that gains nothing)
+
+Everything except `incompressible` is compressible text.
+"""
+import random
+import os
+
+
+WORDS = [
+    "secure", "box", "chunk", "frame", "index", "cipher", "stream", "folder",
+    "archive", "member", "nonce", "tag", "journal", "slot", "worker", "pipe",
+]
+
+DEEP_LEVELS = 12
+DEEP_FILE_SIZE = 16 * 1024
+
+
+def text_bytes(rng, size):
+    """Compressible, text-like bytes"""
+    line = " ".join(rng.choice(WORDS) for _ in range(12)).encode() + b"\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_tiny(root, size, rng):
+    written = count = 0
+    while written < size:
+        length = rng.randint(256, 4096)
+        write_file(os.path.join(root, f"d{count // 1000:03d}", f"f{count:06d}.txt"), text_bytes(rng, length))
+        written += length
+        count += 1
+
+
+def make_huge(root, size, rng):
+    block = text_bytes(rng, 1024 * 1024)
+    for i in range(2):
+        path = os.path.join(root, f"huge{i}.log")
+        os.makedirs(root, exist_ok=True)
+        with open(path, "wb") as f:
+            remaining = size // 2
+            while remaining > 0:
+                f.write(block[:remaining])
+                remaining -= len(block)
+
+
+def make_deep(root, size, rng):
+    count = max(1, size // DEEP_FILE_SIZE)
+    for i in range(count):
+        depth = i % DEEP_LEVELS + 1
+        parts = [f"l{level}_{(i >> level) & 1}" for level in range(depth)]
+        write_file(os.path.join(root, *parts, f"f{i:06d}.txt"), text_bytes(rng, DEEP_FILE_SIZE))
+
+
+def make_incompressible(root, size, rng):
+    for i in range(max(1, size // (1024 * 1024))):
+        write_file(os.path.join(root, f"r{i:05d}.bin"), rng.randbytes(1024 * 1024))
+
+
+DATASETS = {
+    "tiny": make_tiny,
+    "huge": make_huge,
+    "deep": make_deep,
+    "incompressible": make_incompressible,
+}
+
+
+def generate(name, root, size, seed=0):
+    """
+    Create dataset `name` of about `size` bytes under `root`
+
+    Returns: (total bytes, file count)
+    """
+    DATASETS[name](root, size, random.Random(seed))
+
+    total = files = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+            files += 1
+    return total, files
@@ -1,10 +1,19 @@
 import click
-from secure_box.utils.lock import Lock
-from secure_box.utils.unlock import Unlock
-from secure_box.utils.logger import auto_logger
+from secure_box.utils.defaults import (
+    EXECUTORS, DEFAULT_COMPACT_THRESHOLD, DEFAULT_DEBOUNCE, DEFAULT_MAX_LAG, DEFAULT_MIN_INTERVAL,
+)
+from secure_box.utils.compress import CODECS
+from secure_box.utils.checksum import SCHEMES, DEFAULT_SCHEME
 
+# The modules behind the commands (cryptography, rich, psutil, watchdog,
+# loguru, ...) are imported inside the commands that use them, so trivial
+# commands start fast and create no log files.
 
-logger = auto_logger()
+
+def log_error(message):
+    """Log a failed command to cli.log in the log directory"""
+    from secure_box.utils.logger import auto_logger
+    auto_logger().error(message)
 
 
 @click.group()
@@ -18,14 +27,36 @@ def cli():
 @click.argument('output', type=str)
 @click.argument('password', type=str)
 @click.option('--resume', is_flag=True, help='Resume from checkpoint if available')
-def lock(folder, output, password, resume):
+@click.option('--stream', is_flag=True, help='Encrypt the TAR stream directly, without a temporary .tar file')
+@click.option('--executor', type=click.Choice(EXECUTORS), default='thread', show_default=True,
+              help='Worker pool used for encryption (auto: threads without a GIL, processes otherwise)')
+@click.option('--compress', 'compression', type=click.Choice(list(CODECS)), default='none',
+              show_default=True, help='Per-chunk compression before encryption')
+@click.option('--checksum', type=click.Choice(SCHEMES), default=DEFAULT_SCHEME, show_default=True,
+              help='Checksum scheme of the .sha256 sidecar (sha256-tree can be verified in parallel)')
+@click.option('--explain', is_flag=True, help='Show how the chunk size and workers were chosen')
+@click.option('--stats', 'stats_path', type=click.Path(dir_okay=False), default=None,
+              help='Write per-stage timings, queue depths and peak memory as JSON')
+@click.option('--prometheus', 'prometheus_path', type=click.Path(dir_okay=False), default=None,
+              help='Write the same metrics as a Prometheus textfile (node exporter)')
+def lock(folder, output, password, resume, stream, executor, compression, checksum, explain,
+         stats_path, prometheus_path):
     """Lock (encrypt) a folder"""
+    from secure_box.utils.lock import Lock
+    from secure_box.utils.config import explain as explain_plan
     try:
-        locker = Lock(password, folder, output)
-        locker.run(resume=resume)
+        locker = Lock(password, folder, output, executor=executor, compression=compression,
+                      checksum=checksum)
+        if explain:
+            click.echo(explain_plan(locker.plan))
+        locker.run(resume=resume, stream=stream)
+        if stats_path:
+            locker.metrics.write_json(stats_path)
+        if prometheus_path:
+            locker.metrics.write_prometheus(prometheus_path)
         click.echo(click.style("✓ Folder locked successfully!", fg='green'))
     except Exception as e:
-        logger.error(f"Lock failed: {e}")
+        log_error(f"Lock failed: {e}")
         click.echo(click.style(f"✗ Lock failed: {e}", fg='red'))
         raise SystemExit(1)
     
@@ -41,17 +72,271 @@ def success():
 @cli.command()
 @click.argument('data_file', type=str)
 @click.argument('password', type=str)
-def unlock(data_file, password):
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help='Decryption threads (default: based on CPU cores and RAM)')
+def unlock(data_file, password, workers):
     """Unlock (decrypt) a folder"""
+    from secure_box.utils.unlock import Unlock
     try:
-        unlocker = Unlock(password, data_file)
+        unlocker = Unlock(password, data_file, max_workers=workers)
         unlocker.run()
         click.echo(click.style("✓ Folder unlocked successfully!", fg='green'))
     except Exception as e:
-        logger.error(f"Unlock failed: {e}")
+        log_error(f"Unlock failed: {e}")
         click.echo(click.style(f"✗ Unlock failed: {e}", fg='red'))
         raise SystemExit(1)
 
 
+@cli.command()
+@click.argument('data_file', type=str)
+@click.argument('pattern', type=str)
+@click.option('--to', 'out_dir', type=click.Path(file_okay=False), default='.', show_default=True,
+              help='Directory to extract into')
+@click.option('--password', prompt=True, hide_input=True)
+def extract(data_file, pattern, out_dir, password):
+    """Extract files matching a path or glob without unlocking everything"""
+    from secure_box.utils.unlock import Unlock
+    try:
+        unlocker = Unlock(password, data_file)
+        names = unlocker.extract_paths(pattern, out_dir)
+        click.echo(click.style(f"✓ Extracted {len(names)} file(s) to {out_dir}", fg='green'))
+    except Exception as e:
+        log_error(f"Extract failed: {e}")
+        click.echo(click.style(f"✗ Extract failed: {e}", fg='red'))
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.argument('folder', type=click.Path(exists=True, file_okay=False))
+@click.argument('data_file', type=str)
+@click.option('--password', prompt=True, hide_input=True)
+@click.option('--executor', type=click.Choice(EXECUTORS), default='thread', show_default=True,
+              help='Worker pool used for encryption')
+@click.option('--compact-threshold', type=click.FloatRange(0, 1), default=DEFAULT_COMPACT_THRESHOLD,
+              show_default=True, help='Rewrite the box once this share of it is dead data')
+def update(folder, data_file, password, executor, compact_threshold):
+    """Append the changes in FOLDER to an existing box"""
+    from secure_box.utils.update import Updater
+    try:
+        updater = Updater(password, folder, data_file, executor=executor,
+                          compact_threshold=compact_threshold)
+        stats = updater.update()
+        message = (
+            f"✓ Box updated: {stats['added']} added, {stats['modified']} modified, "
+            f"{stats['removed']} removed, {stats['appended_bytes']} bytes appended"
+        )
+        if stats['compacted']:
+            message += ", compacted"
+        click.echo(click.style(message, fg='green'))
+    except Exception as e:
+        log_error(f"Update failed: {e}")
+        click.echo(click.style(f"✗ Update failed: {e}", fg='red'))
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.argument('folder', type=click.Path(exists=True, file_okay=False))
+@click.argument('data_file', type=str)
+@click.option('--password', prompt=True, hide_input=True)
+@click.option('--debounce', type=click.FloatRange(0), default=DEFAULT_DEBOUNCE, show_default=True,
+              help='Seconds without changes that close a batch')
+@click.option('--max-lag', type=click.FloatRange(0), default=DEFAULT_MAX_LAG, show_default=True,
+              help='Seconds after the first change by which a batch is relocked')
+@click.option('--min-interval', type=click.FloatRange(0), default=DEFAULT_MIN_INTERVAL, show_default=True,
+              help='Minimum seconds between two relocks')
+@click.option('--executor', type=click.Choice(EXECUTORS), default='thread', show_default=True,
+              help='Worker pool used for encryption')
+@click.option('--compact-threshold', type=click.FloatRange(0, 1), default=DEFAULT_COMPACT_THRESHOLD,
+              show_default=True, help='Rewrite the box once this share of it is dead data')
+def watch(folder, data_file, password, debounce, max_lag, min_interval, executor, compact_threshold):
+    """Keep a box in sync with FOLDER until interrupted"""
+    from secure_box.utils.watch import Watcher
+    try:
+        watcher = Watcher(password, folder, data_file, debounce=debounce, max_lag=max_lag,
+                          min_interval=min_interval, executor=executor,
+                          compact_threshold=compact_threshold)
+    except Exception as e:
+        log_error(f"Watch failed: {e}")
+        click.echo(click.style(f"✗ Watch failed: {e}", fg='red'))
+        raise SystemExit(1)
+
+    click.echo(f"Watching {folder}, press Ctrl+C to stop")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+    metrics = watcher.metrics
+    click.echo(click.style(
+        f"✓ Watch stopped: {metrics['relocks']} relocks, {metrics['files']} files, "
+        f"{metrics['appended_bytes']} bytes appended, max lag {metrics['max_lag']:.1f}s, "
+        f"{metrics['failures']} failures",
+        fg='green' if not metrics['failures'] else 'yellow'))
+
+
+@cli.command()
+@click.argument('data_files', nargs=-1, required=True, type=str)
+@click.option('--password', prompt=True, hide_input=True)
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help='Verification threads (default: based on CPU cores and RAM)')
+def verify(data_files, password, workers):
+    """Check boxes for damage without writing any plaintext"""
+    from secure_box.utils.verify import Verifier
+    failed = 0
+    for data_file in data_files:
+        try:
+            report = Verifier(password, data_file, max_workers=workers).verify()
+        except Exception as e:
+            log_error(f"Verify of {data_file} failed: {e}")
+            click.echo(click.style(f"✗ {data_file}: {e}", fg='red'))
+            failed += 1
+            continue
+
+        if report["ok"]:
+            click.echo(click.style(f"✓ {data_file}: {report['chunks']} chunks intact", fg='green'))
+            continue
+
+        failed += 1
+        problems = []
+        if report["damaged"]:
+            problems.append(f"damaged chunks {', '.join(map(str, report['damaged']))}")
+        if report["meta"] is False:
+            problems.append("damaged member table")
+        if report["checksum"] is False:
+            problems.append(f"{report['scheme']} checksum mismatch")
+        click.echo(click.style(f"✗ {data_file}: {'; '.join(problems)}", fg='red'))
+
+    if failed:
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.argument('data_file', type=str)
+@click.option('--password', prompt=True, hide_input=True)
+def compact(data_file, password):
+    """Rewrite an updated box without its dead data"""
+    from secure_box.utils.update import Updater
+    try:
+        reclaimed = Updater(password, None, data_file).compact()
+        click.echo(click.style(f"✓ Box compacted, {reclaimed} bytes reclaimed", fg='green'))
+    except Exception as e:
+        log_error(f"Compact failed: {e}")
+        click.echo(click.style(f"✗ Compact failed: {e}", fg='red'))
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.argument('data_file', type=str)
+@click.option('--password', prompt=True, hide_input=True, help='A current password of the box')
+@click.option('--new-password', default=None, help='Password to set (prompted)')
+@click.option('--add', is_flag=True, help='Add the new password, keeping the current one')
+@click.option('--remove', is_flag=True, help='Revoke the current password')
+def rekey(data_file, password, new_password, add, remove):
+    """Change, add or remove a password without re-encrypting the box"""
+    from secure_box.utils.keys import add_password, change_password, remove_password
+    path = data_file + ".bin"
+    try:
+        if add and remove:
+            raise click.UsageError("--add and --remove are mutually exclusive")
+        
+        if remove:
+            remove_password(path, password)
+            click.echo(click.style("✓ Password removed", fg='green'))
+            return
+        
+        if new_password is None:
+            new_password = click.prompt("New password", hide_input=True, confirmation_prompt=True)
+        
+        if add:
+            add_password(path, password, new_password)
+            click.echo(click.style("✓ Password added", fg='green'))
+        else:
+            change_password(path, password, new_password)
+            click.echo(click.style("✓ Password changed", fg='green'))
+    except click.UsageError:
+        raise
+    except Exception as e:
+        log_error(f"Rekey failed: {e}")
+        click.echo(click.style(f"✗ Rekey failed: {e}", fg='red'))
+        raise SystemExit(1)
+
+
+@cli.group()
+def repo():
+    """Deduplicating snapshot repository"""
+    pass
+
+
+def _run_repo(action, message):
+    try:
+        result = action()
+        click.echo(click.style(f"✓ {message(result)}", fg='green'))
+    except Exception as e:
+        log_error(f"Repository operation failed: {e}")
+        click.echo(click.style(f"✗ {e}", fg='red'))
+        raise SystemExit(1)
+
+
+@repo.command('init')
+@click.argument('path', type=click.Path())
+@click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True)
+def repo_init(path, password):
+    """Create an empty repository"""
+    from secure_box.utils.repository import Repository
+    _run_repo(
+        lambda: Repository(path, password).init(),
+        lambda result: f"Repository created at {path}",
+    )
+
+
+@repo.command('backup')
+@click.argument('path', type=click.Path(exists=True))
+@click.argument('folder', type=click.Path(exists=True))
+@click.option('--password', prompt=True, hide_input=True)
+@click.option('--compress', 'compression', type=click.Choice(list(CODECS)), default='zlib', show_default=True)
+@click.option('--workers', type=click.IntRange(min=1), default=4, show_default=True)
+def repo_backup(path, folder, password, compression, workers):
+    """Store a new snapshot of FOLDER, writing only new chunks"""
+    from secure_box.utils.repository import Repository
+    _run_repo(
+        lambda: Repository(path, password, max_workers=workers).open().backup(folder, compression),
+        lambda stats: (
+            f"Snapshot {stats['snapshot']}: {stats['new_chunks']}/{stats['chunks']} "
+            f"new chunks, {stats['new_bytes']} bytes written"
+        ),
+    )
+
+
+@repo.command('snapshots')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--password', prompt=True, hide_input=True)
+def repo_snapshots(path, password):
+    """List snapshots"""
+    from secure_box.utils.repository import Repository
+    repository = Repository(path, password)
+    _run_repo(
+        lambda: repository.open().snapshots(),
+        lambda snapshots: "\n".join(
+            [f"{len(snapshots)} snapshot(s)"]
+            + [f"  {name}  {info['time']}  {info['size']} bytes  {info['source']}" for name, info in snapshots]
+        ),
+    )
+
+
+@repo.command('restore')
+@click.argument('path', type=click.Path(exists=True))
+@click.argument('snapshot', type=str)
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option('--password', prompt=True, hide_input=True)
+@click.option('--workers', type=click.IntRange(min=1), default=4, show_default=True)
+def repo_restore(path, snapshot, out_dir, password, workers):
+    """Restore SNAPSHOT into OUT_DIR"""
+    from secure_box.utils.repository import Repository
+    _run_repo(
+        lambda: Repository(path, password, max_workers=workers).open().restore(snapshot, out_dir),
+        lambda result: f"Snapshot {snapshot} restored to {out_dir}",
+    )
+
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""TAR stream production shared by Lock and the snapshot repository"""
+from .statcache import new_hash
+import threading
+import tarfile
+
+
+TAR_BLOCK = 512
+TAR_BUFSIZE = 1024 * 1024
+
+
+def padded_size(size):
+    """Size of a member's data rounded up to whole TAR blocks"""
+    return -(-size // TAR_BLOCK) * TAR_BLOCK
+
+
+def estimate_tar_size(files):
+    """
+    Estimate the size of the TAR stream (headers + padded data)
+
+    Args:
+        files: Manifest or FileEntry list
+    """
+    total = 2 * TAR_BLOCK
+    for entry in files:
+        total += TAR_BLOCK + padded_size(entry.size)
+    return total
+
+
+class HashingReader:
+    """Read-only file wrapper hashing the data as tarfile copies it"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hash = new_hash()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hash.update(data)
+        return data
+
+
+def add_member(tar, full_path, arcname, base=0, digests=None):
+    """
+    Add one file to the TAR archive
+
+    Args:
+        base: Offset of this TAR stream within a larger plaintext stream
+        digests: Dict receiving {name: content hash} for regular files,
+                 hashed inline while the data is archived
+
+    Returns: member table entry [name, start, end, size, mtime] where
+             start/end delimit the member's headers and padded data in
+             the TAR stream and mtime is the file's (float) stat mtime
+    """
+    start = tar.offset
+    info = None if digests is None else tar.gettarinfo(full_path, arcname)
+
+    if info is not None and info.isreg():
+        with open(full_path, "rb") as f:
+            reader = HashingReader(f)
+            tar.addfile(info, reader)
+        digests[info.name] = reader.hash.digest()
+    else:
+        tar.add(full_path, arcname=arcname)
+
+    info = tar.members.pop()  # don't keep every TarInfo in memory
+    return [info.name, base + start, base + tar.offset, info.size, info.mtime]
+
+
+def read_tar_members(path):
+    """Rebuild the member table of an existing TAR file"""
+    members = []
+    with tarfile.open(path, "r") as tar:
+        for info in tar:
+            end = info.offset_data + padded_size(info.size)
+            members.append([info.name, info.offset, end, info.size, int(info.mtime)])
+    return members
+
+
+def write_tar_stream(files, fileobj, members, base=0, digests=None):
+    """
+    Write files as a TAR stream into a file-like object
+
+    Args:
+        files: Manifest or FileEntry list, in archive order
+        base: Offset added to the member table entries
+        digests: Optional dict receiving the content hashes (see add_member)
+    """
+    with tarfile.open(fileobj=fileobj, mode="w|", bufsize=TAR_BUFSIZE) as tar:
+        for entry in files:
+            members.append(add_member(tar, entry.path, entry.arcname, base, digests))
+
+
+def start_producer(write, pipe, name="secure-box-tar"):
+    """
+    Run `write(pipe)` on a background thread and close the pipe after it.
+    Errors are forwarded to the reading side of the pipe.
+    """
+    def produce():
+        try:
+            write(pipe)
+        except BaseException as e:
+            pipe.close(error=e)
+        else:
+            pipe.close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def start_tar_producer(files, pipe, members, base=0, digests=None):
+    """
+    Produce the TAR stream of `files` (a Manifest) into `pipe` on a
+    background thread. The member table is appended to `members`.
+    """
+    return start_producer(
+        lambda fileobj: write_tar_stream(files, fileobj, members, base, digests), pipe
+    )
@@ -1,10 +1,10 @@
 import os
 import json
-import hashlib
 import time
-import tempfile
 import shutil
 from .logger import auto_logger
+from .journal import CheckpointJournal
+from .checksum import Checksum, DEFAULT_SCHEME, hash_file, rehash_file, read_checksum, write_checksum
 
 
 
@@ -12,24 +12,47 @@ logger = auto_logger()
 
 
 class SafeBackupWriter:
-    def __init__(self, out_path):
+    def __init__(self, out_path, checksum_scheme=DEFAULT_SCHEME):
+        """
+        Args:
+            checksum_scheme: Sidecar scheme used when the writer function
+                             does not hand back a checksum (see checksum.py)
+        """
         self.out_path = out_path
+        self.checksum_scheme = checksum_scheme
         self.hash_path = out_path + ".sha256"
         self.state_path = out_path + ".state"
         self.checkpoint_path = out_path + ".checkpoint"  
+        self.partial_path = out_path + ".partial"
+        self.journal_path = self.partial_path + ".journal"
     
-    def sha256_file(self, path):
-        sha = hashlib.sha256()
-        with open(path, "rb") as f:
-            while True:
-                chunk = f.read(1024*1024)
-                if not chunk:
-                    break
-                sha.update(chunk)
-        return sha.hexdigest()
+    def refresh_checksum(self, changed_from=0, changed_to=None, scheme=None):
+        """
+        Rehash the output after an in-place change, keeping the sidecar's
+        scheme unless `scheme` names another one
+
+        Args:
+            changed_from: First byte that changed; a sha256-tree sidecar with
+                          saved leaves only rehashes the leaves from there
+            changed_to: End of the changed bytes (None: to the end of the file)
+        """
+        current = read_checksum(self.hash_path)
+        if current is None or scheme not in (None, current.scheme):
+            checksum = hash_file(self.out_path, scheme or self.checksum_scheme)
+        else:
+            checksum = rehash_file(self.out_path, current, changed_from, changed_to)
+            if checksum is None:
+                checksum = hash_file(self.out_path, current.scheme, current.leaf_size)
+        write_checksum(self.hash_path, checksum)
     
-    def write_state(self, status, progress=None):
-        """Write state with optional progress info"""
+    def write_state(self, status, progress=None, fingerprint=None):
+        """
+        Write state with optional progress info
+
+        Args:
+            fingerprint: Digest of the input being written (see
+                         Manifest.fingerprint), checked before a resume
+        """
         state = {
             "status": status,
             "timestamp": time.time(),
@@ -38,24 +61,30 @@ class SafeBackupWriter:
         
         if progress is not None:
             state["progress"] = progress
+        if fingerprint is not None:
+            state["fingerprint"] = fingerprint
         
         with open(self.state_path, "w") as f:
             json.dump(state, f, indent=4)
-    
-    def write_checkpoint(self, bytes_written, chunk_index):
-        """Save checkpoint for resume capability"""
-        checkpoint = {
-            "bytes_written": bytes_written,
-            "chunk_index": chunk_index,
-            "timestamp": time.time(),
-            "target": self.out_path
-        }
-        
-        with open(self.checkpoint_path, "w") as f:
-            json.dump(checkpoint, f, indent=4)
+
+    def read_state(self):
+        """The last written state, None when missing or unreadable"""
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
     
     def load_checkpoint(self):
-        """Load checkpoint if exists"""
+        """
+        Load the resume point: the last verified frame of the checkpoint
+        journal, or a JSON checkpoint from an older version
+        """
+        checkpoint = CheckpointJournal.recover(self.journal_path, self.partial_path)
+        if checkpoint:
+            logger.info(f"Found checkpoint journal: {checkpoint['bytes_written']} bytes written")
+            return checkpoint
+
         if os.path.exists(self.checkpoint_path):
             try:
                 with open(self.checkpoint_path, "r") as f:
@@ -69,8 +98,9 @@ class SafeBackupWriter:
     
     def clear_checkpoint(self):
         """Clear checkpoint after successful completion"""
-        if os.path.exists(self.checkpoint_path):
-            os.remove(self.checkpoint_path)
+        for path in (self.checkpoint_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
     
     def cleanup_incomplete(self):
         """Clean up incomplete backup"""
@@ -82,51 +112,82 @@ class SafeBackupWriter:
                 logger.info("Cleaning up incomplete backup...")
                 os.remove(self.state_path)
                 
-                if os.path.exists(self.checkpoint_path):
+                if os.path.exists(self.checkpoint_path) or os.path.exists(self.journal_path):
                     logger.info("Incomplete backup found. Use resume=True to continue.")
     
-    def write_backup(self, writer_function, resume=False):
-        """Write backup with resume capability"""
+    def _prepare_partial(self, checkpoint):
+        """
+        Get the partial output ready for writing.
+        
+        When resuming, the partial file is cut back to the offset recorded in
+        the checkpoint (anything after it was written but never checkpointed).
+        
+        Returns: the checkpoint to resume from, or None for a fresh start
+        """
+        if checkpoint:
+            offset = checkpoint.get("output_offset")
+            
+            if (offset is not None and os.path.exists(self.partial_path)
+                    and os.path.getsize(self.partial_path) >= offset):
+                with open(self.partial_path, "r+b") as f:
+                    f.truncate(offset)
+                return checkpoint
+            
+            logger.warning("Partial output does not match the checkpoint, starting over")
+        
+        self.clear_checkpoint()
+        open(self.partial_path, "wb").close()
+        return None
+    
+    def write_backup(self, writer_function, resume=False, fingerprint=None):
+        """
+        Write backup with resume capability
+        
+        Args:
+            writer_function: Called with (tmp_path, checkpoint); may return the
+                             Checksum it computed while writing, otherwise the
+                             output is hashed afterwards
+            fingerprint: Digest of the input; a resume whose input no longer
+                         matches the interrupted run's starts over instead
+        """
         checkpoint = None
         
         if resume:
             checkpoint = self.load_checkpoint()
+            state = self.read_state() or {}
+            if checkpoint and fingerprint is not None and state.get("fingerprint") != fingerprint:
+                logger.warning("Input changed since the interrupted run, starting over")
+                checkpoint = None
             if checkpoint:
                 logger.info(f"Resuming from chunk {checkpoint['chunk_index']}")
+                fingerprint = fingerprint or state.get("fingerprint")
         
         if not checkpoint:
             self.cleanup_incomplete()
         
-        self.write_state("in-progress", progress={"resumed": resume})
+        self.write_state("in-progress", progress={"resumed": resume}, fingerprint=fingerprint)
         tmp_path = None
 
         try:
-            target_dir = os.path.dirname(os.path.abspath(self.out_path)) or '.'
-            
-            with tempfile.NamedTemporaryFile(
-                delete=False, 
-                dir=target_dir,
-                prefix=".tmp_securebox_",
-                suffix=".bin"
-            ) as tmp:
-                tmp_path = tmp.name
-
-            
-            writer_function(tmp_path, checkpoint)
-            file_hash = self.sha256_file(tmp_path)
+            checkpoint = self._prepare_partial(checkpoint)
+            tmp_path = self.partial_path
             
+            checksum = writer_function(tmp_path, checkpoint)
+            if not isinstance(checksum, Checksum):
+                checksum = hash_file(tmp_path, self.checksum_scheme)
 
             shutil.move(tmp_path, self.out_path)
-            with open(self.hash_path, "w") as f:
-                f.write(file_hash)
+            write_checksum(self.hash_path, checksum)
 
-            self.write_state("completed")
+            self.write_state("completed", fingerprint=fingerprint)
             self.clear_checkpoint()
             logger.info("Backup successfully completed!")
             
         except Exception as e:
             logger.warning(f"Backup failed: {e}")
-            if tmp_path and os.path.exists(tmp_path):
+            if os.path.exists(self.checkpoint_path) or os.path.exists(self.journal_path):
+                logger.info("Partial output kept. Use resume=True to continue.")
+            elif tmp_path and os.path.exists(tmp_path):
                 try:
                     os.remove(tmp_path)
                 except:
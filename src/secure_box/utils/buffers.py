@@ -0,0 +1,57 @@
+import threading
+import os
+
+
+class BufferPool:
+    """
+    Fixed set of preallocated, reusable chunk buffers.
+
+    The encryption loop reads every chunk into a pooled buffer with
+    `readinto` and returns it once the chunk's frame is written (decryption
+    likewise decrypts into one until the plaintext is written), so the
+    number of chunk-sized allocations is fixed by the pool size instead of
+    growing with the input.
+    """
+    def __init__(self, size, count):
+        self.size = size
+        self._free = [bytearray(size) for _ in range(count)]
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a free buffer, blocking until one is returned"""
+        with self._cond:
+            while not self._free:
+                self._cond.wait()
+            return self._free.pop()
+
+    def release(self, buffer):
+        with self._cond:
+            self._free.append(buffer)
+            self._cond.notify()
+
+
+def write_buffers(fileobj, buffers):
+    """
+    Write several buffers with one vectored write where available
+
+    Args:
+        fileobj: Binary file; its Python-level buffer is flushed first
+        buffers: bytes-like objects, written in order
+    """
+    if not hasattr(os, "writev"):
+        for buffer in buffers:
+            fileobj.write(buffer)
+        return
+
+    fileobj.flush()
+    fd = fileobj.fileno()
+    views = [memoryview(buffer).cast("B") for buffer in buffers]
+
+    while views:
+        written = os.writev(fd, views)
+        # Drop what went out, keep the rest of a partially written buffer
+        while views and written >= len(views[0]):
+            written -= len(views[0])
+            views.pop(0)
+        if views and written:
+            views[0] = views[0][written:]
@@ -0,0 +1,229 @@
+"""
+Checksum sidecar of a box (`<box>.sha256`).
+
+The sidecar is one line naming its scheme, then the hex digest:
+
+    sha256 <hex>                    SHA-256 of the whole file
+    sha256-tree:<leaf size> <hex>   SHA-256 over the SHA-256 digests of
+                                    consecutive leaf_size blocks of the file
+
+A bare hex digest (older boxes) is a plain sha256. Both schemes are hashed
+inline while the box is written; the tree scheme's leaves can also be
+hashed independently, so checking a large box can use every core.
+
+The leaf digests of a tree sidecar are kept next to it (`<box>.sha256.leaves`,
+32 bytes per leaf). After an in-place change only the leaves from the first
+changed byte on are hashed again; the root in the sidecar vouches for the
+kept ones.
+"""
+import hashlib
+import os
+
+
+SHA256 = "sha256"
+SHA256_TREE = "sha256-tree"
+SCHEMES = (SHA256, SHA256_TREE)
+DEFAULT_SCHEME = SHA256
+
+TREE_LEAF_SIZE = 4 * 1024 * 1024
+LEAF_DIGEST_SIZE = 32
+LEAVES_SUFFIX = ".leaves"
+READ_SIZE = 1024 * 1024
+HASH_WORKERS = os.cpu_count() or 1
+
+
+class TreeHasher:
+    """Incremental sha256-tree: hashes leaves as the data streams past"""
+    def __init__(self, leaf_size=TREE_LEAF_SIZE):
+        self.leaf_size = leaf_size
+        self.leaves = []
+        self.leaf = hashlib.sha256()
+        self.filled = 0
+
+    def update(self, data):
+        view = memoryview(data).cast("B")
+        while len(view):
+            take = min(len(view), self.leaf_size - self.filled)
+            self.leaf.update(view[:take])
+            self.filled += take
+            view = view[take:]
+
+            if self.filled == self.leaf_size:
+                self.leaves.append(self.leaf.digest())
+                self.leaf = hashlib.sha256()
+                self.filled = 0
+
+    def all_leaves(self):
+        """Digests of every leaf so far, the partial last one included"""
+        return self.leaves + [self.leaf.digest()] if self.filled else list(self.leaves)
+
+    def hexdigest(self):
+        return tree_root(self.all_leaves())
+
+
+def tree_root(leaves):
+    return hashlib.sha256(b"".join(leaves)).hexdigest()
+
+
+class Checksum:
+    """
+    A parsed sidecar: scheme, tree leaf size (or None) and hex digest, plus
+    the leaf digests when they are known
+    """
+    def __init__(self, scheme, hexdigest, leaf_size=None, leaves=None):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown checksum scheme: {scheme}")
+        self.scheme = scheme
+        self.hexdigest = hexdigest
+        self.leaf_size = leaf_size if scheme == SHA256_TREE else None
+        self.leaves = leaves if scheme == SHA256_TREE else None
+
+    @classmethod
+    def parse(cls, text):
+        parts = text.split()
+        if len(parts) == 1:
+            return cls(SHA256, parts[0])
+
+        scheme, hexdigest = parts
+        name, _, leaf_size = scheme.partition(":")
+        return cls(name, hexdigest, int(leaf_size) if leaf_size else TREE_LEAF_SIZE)
+
+    def format(self):
+        scheme = self.scheme if self.leaf_size is None else f"{self.scheme}:{self.leaf_size}"
+        return f"{scheme} {self.hexdigest}\n"
+
+    def new_hasher(self):
+        """A hasher of the same scheme, for checking a file against this"""
+        return new_hasher(self.scheme, self.leaf_size)
+
+    def __eq__(self, other):
+        return (isinstance(other, Checksum) and self.scheme == other.scheme
+                and self.leaf_size == other.leaf_size and self.hexdigest == other.hexdigest)
+
+
+def new_hasher(scheme=DEFAULT_SCHEME, leaf_size=None):
+    if scheme == SHA256_TREE:
+        return TreeHasher(leaf_size or TREE_LEAF_SIZE)
+    if scheme == SHA256:
+        return hashlib.sha256()
+    raise ValueError(f"Unknown checksum scheme: {scheme}")
+
+
+def checksum_of(hasher):
+    """Checksum of a finished hasher"""
+    if isinstance(hasher, TreeHasher):
+        leaves = hasher.all_leaves()
+        return Checksum(SHA256_TREE, tree_root(leaves), hasher.leaf_size, leaves)
+    return Checksum(SHA256, hasher.hexdigest())
+
+
+def _hash_leaf(fd, offset, length):
+    leaf = hashlib.sha256()
+    end = offset + length
+    while offset < end:
+        data = os.pread(fd, min(READ_SIZE, end - offset), offset)
+        if not data:
+            break
+        leaf.update(data)
+        offset += len(data)
+    return leaf.digest()
+
+
+def _hash_leaves(path, leaf_size, start, end, workers):
+    """Digests of the leaves between bytes `start` (a leaf boundary) and `end`"""
+    from concurrent.futures import ThreadPoolExecutor
+    offsets = range(start, end, leaf_size)
+
+    with open(path, "rb") as f, ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            lambda offset: _hash_leaf(f.fileno(), offset, leaf_size), offsets
+        ))
+
+
+def hash_file(path, scheme=DEFAULT_SCHEME, leaf_size=None, workers=HASH_WORKERS):
+    """
+    Checksum of a file; tree leaves are hashed on `workers` threads
+    (hashlib releases the GIL on large buffers)
+    """
+    if scheme == SHA256_TREE and hasattr(os, "pread"):
+        leaf_size = leaf_size or TREE_LEAF_SIZE
+        leaves = _hash_leaves(path, leaf_size, 0, os.path.getsize(path), workers)
+        return Checksum(SHA256_TREE, tree_root(leaves), leaf_size, leaves)
+
+    hasher = new_hasher(scheme, leaf_size)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+    return checksum_of(hasher)
+
+
+def rehash_file(path, checksum, changed_from, changed_to=None, workers=HASH_WORKERS):
+    """
+    Tree checksum of a file whose bytes [changed_from, changed_to) changed
+    in place, reusing the other leaves of `checksum`
+
+    Args:
+        changed_to: End of the change; None when everything from
+                    `changed_from` on may have changed (an append)
+
+    Returns: Checksum, or None when `checksum` has no (or not the right
+             number of) known leaves
+    """
+    if checksum.leaves is None or not hasattr(os, "pread"):
+        return None
+
+    leaf_size = checksum.leaf_size
+    size = os.path.getsize(path)
+    first = changed_from // leaf_size
+
+    if changed_to is None:
+        if first > len(checksum.leaves):
+            return None
+        end, tail = size, []
+    else:
+        if len(checksum.leaves) != -(-size // leaf_size):
+            return None
+        last = -(-changed_to // leaf_size)
+        end, tail = min(last * leaf_size, size), checksum.leaves[last:]
+
+    leaves = checksum.leaves[:first] + _hash_leaves(path, leaf_size, first * leaf_size, end, workers) + tail
+    return Checksum(SHA256_TREE, tree_root(leaves), leaf_size, leaves)
+
+
+def read_checksum(hash_path):
+    """
+    Checksum from a sidecar, or None when there is none; a tree checksum
+    carries its saved leaves when they match the root
+    """
+    if not os.path.exists(hash_path):
+        return None
+
+    with open(hash_path, "r") as f:
+        text = f.read().strip()
+    if not text:
+        return None
+
+    checksum = Checksum.parse(text)
+    if checksum.scheme == SHA256_TREE and os.path.exists(hash_path + LEAVES_SUFFIX):
+        with open(hash_path + LEAVES_SUFFIX, "rb") as f:
+            raw = f.read()
+        leaves = [raw[i:i + LEAF_DIGEST_SIZE] for i in range(0, len(raw), LEAF_DIGEST_SIZE)]
+        if tree_root(leaves) == checksum.hexdigest:
+            checksum.leaves = leaves
+    return checksum
+
+
+def write_checksum(hash_path, checksum):
+    """Write the sidecar, and the leaf digests of a tree checksum next to it"""
+    leaves_path = hash_path + LEAVES_SUFFIX
+    if checksum.leaves is not None:
+        with open(leaves_path, "wb") as f:
+            f.write(b"".join(checksum.leaves))
+    elif os.path.exists(leaves_path):
+        os.remove(leaves_path)
+
+    with open(hash_path, "w") as f:
+        f.write(checksum.format())
@@ -0,0 +1,88 @@
+import zlib
+import lzma
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_ZSTD = 3
+
+CODECS = {
+    "none": CODEC_NONE,
+    "zlib": CODEC_ZLIB,
+    "lzma": CODEC_LZMA,
+    "zstd": CODEC_ZSTD,
+}
+
+SAMPLE_SIZE = 64 * 1024
+MIN_SAVING = 0.1
+
+
+def available_codecs():
+    """Names of the codecs usable in this interpreter"""
+    return [name for name in CODECS if name != "zstd" or zstd is not None]
+
+
+def get_codec(name):
+    """Codec id for a compression name"""
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression '{name}', expected one of {list(CODECS)}")
+    if name == "zstd" and zstd is None:
+        raise ValueError("zstd compression needs Python 3.14+ or the 'zstandard' package")
+    return CODECS[name]
+
+
+def _compress(codec, data):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    if codec == CODEC_LZMA:
+        return lzma.compress(data, preset=1)
+    return zstd.compress(data)
+
+
+def decompress_chunk(codec, data):
+    """Reverse compress_chunk"""
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_LZMA:
+        return lzma.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstd is None:
+            raise ValueError("Box uses zstd compression but zstd is not available")
+        return zstd.decompress(data)
+    raise ValueError(f"Unknown codec id {codec}")
+
+
+def compress_chunk(codec, data):
+    """
+    Compress one chunk, falling back to storing it raw.
+
+    Before paying for the real codec, a fast zlib pass over the first
+    SAMPLE_SIZE bytes tells whether the chunk is worth compressing at all
+    (already compressed media, encrypted data, ...).
+
+    Returns: (codec actually used, payload)
+    """
+    if codec == CODEC_NONE or not data:
+        return CODEC_NONE, data
+
+    if len(data) > SAMPLE_SIZE:
+        sample = data[:SAMPLE_SIZE]
+        if len(zlib.compress(sample, 1)) > len(sample) * (1 - MIN_SAVING):
+            return CODEC_NONE, data
+
+    payload = _compress(codec, data)
+    if len(payload) > len(data) * (1 - MIN_SAVING):
+        return CODEC_NONE, data
+
+    return codec, payload
@@ -1,4 +1,5 @@
 from .tools import get_file_size,get_folder_size,get_system_details
+from collections import namedtuple
 import inspect
 import os
 import yaml
@@ -21,60 +22,124 @@ def load_config():
 
 
 
-def lock_auto_config(folder):
+MIN_CHUNK_MB = 1
+MAX_CHUNK_MB = 64
+CHUNKS_PER_WORKER = 4     # enough chunks that no worker idles at the tail
+WINDOW_PER_WORKER = 2     # chunks in flight per worker (reorder window)
+MEMORY_FRACTION = 0.25    # share of the available RAM the pipeline may use
+TAR_OVERHEAD = 1024       # TAR header + padding per file, roughly
+
+# chunk_size, max_workers, window (chunks in flight) and why
+Plan = namedtuple("Plan", "chunk_size max_workers window reasons")
+
+
+def _power_of_two_mb(mb):
+    """Largest power of two MB not above `mb`"""
+    return 1 << (max(1, int(mb)).bit_length() - 1)
+
+
+def plan_lock(input_size, file_count, cores, available_bytes):
     """
-    Automatically determine optimal encryption parameters based on folder size,
-    available RAM, and CPU cores.
-    
+    Choose the chunk size, workers and in-flight window of a lock
+
+    Chunks are sized so every worker gets at least CHUNKS_PER_WORKER of them,
+    within [MIN_CHUNK_MB, MAX_CHUNK_MB], and so the chunks in flight (each
+    held as plaintext and ciphertext) fit in MEMORY_FRACTION of the RAM;
+    workers are dropped only when even MIN_CHUNK_MB chunks would not fit.
+
     Args:
-        folder (str): Path to the folder to be encrypted.
-    
-    Returns:
-        dict: {'chunk_size': int (bytes), 'max_workers': int}
+        input_size: Plaintext bytes of the files
+        file_count: Number of files (each adds TAR overhead)
+        cores: Logical cores
+        available_bytes: Available memory
+
+    Returns: Plan
     """
-    data = load_config()
+    mb = 1024 * 1024
+    stream_size = input_size + file_count * TAR_OVERHEAD
+    budget = int(available_bytes * MEMORY_FRACTION)
+    workers = max(1, cores)
+    reasons = [
+        f"input {stream_size / mb:.1f} MB ({file_count} files), {workers} cores, "
+        f"memory budget {budget / mb:.0f} MB ({MEMORY_FRACTION:.0%} of {available_bytes / mb:.0f} MB available)"
+    ]
+
+    per_slot = WINDOW_PER_WORKER * 2 * MIN_CHUNK_MB * mb
+    if workers * per_slot > budget:
+        workers = max(1, budget // per_slot)
+        reasons.append(f"workers cut to {workers}: {MIN_CHUNK_MB} MB chunks for more would exceed the budget")
+    window = workers * WINDOW_PER_WORKER
+
+    fill_mb = stream_size / mb / (workers * CHUNKS_PER_WORKER)
+    memory_mb = budget / mb / (window * 2)
+    chunk_mb = min(fill_mb, memory_mb, MAX_CHUNK_MB)
+
+    if chunk_mb == fill_mb:
+        reasons.append(f"{CHUNKS_PER_WORKER} chunks per worker: at most {fill_mb:.1f} MB per chunk")
+    elif chunk_mb == memory_mb:
+        reasons.append(f"{window} chunks in flight within the budget: at most {memory_mb:.1f} MB per chunk")
+    else:
+        reasons.append(f"capped at {MAX_CHUNK_MB} MB per chunk")
 
-    if data["mode"] != "auto":
-        return {
-            "chunk_size": data.get("chunk_size", 8 * 1024 * 1024),
-            "max_workers": data.get("max_workers", 4)
-        }
+    chunk_mb = max(MIN_CHUNK_MB, _power_of_two_mb(chunk_mb))
+    chunks = max(1, -(-stream_size // (chunk_mb * mb)))
+    reasons.append(
+        f"chunk {chunk_mb} MB ({chunks} chunks), {workers} workers, window {window} "
+        f"(~{window * 2 * chunk_mb} MB in flight)"
+    )
 
-    size = get_folder_size(folder)
-    folder_gb = size['gb']
+    return Plan(chunk_mb * mb, workers, window, reasons)
 
-    details = get_system_details()
-    available_ram = details["available_gb"]
-    logical_cores = details["logical"]
 
-    min_chunk = 8
-    max_chunk = 512
-    chunk_size_mb = int(available_ram * 1024 / logical_cores / 2)
+def lock_plan(folder, manifest=None):
+    """
+    Plan the encryption of `folder` from its size, file count, the CPU cores
+    and the available RAM, or take the values of the manual config.
 
-    if chunk_size_mb < min_chunk:
-        chunk_size_mb = min_chunk
-    elif chunk_size_mb > max_chunk:
-        chunk_size_mb = max_chunk
+    Args:
+        folder (str): Path to the folder to be encrypted.
+        manifest (Manifest): Scan of the folder, saves walking it again.
 
-    chunk_size_bytes = chunk_size_mb * 1024 * 1024
+    Returns: Plan
+    """
+    data = load_config()
+
+    if data["mode"] != "auto":
+        manual = data.get("manual") or {}
+        chunk_size = manual.get("chunk_size", 8) * 1024 * 1024
+        max_workers = manual.get("max_workers", 4)
+        return Plan(chunk_size, max_workers, max_workers * WINDOW_PER_WORKER, [
+            f"manual config: chunk {chunk_size // (1024 * 1024)} MB, {max_workers} workers"
+        ])
+
+    if manifest is not None:
+        input_size, file_count = manifest.total_size, len(manifest)
+    else:
+        input_size, file_count = get_folder_size(folder)["bytes"], 0
+
+    details = get_system_details()
+    return plan_lock(
+        input_size, file_count, details["logical"], int(details["available_gb"] * 1024**3)
+    )
 
-    max_workers = min(logical_cores, int(available_ram / 2))
-    if max_workers < 2:
-        max_workers = 2
 
-    return (chunk_size_bytes,max_workers)
+def explain(plan):
+    """The reasons of a Plan, one per line"""
+    return "\n".join(plan.reasons)
 
 
 def unlock_auto_config():
     """
-    Automatically determine optimal decryption chunk size based on available RAM.
-    Decryption is mostly I/O bound, so no multi-threading adjustments are needed.
+    Automatically determine optimal decryption parameters based on available
+    RAM and CPU cores. Frames are independent, so they are decrypted on a
+    worker pool; up to two frames per worker are held in memory.
     
     Returns:
-        dict: {"chunk_size": int (bytes)}
+        tuple: (chunk_size in bytes, max_workers)
     """
     details = get_system_details()
     available_ram = details["available_gb"]
+    logical_cores = details["logical"]
 
 
     if available_ram < 8:
@@ -90,7 +155,8 @@ def unlock_auto_config():
 
     chunk_bytes = chunk_mb * 1024 * 1024
 
-    return chunk_bytes
-
-
+    max_workers = min(logical_cores, int(available_ram / 2))
+    if max_workers < 1:
+        max_workers = 1
 
+    return (chunk_bytes, max_workers)
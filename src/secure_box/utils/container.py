@@ -0,0 +1,499 @@
+"""
+Encrypted container format.
+
+v1 (legacy) is a bare run of frames:
+
+    [len u32][nonce 12][ciphertext + tag] ...
+
+v2 wraps the same frames with a header and an index footer:
+
+    header   magic "SBOX" | version u16 | cipher u8 | flags u8
+             | chunk_size u32 | header_size u32
+    slots    key slots (FLAG_KEY_SLOTS only), see below
+    frames   ... (first frame starts at header_size)
+    index    [frame offset u64][plaintext length u32] per chunk
+    trailer  index_offset u64 | chunk_count u64 | meta_offset u64
+             | meta_length u64 | "XOBS"
+
+With FLAG_CODECS set, every frame carries its codec and plaintext length,
+bound to the ciphertext as associated data:
+
+    [len u32][codec u8][plaintext length u32][nonce 12][ciphertext + tag]
+
+With FLAG_KEY_SLOTS set, the chunks are encrypted with a random data key
+and KEY_SLOT_COUNT fixed-size slots follow the header, each holding the data
+key wrapped by a password-derived key (see keys.py):
+
+    [used u8][salt 16][scrypt log2(n) u8][r u8][p u8][nonce 12][wrapped key 48]
+
+Without it the chunk key is the SHA-256 of the password.
+
+All integers are big-endian. meta_offset/meta_length point to an optional
+encrypted metadata frame (zlib-compressed JSON, authenticated with META_AAD)
+holding the TAR member table, and are 0 when there is none. A v1 file can never
+start with the magic: that would be a first frame of ~1.4 GB, larger than
+any chunk size Lock produces.
+"""
+from .compress import CODEC_NONE, compress_chunk, decompress_chunk
+from .buffers import write_buffers
+from .checksum import checksum_of
+from collections import namedtuple
+import bisect
+import struct
+import mmap
+import os
+
+
+MAGIC = b"SBOX"
+END_MAGIC = b"XOBS"
+VERSION = 2
+
+CIPHER_AES_256_GCM = 1
+
+FLAG_CODECS = 0x01
+FLAG_KEY_SLOTS = 0x02
+
+NONCE_SIZE = 12
+TAG_SIZE = 16
+FRAME_HEADER = 4 + NONCE_SIZE
+
+META_AAD = b"secure-box/meta"
+
+HEADER = struct.Struct(">4sHBBII")
+INDEX_ENTRY = struct.Struct(">QI")
+TRAILER = struct.Struct(">QQQQ4s")
+CODEC_INFO = struct.Struct(">BI")
+KEY_SLOT = struct.Struct(">B16sBBB12s48s")
+
+KEY_SLOT_COUNT = 8
+KEY_SLOTS_SIZE = KEY_SLOT_COUNT * KEY_SLOT.size
+
+CODEC_FRAME_HEADER = FRAME_HEADER + CODEC_INFO.size
+
+Frame = namedtuple("Frame", "nonce data codec aad")
+
+
+class ContainerError(ValueError):
+    """The file is not a valid (or complete) container"""
+
+
+def seal_parts(aes, data, codec=None):
+    """
+    Compress and encrypt one chunk into a frame, without joining it
+
+    Args:
+        aes: AESGCM instance
+        data: Plaintext chunk (any bytes-like object)
+        codec: Requested codec id, None for a container without FLAG_CODECS
+
+    Returns: (frame header, ciphertext + tag)
+    """
+    nonce = os.urandom(NONCE_SIZE)
+
+    if codec is None:
+        enc = aes.encrypt(nonce, data, None)
+        return len(enc).to_bytes(4, "big") + nonce, enc
+
+    used, payload = compress_chunk(codec, data)
+    info = CODEC_INFO.pack(used, len(data))
+    enc = aes.encrypt(nonce, payload, info)
+    return len(enc).to_bytes(4, "big") + info + nonce, enc
+
+
+def seal_chunk(aes, data, codec=None):
+    """Compress and encrypt one chunk into a complete frame (see seal_parts)"""
+    return b"".join(seal_parts(aes, data, codec))
+
+
+def parse_frame(buf):
+    """Split a complete codec frame (FLAG_CODECS layout) into a Frame"""
+    length = int.from_bytes(buf[:4], "big")
+    aad = bytes(buf[4:4 + CODEC_INFO.size])
+    nonce = bytes(buf[4 + CODEC_INFO.size:CODEC_FRAME_HEADER])
+    data = buf[CODEC_FRAME_HEADER:CODEC_FRAME_HEADER + length]
+
+    if len(data) != length:
+        raise ContainerError("Frame is truncated")
+    return Frame(nonce, data, aad[0], aad)
+
+
+def open_frame(aes, frame):
+    """Decrypt (and decompress) one Frame"""
+    data = aes.decrypt(frame.nonce, frame.data, frame.aad)
+    return decompress_chunk(frame.codec, data)
+
+
+def open_frame_into(aes, frame, buffer):
+    """
+    Decrypt (and decompress) one Frame, decrypting into `buffer` when this
+    cryptography release has decrypt_into and the payload fits
+
+    Returns: the plaintext; for a raw frame a view of `buffer`, valid until
+             the buffer is reused
+    """
+    size = len(frame.data) - TAG_SIZE
+    if not hasattr(aes, "decrypt_into") or size > len(buffer):
+        return open_frame(aes, frame)
+
+    view = memoryview(buffer)[:size]
+    aes.decrypt_into(frame.nonce, frame.data, frame.aad, view)
+    return decompress_chunk(frame.codec, view)
+
+
+class ContainerWriter:
+    """
+    Write frames into a v2 container and keep the chunk index.
+
+    Frames are appended with `write_frame`, which records where each one
+    starts and how much plaintext it holds. With a `hasher` (see checksum.py)
+    everything written is hashed on the way out, so the checksum of a fresh
+    container is ready without reading it back.
+    """
+    def __init__(self, fout, chunk_size, flags=0, entries=None, hasher=None):
+        self.fout = fout
+        self.chunk_size = chunk_size
+        self.flags = flags
+        self.entries = entries if entries is not None else []
+        self.hasher = hasher
+        self.last_tag = None
+
+    @classmethod
+    def resume(cls, path, fout, chunk_size):
+        """Continue a partially written container, rebuilding its index"""
+        with Container(path) as container:
+            if container.version != VERSION:
+                raise ContainerError("Partial output is not a v2 container")
+            entries = list(container.scan_frames())
+
+        return cls(fout, chunk_size, flags=container.flags, entries=entries)
+
+    def write_header(self, key_slots=b""):
+        """
+        Args:
+            key_slots: Key slot area (FLAG_KEY_SLOTS only)
+        """
+        header = HEADER.pack(
+            MAGIC, VERSION, CIPHER_AES_256_GCM, self.flags, self.chunk_size,
+            HEADER.size + len(key_slots)
+        )
+        self._write(header + key_slots)
+
+    def _write(self, data):
+        self.fout.write(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+
+    def write_frame(self, frame, plain_length):
+        """
+        Append one complete frame holding `plain_length` plaintext bytes
+
+        Args:
+            frame: The frame as one buffer, or a list/tuple of buffers
+                   (e.g. from seal_parts) written with one vectored write
+        """
+        self.entries.append((self.fout.tell(), plain_length))
+
+        if isinstance(frame, (list, tuple)):
+            write_buffers(self.fout, frame)
+            if self.hasher is not None:
+                for buffer in frame:
+                    self.hasher.update(buffer)
+            self.last_tag = bytes(frame[-1][-TAG_SIZE:])
+        else:
+            self._write(frame)
+            self.last_tag = bytes(frame[-TAG_SIZE:])
+
+    def finish(self, meta_frame=None):
+        """
+        Write the optional metadata frame, the index footer and the trailer
+
+        Args:
+            meta_frame: Encrypted metadata (one complete frame)
+        """
+        meta_offset = meta_length = 0
+        if meta_frame:
+            meta_offset = self.fout.tell()
+            meta_length = len(meta_frame)
+            self._write(meta_frame)
+
+        index_offset = self.fout.tell()
+
+        self._write(b"".join(INDEX_ENTRY.pack(offset, length) for offset, length in self.entries))
+        self._write(TRAILER.pack(
+            index_offset, len(self.entries), meta_offset, meta_length, END_MAGIC
+        ))
+
+    def checksum(self):
+        """Checksum of everything written, None without a hasher"""
+        return checksum_of(self.hasher) if self.hasher is not None else None
+
+    def tell(self):
+        return self.fout.tell()
+
+    def flush(self):
+        self.fout.flush()
+
+
+class Container:
+    """
+    Read access to a v1 or v2 container.
+
+    The file is memory-mapped: `read_frame` hands out memoryview slices of
+    the map, so ciphertext goes to AES-GCM without being copied.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = None
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.version = 1
+        self.chunk_size = None
+        self.flags = 0
+        self.frame_header = FRAME_HEADER
+        self.data_offset = 0
+        self.index_offset = None
+        self.meta_offset = 0
+        self.meta_length = 0
+        self._index = None
+        self._plain_offsets = None
+
+        head = self.file.read(HEADER.size)
+        if len(head) == HEADER.size and head[:4] == MAGIC:
+            magic, version, cipher, flags, chunk_size, header_size = HEADER.unpack(head)
+
+            if version != VERSION:
+                raise ContainerError(f"Unsupported container version {version}")
+            if cipher != CIPHER_AES_256_GCM:
+                raise ContainerError(f"Unsupported cipher id {cipher}")
+
+            self.version = version
+            self.flags = flags
+            self.chunk_size = chunk_size
+            self.data_offset = header_size
+
+            if flags & FLAG_CODECS:
+                self.frame_header = CODEC_FRAME_HEADER
+
+            if flags & FLAG_KEY_SLOTS and header_size < HEADER.size + KEY_SLOTS_SIZE:
+                raise ContainerError("Key slot area is truncated")
+
+    def read_key_slots(self):
+        """Return the raw key slot area, or None for a box without key slots"""
+        if not self.flags & FLAG_KEY_SLOTS:
+            return None
+
+        self.file.seek(HEADER.size)
+        return self.file.read(KEY_SLOTS_SIZE)
+
+    def close(self):
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass  # frames still in use keep the map alive until released
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_trailer(self):
+        """Return the trailer fields, or None if it is missing or inconsistent"""
+        if self.size < self.data_offset + TRAILER.size:
+            return None
+
+        self.file.seek(self.size - TRAILER.size)
+        index_offset, count, meta_offset, meta_length, end = TRAILER.unpack(
+            self.file.read(TRAILER.size)
+        )
+
+        if end != END_MAGIC:
+            return None
+        if index_offset < self.data_offset:
+            return None
+        if index_offset + count * INDEX_ENTRY.size + TRAILER.size != self.size:
+            return None
+
+        return index_offset, count, meta_offset, meta_length
+
+    def is_complete(self):
+        """
+        Check whether the file was completely written.
+
+        O(1) for v2 (trailer check); v1 has no footer, so every frame header
+        is walked.
+        """
+        if self.version == VERSION:
+            return self._read_trailer() is not None
+
+        try:
+            for _ in self.scan_frames():
+                pass
+        except ContainerError:
+            return False
+        return True
+
+    @property
+    def index(self):
+        """[(frame offset, plaintext length)] for every chunk"""
+        if self._index is None:
+            self._index = self._load_index()
+        return self._index
+
+    def _load_index(self):
+        if self.version != VERSION:
+            return list(self.scan_frames())
+
+        trailer = self._read_trailer()
+        if trailer is None:
+            raise ContainerError("Encrypted file is truncated (no index footer)")
+
+        self.index_offset, count, self.meta_offset, self.meta_length = trailer
+
+        self.file.seek(self.index_offset)
+        raw = self.file.read(count * INDEX_ENTRY.size)
+        return [entry for entry in INDEX_ENTRY.iter_unpack(raw)]
+
+    def plaintext_size(self):
+        return sum(length for _, length in self.index)
+
+    @property
+    def plain_offsets(self):
+        """Plaintext offset at which every chunk starts"""
+        if self._plain_offsets is None:
+            offsets = []
+            position = 0
+            for _, length in self.index:
+                offsets.append(position)
+                position += length
+            self._plain_offsets = offsets
+        return self._plain_offsets
+
+    def chunk_at(self, position):
+        """Index of the chunk holding plaintext byte `position`"""
+        return bisect.bisect_right(self.plain_offsets, position) - 1
+
+    def read_meta(self):
+        """Return (nonce, ciphertext) of the metadata frame, or None"""
+        self.index
+        if not self.meta_length:
+            return None
+
+        self.file.seek(self.meta_offset + 4)
+        nonce = self.file.read(NONCE_SIZE)
+        enc = self.file.read(self.meta_length - FRAME_HEADER)
+        return nonce, enc
+
+    def scan_frames(self):
+        """
+        Walk frame headers from the first frame.
+
+        Stops at EOF (v1, partial v2) or at the metadata / index footer
+        (complete v2).
+
+        Yields: (frame offset, plaintext length)
+        """
+        end = self.size
+        if self.version == VERSION:
+            trailer = self._read_trailer()
+            if trailer is not None:
+                index_offset, count, meta_offset, meta_length = trailer
+                end = meta_offset if meta_length else index_offset
+
+        # Headers are parsed straight from the map: no seek/read per frame
+        offset = self.data_offset
+        while offset < end:
+            head = self.map[offset:offset + self.frame_header]
+            length = int.from_bytes(head[:4], "big")
+
+            if len(head) != self.frame_header or offset + self.frame_header + length > end:
+                raise ContainerError("Encrypted file is truncated")
+
+            if self.frame_header == CODEC_FRAME_HEADER:
+                codec, plain_length = CODEC_INFO.unpack_from(head, 4)
+            else:
+                plain_length = length - TAG_SIZE
+
+            yield offset, plain_length
+            offset += self.frame_header + length
+
+    def view(self, start, end):
+        """Zero-copy view of the file bytes [start, end)"""
+        return memoryview(self.map)[start:end]
+
+    def frame_end(self, chunk_index):
+        """File offset just past the frame of one chunk"""
+        offset = self.index[chunk_index][0]
+        return offset + self.frame_header + int.from_bytes(self.map[offset:offset + 4], "big")
+
+    def read_frame(self, chunk_index):
+        """Return the Frame of one chunk, O(1) with the index"""
+        offset, plain_length = self.index[chunk_index]
+        end = self.frame_end(chunk_index) if offset + 4 <= self.size else self.size + 1
+
+        if end > self.size:
+            raise ContainerError("Encrypted file is truncated")
+
+        head = self.map[offset:offset + self.frame_header]
+        enc = self.view(offset + self.frame_header, end)
+
+        nonce = head[-NONCE_SIZE:]
+        if self.frame_header == CODEC_FRAME_HEADER:
+            aad = head[4:4 + CODEC_INFO.size]
+            return Frame(nonce, enc, aad[0], aad)
+
+        return Frame(nonce, enc, CODEC_NONE, None)
+
+
+class PlaintextReader:
+    """
+    Read-only file object over the decrypted plaintext of a container.
+
+    Only the chunks covering the bytes actually read are decrypted (by the
+    `decrypt(frame)` callable); the last decrypted chunk is cached so
+    neighbouring reads share it.
+    """
+    def __init__(self, container, decrypt):
+        self.container = container
+        self.decrypt = decrypt
+        self.position = 0
+        self.end = container.plaintext_size()
+        self._cached_index = None
+        self._cached = b""
+
+    def set_range(self, start, end):
+        """Restrict reading to plaintext [start, end)"""
+        self.position = start
+        self.end = end
+
+    def tell(self):
+        return self.position
+
+    def _chunk(self, chunk_index):
+        if chunk_index != self._cached_index:
+            self._cached = self.decrypt(self.container.read_frame(chunk_index))
+            self._cached_index = chunk_index
+        return self._cached
+
+    def read(self, size=-1):
+        end = self.end if size is None or size < 0 else min(self.end, self.position + size)
+        parts = []
+
+        while self.position < end:
+            chunk_index = self.container.chunk_at(self.position)
+            chunk = self._chunk(chunk_index)
+            start = self.position - self.container.plain_offsets[chunk_index]
+            piece = chunk[start:start + end - self.position]
+
+            if not piece:
+                raise ContainerError("Plaintext range is outside the container")
+
+            parts.append(piece)
+            self.position += len(piece)
+
+        return b"".join(parts)
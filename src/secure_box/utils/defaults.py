@@ -0,0 +1,14 @@
+"""
+Defaults shared by the CLI options and the modules they configure.
+
+Kept free of imports so the CLI can build its options without loading the
+modules (cryptography, watchdog, rich, ...) a command may never use.
+"""
+
+EXECUTORS = ("thread", "process", "auto")
+
+DEFAULT_COMPACT_THRESHOLD = 0.5
+
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_MAX_LAG = 30.0
+DEFAULT_MIN_INTERVAL = 10.0
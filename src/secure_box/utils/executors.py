@@ -0,0 +1,194 @@
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from contextlib import contextmanager
+from collections import deque
+from .container import seal_parts, CODEC_FRAME_HEADER, TAG_SIZE
+from .buffers import BufferPool
+from .defaults import EXECUTORS
+import multiprocessing
+import sys
+
+
+# Plaintext sits after room for the largest frame header in a slot
+SLOT_PLAIN_OFFSET = CODEC_FRAME_HEADER
+
+
+def gil_enabled():
+    """False only on a free-threaded (no-GIL) interpreter with the GIL off"""
+    check = getattr(sys, "_is_gil_enabled", None)
+    return True if check is None else check()
+
+
+def resolve_executor(name, max_workers):
+    """
+    Resolve an executor name to a concrete backend.
+
+    'auto' picks threads on free-threaded builds (no GIL to contend on) or
+    when there is a single worker, and processes otherwise.
+    """
+    if name not in EXECUTORS:
+        raise ValueError(f"Unknown executor '{name}', expected one of {EXECUTORS}")
+
+    if name == "auto":
+        if not gil_enabled() or max_workers < 2:
+            return "thread"
+        return "process"
+
+    return name
+
+
+class ThreadBackend:
+    """
+    Encrypt chunks on a thread pool.
+
+    Every in-flight chunk is read into a buffer from a fixed pool and
+    handed to the worker as a memoryview; the buffer goes back to the pool
+    once the chunk's frame is written.
+    """
+    name = "thread"
+
+    def __init__(self, encrypt_chunk, chunk_size, max_workers, window=None):
+        self.encrypt_chunk = encrypt_chunk
+        self.chunk_size = chunk_size
+        self.buffers = BufferPool(chunk_size, window or max_workers * 2)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, fin, chunk_index):
+        """
+        Read the next chunk from fin into a pooled buffer and queue it for
+        encryption
+
+        Returns: (handle, plaintext size) or None at EOF
+        """
+        buffer = self.buffers.acquire()
+        size = fin.readinto(buffer)
+
+        if not size:
+            self.buffers.release(buffer)
+            return None
+
+        chunk = memoryview(buffer)[:size]
+        future = self.executor.submit(self.encrypt_chunk, chunk, chunk_index)
+        return (future, buffer), size
+
+    @contextmanager
+    def frame(self, handle):
+        """
+        Wait for a chunk and yield its encrypted frame (a buffer or a list
+        of buffers), returning the chunk buffer to the pool afterwards
+        """
+        future, buffer = handle
+        try:
+            _, encrypted = future.result()
+            yield encrypted
+        finally:
+            self.buffers.release(buffer)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ProcessBackend:
+    """
+    Encrypt chunks on a process pool.
+
+    Every in-flight chunk owns a shared memory slot: the reader fills it with
+    plaintext, the worker compresses/encrypts it and stores the finished
+    frame at the start of the slot, and the writer copies the frame out.
+    Only the slot name and a length cross the process boundary, chunk data
+    is never pickled.
+    """
+    name = "process"
+
+    def __init__(self, key, codec, chunk_size, max_workers, window):
+        self.chunk_size = chunk_size
+        self.slots = [
+            shared_memory.SharedMemory(create=True, size=SLOT_PLAIN_OFFSET + chunk_size + TAG_SIZE)
+            for _ in range(window)
+        ]
+        self.free = deque(range(window))
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(key, codec),
+        )
+
+    def submit(self, fin, chunk_index):
+        """
+        Read the next chunk from fin straight into a free slot
+
+        Returns: (handle, plaintext size) or None at EOF
+        """
+        slot = self.free.popleft()
+
+        with self.slots[slot].buf[SLOT_PLAIN_OFFSET:SLOT_PLAIN_OFFSET + self.chunk_size] as view:
+            size = fin.readinto(view)
+
+        if not size:
+            self.free.appendleft(slot)
+            return None
+
+        future = self.executor.submit(_encrypt_slot, self.slots[slot].name, size)
+        return (future, slot), size
+
+    @contextmanager
+    def frame(self, handle):
+        """Wait for a chunk and yield its frame, freeing the slot afterwards"""
+        future, slot = handle
+        try:
+            length = future.result()
+            with self.slots[slot].buf[:length] as frame:
+                yield frame
+        finally:
+            self.free.append(slot)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+        for segment in self.slots:
+            segment.close()
+            segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_worker_aes = None
+_worker_codec = None
+_worker_segments = {}
+
+
+def _init_worker(key, codec):
+    global _worker_aes, _worker_codec
+    _worker_aes = AESGCM(key)
+    _worker_codec = codec
+
+
+def _encrypt_slot(name, size):
+    """Turn the plaintext in a shared memory slot into a frame, in place"""
+    segment = _worker_segments.get(name)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=name, track=False)
+        _worker_segments[name] = segment
+
+    buf = segment.buf
+
+    with buf[SLOT_PLAIN_OFFSET:SLOT_PLAIN_OFFSET + size] as plain:
+        header, enc = seal_parts(_worker_aes, plain, _worker_codec)
+
+    end = len(header) + len(enc)
+    buf[:len(header)] = header
+    buf[len(header):end] = enc
+    return end
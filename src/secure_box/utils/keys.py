@@ -0,0 +1,176 @@
+"""
+Envelope encryption for boxes.
+
+Chunks are encrypted with a random data key. Each key slot in the box header
+holds that key wrapped (AES-GCM) by a key derived from one password with
+scrypt, so a password is changed, added or removed by rewriting a single
+80-byte slot instead of re-encrypting the box.
+"""
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from cryptography.exceptions import InvalidTag
+from .backup import SafeBackupWriter
+from .container import Container, ContainerError, KEY_SLOT, KEY_SLOT_COUNT, KEY_SLOTS_SIZE, HEADER
+from .logger import auto_logger
+import os
+
+
+logger = auto_logger()
+
+DATA_KEY_SIZE = 32
+SALT_SIZE = 16
+
+SCRYPT_LOG2_N = 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+KEY_SLOT_AAD = b"secure-box/key-slot"
+
+EMPTY_SLOT = bytes(KEY_SLOT.size)
+
+
+def new_data_key():
+    return os.urandom(DATA_KEY_SIZE)
+
+
+def derive_kek(password, salt, log2_n=SCRYPT_LOG2_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Derive the key-encryption key of one slot from a password"""
+    kdf = Scrypt(salt=salt, length=DATA_KEY_SIZE, n=2 ** log2_n, r=r, p=p)
+    return kdf.derive(password.encode())
+
+
+class KeySlots:
+    """The fixed-size key slot area of a box header"""
+    def __init__(self, raw=None):
+        if raw is None:
+            raw = EMPTY_SLOT * KEY_SLOT_COUNT
+        if len(raw) != KEY_SLOT.size * KEY_SLOT_COUNT:
+            raise ContainerError("Key slot area is truncated")
+
+        self.slots = [
+            raw[i * KEY_SLOT.size:(i + 1) * KEY_SLOT.size] for i in range(KEY_SLOT_COUNT)
+        ]
+
+    @classmethod
+    def create(cls, password, data_key):
+        """Slot area with `data_key` wrapped by a single password"""
+        slots = cls()
+        slots.add(password, data_key)
+        return slots
+
+    def to_bytes(self):
+        return b"".join(self.slots)
+
+    def used(self):
+        """Indexes of the slots holding a wrapped key"""
+        return [i for i, slot in enumerate(self.slots) if slot[0]]
+
+    def add(self, password, data_key):
+        """
+        Wrap `data_key` with `password` into the first free slot
+
+        Returns: slot index
+        """
+        free = [i for i, slot in enumerate(self.slots) if not slot[0]]
+        if not free:
+            raise ContainerError(f"All {KEY_SLOT_COUNT} key slots are in use")
+
+        salt = os.urandom(SALT_SIZE)
+        nonce = os.urandom(12)
+        kek = derive_kek(password, salt)
+        wrapped = AESGCM(kek).encrypt(nonce, data_key, KEY_SLOT_AAD)
+
+        index = free[0]
+        self.slots[index] = KEY_SLOT.pack(1, salt, SCRYPT_LOG2_N, SCRYPT_R, SCRYPT_P, nonce, wrapped)
+        return index
+
+    def remove(self, index):
+        """Clear one slot, refusing to drop the last password"""
+        if self.used() == [index]:
+            raise ContainerError("Cannot remove the only password of a box")
+        self.slots[index] = EMPTY_SLOT
+
+    def unlock(self, password):
+        """
+        Unwrap the data key with `password`
+
+        Returns: (slot index, data key)
+        """
+        for index in self.used():
+            used, salt, log2_n, r, p, nonce, wrapped = KEY_SLOT.unpack(self.slots[index])
+            try:
+                kek = derive_kek(password, salt, log2_n, r, p)
+                return index, AESGCM(kek).decrypt(nonce, wrapped, KEY_SLOT_AAD)
+            except InvalidTag:
+                continue
+
+        raise ContainerError("Password is wrong")
+
+
+def _load_slots(path):
+    with Container(path) as container:
+        raw = container.read_key_slots()
+
+    if raw is None:
+        raise ContainerError("Box has no key slots, unlock and lock it again to manage passwords")
+    return KeySlots(raw)
+
+
+def _store_slots(path, slots):
+    """
+    Rewrite the slot area in place, then refresh the checksum sidecar (only
+    the leaf holding the slots for a sha256-tree sidecar)
+    """
+    with open(path, "r+b") as f:
+        f.seek(HEADER.size)
+        f.write(slots.to_bytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    safe = SafeBackupWriter(path)
+    if os.path.exists(safe.hash_path):
+        safe.refresh_checksum(HEADER.size, HEADER.size + KEY_SLOTS_SIZE)
+
+
+def add_password(path, password, new_password):
+    """Give `new_password` access to the box unlocked by `password`"""
+    slots = _load_slots(path)
+    _, data_key = slots.unlock(password)
+
+    index = slots.add(new_password, data_key)
+    _store_slots(path, slots)
+    logger.info(f"Password added to {path} (slot {index})")
+    return index
+
+
+def remove_password(path, password):
+    """Revoke `password`, as long as another password remains"""
+    slots = _load_slots(path)
+    index, _ = slots.unlock(password)
+
+    slots.remove(index)
+    _store_slots(path, slots)
+    logger.info(f"Password removed from {path} (slot {index})")
+    return index
+
+
+def change_password(path, password, new_password):
+    """
+    Replace `password` with `new_password`.
+
+    The new password goes into a free slot when there is one and both slots
+    change in the same write of the slot area, which lies within the first
+    block of the box.
+    """
+    slots = _load_slots(path)
+    index, data_key = slots.unlock(password)
+
+    if len(slots.used()) < KEY_SLOT_COUNT:
+        slots.add(new_password, data_key)
+        slots.slots[index] = EMPTY_SLOT
+    else:
+        slots.slots[index] = EMPTY_SLOT
+        slots.add(new_password, data_key)
+
+    _store_slots(path, slots)
+    logger.info(f"Password of {path} changed")
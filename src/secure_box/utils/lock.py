@@ -1,49 +1,120 @@
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
 from .tools import ASCIIBar
 from .backup import SafeBackupWriter
-from .logger import auto_logger
-from .config import lock_auto_config
+from .journal import CheckpointJournal
+from .checksum import DEFAULT_SCHEME, new_hasher, hash_file
+from .metrics import Metrics
+from .logger import auto_logger, RateLimiter
+from .config import lock_plan
+from .pipe import BoundedPipe
+from .archive import (
+    estimate_tar_size, add_member, read_tar_members, write_tar_stream, start_producer, TAR_BUFSIZE,
+)
+from .scanner import scan_folder
+from .statcache import StatCache, cache_path, cache_row
+from .executors import ThreadBackend, ProcessBackend, resolve_executor
+from .container import (
+    Container, ContainerWriter, ContainerError, seal_parts, META_AAD, FLAG_CODECS, FLAG_KEY_SLOTS,
+    FRAME_HEADER, CODEC_FRAME_HEADER,
+)
+from .keys import KeySlots, new_data_key
+from .compress import CODEC_NONE, get_codec
 from rich.progress import Progress, TextColumn, TimeElapsedColumn
 import datetime
 import hashlib
 import tarfile
+import json
+import zlib
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
+from contextlib import contextmanager
 
 
 logger = auto_logger()
 
 
 class Lock:
-    def __init__(self, password, folder, name="data"):  
+    def __init__(self, password, folder, name="data", executor="thread", compression="none",
+                 checksum=DEFAULT_SCHEME):  
         self.password = password
         self.folder = folder
         self.output = name + ".bin"
         self.tar_path = name + ".tar"
 
-        chunk,worker = lock_auto_config(folder=folder)
+        self.metrics = Metrics("lock", self.output)
         
-        self.chunk_size = chunk
-        self.max_workers = worker
+        # One scan of the folder serves the plan, archiving and progress
+        with self.metrics.stage("scan") as stage:
+            self.manifest = scan_folder(folder)
+            stage.bytes = self.manifest.total_size
+        self.plan = lock_plan(folder=folder, manifest=self.manifest)
         
-        self.key = self.password_to_key(password)
+        self.chunk_size = self.plan.chunk_size
+        self.max_workers = self.plan.max_workers
+        self.window = self.plan.window
+        self.executor = executor
+        self.members = None
+        self.dead = []
+        self.digests = {}
+        self.codec = None if compression == "none" else get_codec(compression)
+        self.checksum_scheme = checksum
+        
+        # Random data key; the password only wraps it into a header key slot
+        self.key = new_data_key()
+        self.key_slots = None
+        self._journal = None
     
     def password_to_key(self, pw):
-        """Convert the password to an AES key"""
+        """Convert the password to an AES key (chunk key of boxes without key slots)"""
         return hashlib.sha256(pw.encode()).digest()
     
+    def load_key(self, container, legacy_key=None):
+        """
+        Use the chunk key of an existing box
+        
+        Boxes with key slots: the data key unwrapped with the password, and
+        the slots are kept so the box can be written again with the same
+        passwords. Older boxes: `legacy_key` or the password hash.
+        
+        Returns: the key, also stored in self.key
+        """
+        raw = container.read_key_slots()
+        
+        if raw is None:
+            self.key = legacy_key or self.password_to_key(self.password)
+            self.key_slots = None
+        elif raw != self.key_slots:
+            _, self.key = KeySlots(raw).unlock(self.password)
+            self.key_slots = raw
+        
+        return self.key
+    
+    def scan(self, folder):
+        """Manifest of `folder`, reusing the scan taken for self.folder"""
+        if self.manifest is not None and folder == self.folder:
+            return self.manifest
+        return scan_folder(folder)
+    
+    def write_stat_cache(self):
+        """
+        Record the stat data and content hash of every archived file in the
+        box's stat cache sidecar
+        """
+        rows = []
+        for entry in self.scan(self.folder):
+            name = entry.arcname.replace(os.sep, "/")
+            rows.append(cache_row(entry, name, self.digests.get(name)))
+        
+        StatCache.write(cache_path(self.output), rows)
+    
     def get_folder_size(self, folder):
         """Calculate folder size"""
-        total = 0
-        for root, dirs, files in os.walk(folder):
-            for file in files:
-                total += os.path.getsize(os.path.join(root, file))
-        return total
+        return self.scan(folder).total_size
     
     def create_tar_stream(self, folder, path):
         """Convert the folder to a TAR archive"""
-        total_size = self.get_folder_size(folder)
+        manifest = self.scan(folder)
+        total_size = manifest.total_size
         
         with Progress(
             TextColumn("📦 Archive is being created "),
@@ -53,28 +124,84 @@ class Lock:
         ) as progress:
             task = progress.add_task("tar", total=total_size)
             
-            with tarfile.open(path, "w") as tar:
-                for root, dirs, files in os.walk(folder):
-                    for file in files:
-                        full_path = os.path.join(root, file)
-                        arcname = os.path.relpath(full_path, folder)
-                        file_size = os.path.getsize(full_path)
-                        
-                        tar.add(full_path, arcname=arcname)
-                        progress.update(task, advance=file_size)
+            self.members = []
+            self.dead = []
+            self.digests = {}
+            
+            with self.metrics.stage("tar", total_size), tarfile.open(path, "w") as tar:
+                for entry in manifest:
+                    self.members.append(add_member(tar, entry.path, entry.arcname, digests=self.digests))
+                    progress.update(task, advance=entry.size)
     
-    def _encrypt_chunk(self, chunk_data, chunk_index):
+    def encrypt_meta(self):
         """
-        Encrypt a single chunk (thread-safe)
+        Encrypt the box metadata (TAR member table) into a frame
         
-        Returns: (chunk_index, encrypted_data)
+        Returns: frame bytes, or None when no member table is known
         """
-        aes = AESGCM(self.key)
+        if self.members is None:
+            return None
+        
+        meta = {"members": self.members}
+        if self.dead:
+            meta["dead"] = self.dead
+        if self.codec is not None:
+            meta["codec"] = self.codec
+        data = zlib.compress(json.dumps(meta, separators=(",", ":")).encode())
+        
         nonce = os.urandom(12)
-        enc = aes.encrypt(nonce, chunk_data, None)
+        enc = AESGCM(self.key).encrypt(nonce, data, META_AAD)
+        return len(enc).to_bytes(4, 'big') + nonce + enc
+    
+    def decrypt_meta(self, container):
+        """
+        Decrypt the metadata of a v2 box
         
-
-        result = len(enc).to_bytes(4, 'big') + nonce + enc
+        Returns: {"members": [...], "dead": [...], "codec": id or absent}
+                 (dead entries belong to removed or superseded files), or
+                 None without metadata
+        """
+        meta = container.read_meta()
+        if meta is None:
+            return None
+        
+        self.load_key(container)
+        nonce, enc = meta
+        try:
+            data = AESGCM(self.key).decrypt(nonce, enc, META_AAD)
+        except InvalidTag:
+            raise ContainerError("Password is wrong or the box is corrupted")
+        
+        meta = json.loads(zlib.decompress(data))
+        meta.setdefault("dead", [])
+        return meta
+    
+    def box_codec(self, container, meta=None):
+        """
+        Codec an existing box was locked with: the one its member table
+        names, else the first compressed frame's (chunks that did not shrink
+        are stored raw), None for boxes without codecs
+        """
+        if meta is not None and meta.get("codec") is not None:
+            return meta["codec"]
+        if not container.flags & FLAG_CODECS:
+            return None
+        
+        for chunk_index in range(len(container.index)):
+            codec = container.read_frame(chunk_index).codec
+            if codec != CODEC_NONE:
+                return codec
+        return None
+    
+    def _encrypt_chunk(self, chunk_data, chunk_index):
+        """
+        Compress (if enabled) and encrypt a single chunk (thread-safe)
+        
+        Returns: (chunk_index, [frame header, ciphertext]) for a vectored write
+        """
+        with self.metrics.stage("encrypt", len(chunk_data)):
+            aes = AESGCM(self.key)
+            result = seal_parts(aes, chunk_data, self.codec)
         
         return (chunk_index, result)
     
@@ -89,7 +216,135 @@ class Lock:
         """
         total_size = os.path.getsize(path)
         
-
+        with open(path, 'rb') as fin:
+            return self._encrypt_parallel(fin, outpath, total_size, checkpoint, seekable=True)
+    
+    def encrypt_folder_stream(self, outpath, checkpoint=None):
+        """
+        Encrypt the folder without an intermediate TAR file.
+        
+        tarfile writes into a bounded in-memory pipe on a background thread
+        and the encryptor consumes it chunk by chunk, so plaintext never
+        touches the disk. On resume the (deterministic) TAR stream is
+        regenerated and the already encrypted prefix is skipped.
+        
+        Args:
+            outpath: Output file
+            checkpoint: Resume checkpoint
+        """
+        manifest = self.scan(self.folder)
+        total_size = estimate_tar_size(manifest)
+        pipe = BoundedPipe(capacity=max(2 * self.chunk_size, TAR_BUFSIZE))
+        self.members = []
+        self.dead = []
+        self.digests = {}
+        
+        def produce(fileobj):
+            with self.metrics.stage("tar", manifest.total_size):
+                write_tar_stream(manifest, fileobj, self.members, digests=self.digests)
+        
+        producer = start_producer(produce, pipe)
+        
+        try:
+            return self._encrypt_parallel(pipe, outpath, total_size, checkpoint, seekable=False)
+        finally:
+            pipe.close_reader()
+            producer.join()
+    
+    def _skip_input(self, fin, count):
+        """Discard `count` bytes from a non-seekable input"""
+        remaining = count
+        while remaining > 0:
+            skipped = len(fin.read(min(remaining, TAR_BUFSIZE)))
+            if skipped == 0:
+                raise ValueError("Input is shorter than the checkpoint, cannot resume")
+            remaining -= skipped
+    
+    def _checkpoint(self, fout, bytes_written, chunk_index):
+        """
+        Journal the frame just written as a resume point.
+        
+        Chunks are written strictly in order, so `chunk_index` (the number of
+        chunks written) always marks the highest contiguous chunk on disk.
+        The journal batches its fsyncs.
+        """
+        offset, plain_length = fout.entries[-1]
+        self._journal.record(
+            fout.fout, chunk_index - 1, offset, fout.tell(), bytes_written, plain_length, fout.last_tag
+        )
+    
+    @contextmanager
+    def open_container(self, outpath, checkpoint=None):
+        """
+        Open `outpath` as a v2 container for writing.
+        
+        A fresh output gets a header with the key slots; when resuming, the
+        data key is unwrapped from the partial output's slots, the index of
+        the frames already in it comes from the checkpoint journal (or is
+        rebuilt from the frames) and writing continues after them. Every
+        frame is recorded in the `<outpath>.journal` checkpoint journal.
+        """
+        flags = FLAG_KEY_SLOTS | (FLAG_CODECS if self.codec is not None else 0)
+        journal_path = outpath + ".journal"
+        
+        if checkpoint:
+            with Container(outpath) as partial:
+                if partial.flags != flags:
+                    raise ContainerError("Partial output was written with other settings")
+                self.load_key(partial)
+            
+            with open(outpath, 'ab') as fout:
+                if "entries" in checkpoint:
+                    writer = ContainerWriter(fout, self.chunk_size, flags, list(checkpoint["entries"]))
+                    self._journal = CheckpointJournal.reopen(journal_path)
+                else:
+                    writer = ContainerWriter.resume(outpath, fout, self.chunk_size)
+                    frame_header = CODEC_FRAME_HEADER if flags & FLAG_CODECS else FRAME_HEADER
+                    self._journal = CheckpointJournal.from_frames(
+                        journal_path, outpath, writer.entries, frame_header
+                    )
+                
+                with self._close_journal(fout):
+                    yield writer
+        else:
+            if self.key_slots is None:
+                with self.metrics.stage("key_slots"):
+                    self.key_slots = KeySlots.create(self.password, self.key).to_bytes()
+            
+            with open(outpath, 'wb') as fout:
+                writer = ContainerWriter(
+                    fout, self.chunk_size, flags=flags, hasher=new_hasher(self.checksum_scheme)
+                )
+                writer.write_header(self.key_slots)
+                self._journal = CheckpointJournal.create(journal_path)
+                
+                with self._close_journal(fout):
+                    yield writer
+    
+    @contextmanager
+    def _close_journal(self, fout):
+        try:
+            yield
+        finally:
+            self._journal.close(fout)
+            self._journal = None
+    
+    def create_backend(self, window):
+        """Create the encryption backend selected by `self.executor`"""
+        kind = resolve_executor(self.executor, self.max_workers)
+        
+        if kind == "process":
+            return ProcessBackend(self.key, self.codec, self.chunk_size, self.max_workers, window)
+        return ThreadBackend(self._encrypt_chunk, self.chunk_size, self.max_workers, window)
+    
+    def _encrypt_parallel(self, fin, outpath, total_size, checkpoint, seekable):
+        """
+        Encrypt an open input stream into `outpath` using a worker pool
+        
+        Returns: Checksum of the output, hashed while writing (afterwards
+                 when resumed); None when appending through a writer
+                 without a hasher
+        """
         start_position = 0
         start_chunk_index = 0
         
@@ -98,8 +353,11 @@ class Lock:
             start_chunk_index = checkpoint.get('chunk_index', 0)
             logger.info(f"Resuming from byte {start_position}, chunk {start_chunk_index}")
         
+        kind = resolve_executor(self.executor, self.max_workers)
+        label = "multi-threaded" if kind == "thread" else "multi-process"
+        
         with Progress(
-            TextColumn("🔒 Encrypting (multi-threaded) "),
+            TextColumn(f"🔒 Encrypting ({label}) "),
             ASCIIBar(),
             TextColumn(" {task.percentage:>5.1f}%"),
             TimeElapsedColumn(),
@@ -109,64 +367,86 @@ class Lock:
             if start_position > 0:
                 progress.update(task, completed=start_position)
             
-            mode = 'ab' if checkpoint else 'wb'
-            
-            with open(path, 'rb') as fin, open(outpath, mode) as fout:
+            with self.open_container(outpath, checkpoint) as fout:
                 if start_position > 0:
-                    fin.seek(start_position)
+                    if seekable:
+                        fin.seek(start_position)
+                    else:
+                        self._skip_input(fin, start_position)
                 
                 bytes_written = start_position
                 chunk_index = start_chunk_index
-                write_lock = threading.Lock()
+                next_to_write = start_chunk_index
                 
+                # Reorder window: chunk index -> (handle, plaintext size).
+                # At most `window` chunks are in flight; the reader stops
+                # until the oldest one has been written, which keeps memory
+                # flat and the output strictly in chunk order.
+                window = max(self.window or 0, self.max_workers * 2)
+                in_flight = {}
+                eof = False
 
-                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                    futures = {}
-                    chunks_to_process = []
-                    
-                    while True:
-                        chunk_data = fin.read(self.chunk_size)
-                        if not chunk_data:
+                metrics = self.metrics
+                pipe = fin if isinstance(fin, BoundedPipe) else None
+                progress_log = RateLimiter(delay_first=True)
+                
+                with metrics.stage("pipeline"), self.create_backend(window) as backend:
+                    while in_flight or not eof:
+                        while not eof and len(in_flight) < window:
+                            with metrics.stage("read") as stage:
+                                submitted = backend.submit(fin, chunk_index)
+                                if submitted is not None:
+                                    stage.bytes = submitted[1]
+                            if submitted is None:
+                                eof = True
+                                break
+                            
+                            in_flight[chunk_index] = submitted
+                            chunk_index += 1
+                        
+                        if not in_flight:
                             break
                         
-
-                        future = executor.submit(
-                            self._encrypt_chunk, 
-                            chunk_data, 
-                            chunk_index
-                        )
-                        futures[future] = chunk_index
-                        chunks_to_process.append((chunk_index, len(chunk_data)))
-                        chunk_index += 1
+                        metrics.sample_queue("chunks_in_flight", len(in_flight))
+                        if pipe is not None:
+                            metrics.sample_queue("tar_pipe_bytes", pipe.buffered)
                         
-                        if len(futures) >= self.max_workers * 2:
-                            self._write_completed_chunks(
-                                futures, fout, progress, task, 
-                                write_lock, bytes_written, chunk_index
-                            )
-                    
-                    for future in as_completed(futures):
-                        idx, encrypted = future.result()
+                        handle, original_size = in_flight.pop(next_to_write)
+                        next_to_write += 1
+                        bytes_written += original_size
                         
-                        with write_lock:
-                            fout.write(encrypted)
-                            
-                            original_size = next(
-                                size for i, size in chunks_to_process if i == idx
-                            )
-                            bytes_written += original_size
-                            progress.update(task, advance=original_size)
-                            
-
-                            if idx % 10 == 0:
-                                safe = SafeBackupWriter(self.output)
-                                safe.write_checkpoint(bytes_written, idx)
+                        with backend.frame(handle) as frame:
+                            with metrics.stage("write", original_size):
+                                fout.write_frame(frame, original_size)
+                                self._checkpoint(fout, bytes_written, next_to_write)
+                        
+                        progress.update(task, advance=original_size)
+                        if progress_log.ready():
+                            logger.info(f"Encrypted {bytes_written / 1024**2:.0f} of ~{total_size / 1024**2:.0f} MB")
+                
+                fout.finish(self.encrypt_meta())
+                checksum = fout.checksum()
+        
+        if checksum is None and checkpoint:
+            # Resumed: the prefix written by the interrupted run was never hashed
+            with self.metrics.stage("checksum", os.path.getsize(outpath)):
+                checksum = hash_file(outpath, self.checksum_scheme)
+        return checksum
     
-    def encrypt_stream(self, path, outpath, key, checkpoint=None):
+    def encrypt_stream(self, path, outpath, key=None, checkpoint=None):
         """
         Single-threaded encryption (fallback)
+        
+        Args:
+            key: Chunk key, defaults to the data key. Ignored when resuming,
+                 the partial output's key slots decide.
+        
+        Returns: Checksum of the output (see _encrypt_parallel)
         """
-        aes = AESGCM(key)
+        if key is not None and key != self.key and not checkpoint:
+            # The key slots must wrap the key the chunks are encrypted with
+            self.key, self.key_slots = key, None
+        
         total_size = os.path.getsize(path)
         
         start_position = 0
@@ -178,6 +458,7 @@ class Lock:
             logger.info(f"Resuming from byte {start_position}, chunk {chunk_index}")
         
         buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
         
         with Progress(
             TextColumn("🔒 Encrypting "),
@@ -190,9 +471,9 @@ class Lock:
             if start_position > 0:
                 progress.update(task, completed=start_position)
             
-            mode = 'ab' if checkpoint else 'wb'
-            
-            with open(path, 'rb') as fin, open(outpath, mode) as fout:
+            with open(path, 'rb') as fin, self.open_container(outpath, checkpoint) as fout:
+                aes = AESGCM(self.key)
+                
                 if start_position > 0:
                     fin.seek(start_position)
                 
@@ -203,50 +484,87 @@ class Lock:
                     if bytes_read == 0:
                         break
                     
-                    nonce = os.urandom(12)
-                    enc = aes.encrypt(nonce, buffer[:bytes_read], None)
-                    
-                    fout.write(len(enc).to_bytes(4, 'big'))
-                    fout.write(nonce)
-                    fout.write(enc)
+                    frame = seal_parts(aes, view[:bytes_read], self.codec)
+                    fout.write_frame(frame, bytes_read)
                     
                     bytes_written += bytes_read
                     chunk_index += 1
                     
                     progress.update(task, advance=bytes_read)
-                    
-                    if chunk_index % 10 == 0:
-                        safe = SafeBackupWriter(self.output)
-                        safe.write_checkpoint(bytes_written, chunk_index)
+                    self._checkpoint(fout, bytes_written, chunk_index)
+                
+                fout.finish(self.encrypt_meta())
+                return fout.checksum()
     
-    def run(self, resume=False, use_threading=True):
+    def run(self, resume=False, use_threading=True, stream=False):
         """
-        Run lock process
+        Run lock process, recording its metrics in self.metrics
         
         Args:
             resume: Resume from checkpoint
             use_threading: Use multi-threaded encryption
+            stream: Pipe the TAR stream straight into the encryptor
+                    (no temporary .tar, always multi-threaded)
         """
+        self.metrics.info.update({
+            "workers": self.max_workers if use_threading or stream else 1,
+            "chunk_size": self.chunk_size,
+            "executor": self.executor,
+            "input_bytes": self.manifest.total_size,
+            "files": len(self.manifest),
+        })
+        self.metrics.start()
+        try:
+            return self._run(resume, use_threading, stream)
+        finally:
+            self.metrics.stop()
+    
+    def _run(self, resume, use_threading, stream):
+        if stream:
+            return self.run_stream(resume=resume)
+        
         logger.info("[+] Folder is being packed...")
         
+        # An existing TAR is the input the interrupted run was encrypting,
+        # whatever happened to the folder since; a fresh one is checked
+        fingerprint = None
         if not resume or not os.path.exists(self.tar_path):
             self.create_tar_stream(self.folder, self.tar_path)
+            fingerprint = self.manifest.fingerprint()
         else:
             logger.info("[+] Using existing TAR file for resume")
+            self.members = read_tar_members(self.tar_path)
 
         logger.info(f"[+] Encrypting (safe, threads={self.max_workers if use_threading else 1})...")
 
-        safe = SafeBackupWriter(self.output)
+        safe = SafeBackupWriter(self.output, self.checksum_scheme)
 
         def encrypt_to_tmp(tmp_path, checkpoint):
             if use_threading:
-                self.encrypt_stream_parallel(self.tar_path, tmp_path, checkpoint)
-            else:
-                self.encrypt_stream(self.tar_path, tmp_path, self.key, checkpoint)
+                return self.encrypt_stream_parallel(self.tar_path, tmp_path, checkpoint)
+            return self.encrypt_stream(self.tar_path, tmp_path, checkpoint=checkpoint)
 
-        safe.write_backup(encrypt_to_tmp, resume=resume)
+        safe.write_backup(encrypt_to_tmp, resume=resume, fingerprint=fingerprint)
+        if fingerprint is not None:
+            self.write_stat_cache()
+        elif os.path.exists(cache_path(self.output)):
+            # The box holds the TAR's content, which the folder may no longer
+            # match; without a cache the next update diffs the member table
+            os.remove(cache_path(self.output))
 
         if os.path.exists(self.tar_path):
             os.remove(self.tar_path)
 
-        logger.info("[✓] Safe backup created:", self.output)
\ No newline at end of file
+        logger.info("[✓] Safe backup created:", self.output)
+    
+    def run_stream(self, resume=False):
+        """Run lock process without writing a temporary TAR file"""
+        logger.info(f"[+] Packing and encrypting (stream, threads={self.max_workers})...")
+        
+        safe = SafeBackupWriter(self.output, self.checksum_scheme)
+        safe.write_backup(
+            self.encrypt_folder_stream, resume=resume, fingerprint=self.manifest.fingerprint()
+        )
+        self.write_stat_cache()
+        
+        logger.info(f"[✓] Safe backup created: {self.output}")
@@ -1,14 +1,22 @@
 # logs.py
 from loguru import logger
+import threading
+import time
+import sys
 import os
-import inspect
-
-
-LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
 
 
+# Per-user log directory (not the working directory), overridable for
+# services and tests
+LOG_DIR = os.environ.get("SECURE_BOX_LOG_DIR") or os.path.join(
+    os.path.expanduser("~"), ".secure_box", "logs"
+)
+# "text" or "json" (one JSON object per line)
+LOG_FORMAT = os.environ.get("SECURE_BOX_LOG_FORMAT", "text")
+LOG_INTERVAL = 10.0
 
+_sinks = {}   # log file -> loguru handler id
+_sinks_lock = threading.Lock()
 
 
 def auto_logger():
@@ -16,32 +24,64 @@ def auto_logger():
     Automatically creates a separate log file for the module from which
     this function is called.
 
+    Records are written by a background thread (enqueue), so logging never
+    waits for the disk.
+
     Example:
         module1.py  -> logs/module1.log
         main.py     -> logs/main.log
     """
+    caller = sys._getframe(1)
+    filename = os.path.splitext(os.path.basename(caller.f_code.co_filename))[0]
+    module = caller.f_globals.get("__name__")
+    log_file = os.path.join(LOG_DIR, f"{filename}.log")
 
-
-    frame = inspect.stack()[1]
-    file_path = frame.filename
-
-
-    filename = os.path.splitext(os.path.basename(file_path))[0]
-
-    log_file = f"{LOG_DIR}/{filename}.log"
-
-
-    for handler in logger._core.handlers.values():
-        if hasattr(handler._sink, "name") and handler._sink.name == log_file:
+    with _sinks_lock:
+        if log_file in _sinks:
             return logger
 
-    logger.add(
-        log_file,
-        rotation="5 MB",
-        level="INFO",
-        format="{time} | {level} | {name} | {file}:{line} | {message}",
-        encoding="utf-8",
-        mode="w"
-    )
+        os.makedirs(LOG_DIR, exist_ok=True)
+        _sinks[log_file] = logger.add(
+            log_file,
+            rotation="5 MB",
+            level="INFO",
+            format="{time} | {level} | {name} | {file}:{line} | {message}",
+            serialize=LOG_FORMAT == "json",
+            filter=lambda record: record["name"] == module,
+            enqueue=True,
+            encoding="utf-8",
+        )
 
     return logger
+
+
+class RateLimiter:
+    """
+    Let a log message through at most once per `interval` seconds per key,
+    for logging inside per-chunk or per-event loops
+    """
+    def __init__(self, interval=LOG_INTERVAL, clock=time.monotonic, delay_first=False):
+        """
+        Args:
+            delay_first: Hold the first message back for `interval` too
+                         (periodic progress, not a message per run)
+        """
+        self.interval = interval
+        self.clock = clock
+        self._last = {None: clock()} if delay_first else {}
+        self._suppressed = {}
+
+    def ready(self, key=None):
+        """True when a message for `key` may be logged now"""
+        now = self.clock()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+
+        self._last[key] = now
+        return True
+
+    def suppressed(self, key=None):
+        """Messages held back since the last one let through (and reset)"""
+        return self._suppressed.pop(key, 0)
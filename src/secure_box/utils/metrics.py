@@ -0,0 +1,198 @@
+"""
+Per-stage performance metrics of a run.
+
+Stages are timed where they run (the TAR producer, the encryption workers,
+the writer), so each gets its own wall time and the CPU time of the threads
+that ran it:
+
+    scan      listing the folder
+    key_slots deriving the password key of the header slot (scrypt)
+    tar       building the TAR stream (includes waiting for a full pipe)
+    read      filling chunk buffers from the TAR stream or file
+    encrypt   compressing and sealing chunks, summed over the workers
+    write     writing frames (with the inline checksum) and journaling them
+    checksum  hashing the finished box when it could not be hashed inline
+    pipeline  the whole read / encrypt / write loop
+
+Queue depths (chunks in flight, bytes buffered in the TAR pipe) are sampled
+once per chunk and the peak RSS by a background thread.
+"""
+import threading
+import psutil
+import json
+import time
+import os
+
+
+RSS_INTERVAL = 0.05
+PROMETHEUS_PREFIX = "secure_box"
+
+
+class StageTimer:
+    """One timed run of a stage (see Metrics.stage)"""
+    def __init__(self, metrics, name, nbytes=0):
+        self.metrics = metrics
+        self.name = name
+        self.bytes = nbytes
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add(
+            self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu, self.bytes
+        )
+
+
+class Metrics:
+    def __init__(self, command="lock", box=None):
+        self.command = command
+        self.box = box
+        self.stages = {}
+        self.queues = {}
+        self.info = {}
+        self.peak_rss = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self._lock = threading.Lock()
+        self._stop = None
+        self._sampler = None
+
+    def add(self, name, wall, cpu, nbytes=0):
+        """Account one run of a stage (thread-safe)"""
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"wall_s": 0.0, "cpu_s": 0.0, "bytes": 0, "calls": 0}
+            stage["wall_s"] += wall
+            stage["cpu_s"] += cpu
+            stage["bytes"] += nbytes
+            stage["calls"] += 1
+
+    def stage(self, name, nbytes=0):
+        """
+        Time a block as one run of a stage, on the calling thread; bytes
+        only known inside the block can be set on the returned timer
+        """
+        return StageTimer(self, name, nbytes)
+
+    def sample_queue(self, name, depth):
+        """Record one observation of a queue depth"""
+        with self._lock:
+            queue = self.queues.get(name)
+            if queue is None:
+                queue = self.queues[name] = {"max": 0, "total": 0, "samples": 0}
+            queue["max"] = max(queue["max"], depth)
+            queue["total"] += depth
+            queue["samples"] += 1
+
+    def _sample_rss(self, process):
+        while not self._stop.wait(RSS_INTERVAL):
+            self.peak_rss = max(self.peak_rss, process.memory_info().rss)
+
+    def start(self):
+        """Start the run clock and the RSS sampler"""
+        process = psutil.Process()
+        self.peak_rss = process.memory_info().rss
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample_rss, args=(process,), name="secure-box-rss", daemon=True
+        )
+        self._sampler.start()
+        self._started = (time.perf_counter(), time.process_time())
+
+    def stop(self):
+        """Stop the run clock and the sampler"""
+        if self._sampler is None:
+            return
+        started_wall, started_cpu = self._started
+        self.wall = time.perf_counter() - started_wall
+        self.cpu = time.process_time() - started_cpu
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        self.peak_rss = max(self.peak_rss, psutil.Process().memory_info().rss)
+
+    def worker_utilisation(self):
+        """Share of the workers' time spent encrypting during the pipeline"""
+        encrypt = self.stages.get("encrypt")
+        pipeline = self.stages.get("pipeline")
+        workers = self.info.get("workers")
+        if not encrypt or not pipeline or not workers or not pipeline["wall_s"]:
+            return None
+        return min(1.0, encrypt["wall_s"] / (workers * pipeline["wall_s"]))
+
+    def to_dict(self):
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage)
+            stages[name]["mb_s"] = (
+                stage["bytes"] / stage["wall_s"] / 1024**2 if stage["wall_s"] and stage["bytes"] else None
+            )
+
+        queues = {
+            name: {"max": queue["max"], "mean": queue["total"] / queue["samples"], "samples": queue["samples"]}
+            for name, queue in self.queues.items() if queue["samples"]
+        }
+
+        return {
+            "command": self.command,
+            "box": self.box,
+            "wall_s": self.wall,
+            "cpu_s": self.cpu,
+            "peak_rss_bytes": self.peak_rss,
+            "worker_utilisation": self.worker_utilisation(),
+            **self.info,
+            "stages": stages,
+            "queues": queues,
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format"""
+        labels = f'command="{self.command}",box="{os.path.basename(self.box or "")}"'
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+            for extra, value in samples:
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{labels}{extra}}} {value}")
+
+        data = self.to_dict()
+        metric("run_wall_seconds", "Wall time of the last run", [("", data["wall_s"])])
+        metric("run_cpu_seconds", "CPU time of the last run", [("", data["cpu_s"])])
+        metric("peak_rss_bytes", "Peak resident memory of the last run", [("", data["peak_rss_bytes"])])
+        metric("last_run_timestamp_seconds", "End of the last run", [("", int(time.time()))])
+        if data["worker_utilisation"] is not None:
+            metric("worker_utilisation_ratio", "Share of worker time spent encrypting",
+                   [("", data["worker_utilisation"])])
+
+        for field, name, help_text in (
+            ("wall_s", "stage_wall_seconds", "Wall time per stage (summed over workers)"),
+            ("cpu_s", "stage_cpu_seconds", "CPU time per stage"),
+            ("bytes", "stage_bytes", "Bytes processed per stage"),
+            ("calls", "stage_calls", "Runs of each stage"),
+        ):
+            metric(name, help_text, [
+                (f',stage="{stage}"', values[field]) for stage, values in data["stages"].items()
+            ])
+
+        for field in ("max", "mean"):
+            metric(f"queue_depth_{field}", f"{field.capitalize()} sampled queue depth", [
+                (f',queue="{queue}"', values[field]) for queue, values in data["queues"].items()
+            ])
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write a node exporter textfile (atomically, the collector may read it any time)"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
@@ -2,50 +2,218 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from time import sleep
 from .logger import auto_logger
+from .scanner import scan_folder
+import threading
+import stat
 import os
 
 
 logger = auto_logger()
 
+# Paths queued by events before the observer gives up on them and rescans
+MAX_PENDING = 100000
+
 
 class FolderObserver(FileSystemEventHandler):
-    def __init__(self, path='.',checkTem=False):
+    """
+    Snapshot of a folder kept current from watchdog events.
+
+    Events only queue the path they name (O(1), no I/O on the watchdog
+    thread); `check_differences` stats the queued paths, reports what changed
+    since the previous check and advances the snapshot. The folder is only
+    walked again when the queue overflows, when the snapshot did not come
+    from the folder, or when nothing is watching it (`start` not called).
+    """
+    def __init__(self, path='.',checkTem=False, initial_snapshot=None, stat_cache=None,
+                 max_pending=MAX_PENDING):
+        """
+        Args:
+            initial_snapshot: {path: (size, mtime[, inode])} to diff against
+                              instead of the folder's current state
+            stat_cache: StatCache whose hashes clear files that only had
+                        their stat data changed
+            max_pending: Queued paths that trigger a full rescan instead
+        """
         self.path = path
         self.isChanged = False
-        self.initial_snapshot = self.snapshot_folder(path)
-        self.current_snapshot = self.initial_snapshot.copy()
+        self.event_count = 0
+        self.stat_cache = stat_cache
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()        # queue, taken by event handlers
+        self._check_lock = threading.Lock()  # snapshot, one check at a time
+        self._files = set()
+        self._dirs = set()
+        self._observer = None
+
+        # A given snapshot is not the folder's current state: rescan once
+        self._rescan = initial_snapshot is not None
+        if initial_snapshot is None:
+            initial_snapshot = self.snapshot_folder(path)
+        self.snapshot = initial_snapshot
 
     def snapshot_folder(self, path):
         """
-        Take a snapshot of the folder
+        Take a snapshot of the folder: {path: (size, mtime, inode)}
         """
-        snapshot = {}
-        for root, dirs, files in os.walk(path):
-            for f in files:
-                fp = os.path.join(root, f)
-                try:
-                    stat = os.stat(fp)
-                    snapshot[fp] = (stat.st_size, stat.st_mtime)
-                except FileNotFoundError:
-                    pass
-        return snapshot
+        return {
+            entry.path: (entry.size, entry.mtime, entry.ino)
+            for entry in scan_folder(path)
+        }
+
+    def _arcname(self, path):
+        return os.path.relpath(path, self.path).replace(os.sep, "/")
+
+    def start(self):
+        """Watch the folder so checks follow events instead of rescanning"""
+        self._observer = Observer()
+        self._observer.schedule(self, self.path, recursive=True)
+        self._observer.start()
+
+        # Changes between the snapshot and the first event are not queued
+        self.request_rescan()
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def request_rescan(self):
+        """Drop the queued paths and walk the whole folder on the next check"""
+        with self._lock:
+            self._rescan = True
+            self._files.clear()
+            self._dirs.clear()
+
+    def _queue(self, path, is_directory):
+        path = os.fsdecode(path)
+        with self._lock:
+            if self._rescan:
+                return
+            (self._dirs if is_directory else self._files).add(path)
+
+            if len(self._files) + len(self._dirs) > self.max_pending:
+                logger.warning(f"Event queue of {self.path} overflowed, rescanning")
+                self._rescan = True
+                self._files.clear()
+                self._dirs.clear()
 
     def on_any_event(self, event):
         self.isChanged = True
+        self.event_count += 1
+
+    def on_created(self, event):
+        self._queue(event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        # Directory mtimes change with their entries, which have events of their own
+        if not event.is_directory:
+            self._queue(event.src_path, False)
+
+    def on_deleted(self, event):
+        self._queue(event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        self._queue(event.src_path, event.is_directory)
+        self._queue(event.dest_path, event.is_directory)
+
+    def _stat(self, path):
+        """Snapshot value of one path, None if it is gone or not a file"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            try:
+                st = os.lstat(path)  # broken symlink
+            except OSError:
+                return None
+
+        if stat.S_ISDIR(st.st_mode):
+            return None
+        return (st.st_size, st.st_mtime, st.st_ino)
+
+    def _current(self, files, dirs):
+        """
+        Current value of every path the queued events may have changed
 
-    def check_differences(self):
-        new_snapshot = self.snapshot_folder(self.path)
+        Returns: {path: value or None}
+        """
+        current = {}
 
-        old = set(self.initial_snapshot.keys())
-        new = set(new_snapshot.keys())
+        if dirs:
+            # A created, deleted or moved directory: every file below it
+            prefixes = tuple(d.rstrip(os.sep) + os.sep for d in dirs)
+            current.update((p, None) for p in self.snapshot if p.startswith(prefixes))
 
-        added = new - old
-        removed = old - new
+            for d in dirs:
+                if os.path.isdir(d):
+                    current.update(
+                        (entry.path, (entry.size, entry.mtime, entry.ino))
+                        for entry in scan_folder(d)
+                    )
 
-        modified = {
-            f for f in (old & new)
-            if self.initial_snapshot[f] != new_snapshot[f]
-        }
+        for path in files:
+            current[path] = self._stat(path)
+        return current
+
+    def check_differences(self):
+        """
+        Changes since the previous check (or the initial snapshot), which
+        becomes the new baseline. Safe to call from several threads: each
+        change is reported by exactly one call.
+
+        Returns: (added, removed, modified) sets of paths
+        """
+        with self._check_lock:
+            with self._lock:
+                rescan = self._rescan or self._observer is None
+                files, dirs = self._files, self._dirs
+                self._files, self._dirs = set(), set()
+                self._rescan = False
+
+            if rescan:
+                current = self.snapshot_folder(self.path)
+                current.update((p, None) for p in self.snapshot if p not in current)
+            else:
+                current = self._current(files, dirs)
+
+            return self._apply(current)
+
+    def check_paths(self, paths):
+        """
+        Differences of just `paths` against the snapshot, without walking
+        the folder; the snapshot advances for those paths only
+
+        Returns: (added, removed, modified) sets of paths
+        """
+        with self._check_lock:
+            return self._apply({path: self._stat(path) for path in paths})
+
+    def _apply(self, current):
+        """Diff {path: value or None} against the snapshot and advance it"""
+        added, removed, modified = set(), set(), set()
+
+        for path, new in current.items():
+            old = self.snapshot.get(path)
+
+            if new is None:
+                if old is not None:
+                    removed.add(path)
+                    del self.snapshot[path]
+                continue
+
+            if old is None:
+                added.add(path)
+            # Snapshots without inodes only compare size and mtime
+            elif old != new[:len(old)]:
+                modified.add(path)
+            self.snapshot[path] = new
+
+        if self.stat_cache is not None:
+            modified = {
+                f for f in modified
+                if not self.stat_cache.same_content(self._arcname(f), f)
+            }
 
         return added, removed, modified
 
@@ -53,10 +221,7 @@ class FolderObserver(FileSystemEventHandler):
 if __name__ == "__main__":
     PATH = '.'
     handler = FolderObserver(path=PATH)
-    observer = Observer()
-
-    observer.schedule(handler, path=PATH, recursive=True)
-    observer.start()
+    handler.start()
 
     print("Watching folder:", PATH)
     try:
@@ -70,6 +235,6 @@ if __name__ == "__main__":
                     logger.info("Changes detected:")
 
     except KeyboardInterrupt:
-        observer.stop()
+        pass
 
-    observer.join()
+    handler.stop()
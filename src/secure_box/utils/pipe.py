@@ -0,0 +1,116 @@
+import threading
+from collections import deque
+
+
+class BoundedPipe:
+    """
+    In-memory, thread-safe pipe between one producer and one consumer.
+
+    The writer blocks once `capacity` bytes are buffered, so a fast producer
+    (e.g. tarfile) can never run ahead of a slower consumer (the encryptor)
+    by more than that amount.
+    """
+    def __init__(self, capacity=64 * 1024 * 1024):
+        self.capacity = capacity
+        self._blocks = deque()
+        self._offset = 0
+        self._size = 0
+        self._closed = False
+        self._reader_closed = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def write(self, data):
+        """Append data, blocking while the pipe is full"""
+        view = memoryview(bytes(data))
+        if not view:
+            return 0
+
+        with self._cond:
+            while self._size >= self.capacity and not self._reader_closed:
+                self._cond.wait()
+
+            if self._reader_closed:
+                raise BrokenPipeError("Pipe reader is closed")
+            if self._closed:
+                raise ValueError("write to closed pipe")
+
+            self._blocks.append(view)
+            self._size += len(view)
+            self._cond.notify_all()
+
+        return len(view)
+
+    @property
+    def buffered(self):
+        """Bytes written and not read yet"""
+        return self._size
+
+    def close(self, error=None):
+        """
+        Close the writing end.
+
+        Args:
+            error: Exception raised to the reader instead of a clean EOF
+        """
+        with self._cond:
+            self._closed = True
+            self._error = error
+            self._cond.notify_all()
+
+    def close_reader(self):
+        """Close the reading end, waking up a blocked writer"""
+        with self._cond:
+            self._reader_closed = True
+            self._blocks.clear()
+            self._size = 0
+            self._cond.notify_all()
+
+    def readinto(self, buffer):
+        """
+        Fill `buffer` completely unless EOF is reached first
+
+        Returns: number of bytes written into buffer
+        """
+        view = memoryview(buffer).cast("B")
+        filled = 0
+
+        with self._cond:
+            while filled < len(view):
+                while not self._blocks and not self._closed:
+                    self._cond.wait()
+
+                if self._error is not None:
+                    raise self._error
+                if not self._blocks:
+                    break
+
+                block = self._blocks[0]
+                take = min(len(block) - self._offset, len(view) - filled)
+                view[filled:filled + take] = block[self._offset:self._offset + take]
+                filled += take
+                self._offset += take
+                self._size -= take
+
+                if self._offset == len(block):
+                    self._blocks.popleft()
+                    self._offset = 0
+
+                self._cond.notify_all()
+
+        return filled
+
+    def read(self, size=-1):
+        """Read up to `size` bytes (everything until EOF if size < 0)"""
+        if size is None or size < 0:
+            parts = []
+            while True:
+                part = self.read(1024 * 1024)
+                if not part:
+                    return b"".join(parts)
+                parts.append(part)
+
+        buffer = bytearray(size)
+        n = self.readinto(buffer)
+        del buffer[n:]
+        return bytes(buffer)
@@ -0,0 +1,483 @@
+"""
+Deduplicating snapshot repository.
+
+The TAR stream of a folder is cut into content-defined chunks (gear rolling
+hash over a 64-byte window, vectorised with numpy when it is installed), every chunk is identified by a keyed BLAKE2b hash and stored once,
+encrypted, in append-only pack files. A snapshot is just the encrypted list
+of chunk ids, so locking a slowly changing folder every night only writes
+the chunks that changed.
+
+The repository key is a random data key wrapped by scrypt key slots, as in
+a box header (see keys.py).
+
+    <repo>/config                JSON: version, chunker parameters, key slots
+    <repo>/packs/NNNNNNNN.pack   sealed chunks (codec frames) back to back
+    <repo>/packs/NNNNNNNN.idx    [id 32][offset u64][frame length u32] per chunk
+    <repo>/snapshots/*.snap      encrypted, compressed JSON chunk list
+"""
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from .container import ContainerError, seal_chunk, open_frame, parse_frame
+from .keys import KeySlots, new_data_key
+from .compress import get_codec
+from .pipe import BoundedPipe
+from .archive import start_tar_producer
+from .scanner import scan_folder
+from .logger import auto_logger
+import threading
+import datetime
+import tarfile
+import hashlib
+import struct
+import hmac
+import json
+import zlib
+import sys
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+logger = auto_logger()
+
+REPO_VERSION = 2
+PACK_SIZE = 64 * 1024 * 1024
+READ_SIZE = 4 * 1024 * 1024
+
+WINDOW = 64                  # bytes behind a cut point that decide it
+SCAN_BLOCK = 64 * 1024       # positions hashed per numpy pass (fits the cache)
+
+PACK_ENTRY = struct.Struct(">32sQI")
+SNAPSHOT_AAD = b"secure-box/snapshot"
+
+MASK64 = (1 << 64) - 1
+
+
+class RepositoryError(Exception):
+    """Invalid repository, wrong password or missing data"""
+
+
+class Chunker:
+    """
+    Content-defined chunking with a gear rolling hash.
+
+    Cut points depend only on the WINDOW bytes before them, so an insertion
+    early in the stream shifts data without changing the chunks after it.
+    The gear table is derived from the repository key, which keeps chunk
+    boundaries from leaking information about the plaintext.
+
+    A 64-bit gear hash forgets every byte older than 64 shifts, so the hash
+    at each position is a sum over its window and all positions of a block
+    are hashed at once with numpy; without numpy a Python loop computes the
+    same cut points.
+    """
+    def __init__(self, seed, min_size, avg_size, max_size):
+        # The first window must lie inside the chunk
+        self.min_size = max(min_size, WINDOW)
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.mask = ((1 << (avg_size.bit_length() - 1)) - 1) << (64 - avg_size.bit_length())
+        self.gear = [
+            int.from_bytes(hashlib.blake2b(bytes([i]), key=seed, digest_size=8).digest(), "big")
+            for i in range(256)
+        ]
+        self.gear_array = numpy.array(self.gear, dtype=numpy.uint64) if numpy is not None else None
+
+    def cut(self, data):
+        """Length of the first chunk of `data` (which holds >= max_size bytes or ends the stream)"""
+        if len(data) <= self.min_size:
+            return len(data)
+
+        limit = min(len(data), self.max_size)
+        if self.gear_array is not None:
+            return self._cut_vector(data, limit)
+        return self._cut_scalar(data, limit)
+
+    def _cut_scalar(self, data, limit):
+        gear = self.gear
+        mask = self.mask
+        h = 0
+
+        for i in range(self.min_size - WINDOW + 1, self.min_size):
+            h = ((h << 1) + gear[data[i]]) & MASK64
+        for i in range(self.min_size, limit):
+            h = ((h << 1) + gear[data[i]]) & MASK64
+            if not h & mask:
+                return i + 1
+        return limit
+
+    def _cut_vector(self, data, limit):
+        """
+        Hash a block of positions at a time: h[i] = sum(gear[data[i - k]] << k)
+        over the window, built by doubling the summed span log2(WINDOW) times
+        """
+        view = numpy.frombuffer(data, dtype=numpy.uint8, count=limit)
+        shifted = numpy.empty(SCAN_BLOCK + WINDOW, dtype=numpy.uint64)
+        mask = numpy.uint64(self.mask)
+        start = self.min_size
+
+        while start < limit:
+            end = min(limit, start + SCAN_BLOCK)
+            h = self.gear_array.take(view[start - WINDOW + 1:end])
+
+            span = 1
+            while span < WINDOW:
+                numpy.left_shift(h[:-span], numpy.uint64(span), out=shifted[:len(h) - span])
+                h[span:] += shifted[:len(h) - span]
+                span <<= 1
+
+            numpy.bitwise_and(h, mask, out=h)
+            hits = numpy.flatnonzero(h[WINDOW - 1:] == 0)
+            if len(hits):
+                return start + int(hits[0]) + 1
+            start = end
+
+        return limit
+
+    def chunks(self, fin):
+        """Yield the chunks of a stream"""
+        buffer = bytearray()
+        eof = False
+
+        while True:
+            while not eof and len(buffer) < self.max_size:
+                block = fin.read(READ_SIZE)
+                if not block:
+                    eof = True
+                buffer += block
+
+            if not buffer:
+                return
+
+            size = self.cut(buffer)
+            yield bytes(buffer[:size])
+            del buffer[:size]
+
+
+class PackStore:
+    """Append-only store of encrypted chunks keyed by chunk id"""
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.pack_no = 0
+        self._pack = None
+        self._index = None
+
+        os.makedirs(path, exist_ok=True)
+
+        for name in sorted(os.listdir(path)):
+            if not name.endswith(".idx"):
+                continue
+
+            pack_no = int(name[:-4])
+            self.pack_no = max(self.pack_no, pack_no)
+            self._load_index(pack_no)
+
+    def _load_index(self, pack_no):
+        """
+        Read the entries of one pack, dropping those past the end of its
+        data (a crash between the two writes) and truncating the index to
+        the entries that are really stored
+        """
+        index_path = self._pack_path(pack_no, "idx")
+        pack_path = self._pack_path(pack_no, "pack")
+        pack_size = os.path.getsize(pack_path) if os.path.exists(pack_path) else 0
+
+        with open(index_path, "rb") as f:
+            raw = f.read()
+
+        valid = 0
+        usable = len(raw) - len(raw) % PACK_ENTRY.size
+        for chunk_id, offset, length in PACK_ENTRY.iter_unpack(raw[:usable]):
+            if offset + length > pack_size:
+                break
+            self.entries[chunk_id] = (pack_no, offset, length)
+            valid += 1
+
+        if valid * PACK_ENTRY.size < len(raw):
+            logger.warning(
+                f"Pack {pack_no:08d}: dropping {len(raw) // PACK_ENTRY.size - valid} index "
+                f"entries past the end of the pack"
+            )
+            with open(index_path, "r+b") as f:
+                f.truncate(valid * PACK_ENTRY.size)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.entries
+
+    def _pack_path(self, pack_no, ext):
+        return os.path.join(self.path, f"{pack_no:08d}.{ext}")
+
+    def _open_next_pack(self):
+        self.close()
+        self.pack_no += 1
+        self._pack = open(self._pack_path(self.pack_no, "pack"), "ab")
+        self._index = open(self._pack_path(self.pack_no, "idx"), "ab")
+
+    def add(self, chunk_id, frame):
+        """Store one sealed chunk"""
+        if self._pack is None or self._pack.tell() >= PACK_SIZE:
+            self._open_next_pack()
+
+        offset = self._pack.tell()
+        self._pack.write(frame)
+        self._index.write(PACK_ENTRY.pack(chunk_id, offset, len(frame)))
+        self.entries[chunk_id] = (self.pack_no, offset, len(frame))
+
+    def read(self, chunk_id):
+        """Read the sealed frame of one chunk"""
+        try:
+            pack_no, offset, length = self.entries[chunk_id]
+        except KeyError:
+            raise RepositoryError(f"Chunk {chunk_id.hex()} is missing from the repository")
+
+        with open(self._pack_path(pack_no, "pack"), "rb") as f:
+            f.seek(offset)
+            frame = f.read(length)
+
+        if len(frame) != length:
+            raise RepositoryError(f"Pack {pack_no:08d} is truncated")
+        return frame
+
+    def close(self):
+        """Make the current pack durable: data first, then its index"""
+        for f in (self._pack, self._index):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        self._pack = self._index = None
+
+
+class Repository:
+    def __init__(self, path, password, max_workers=4):
+        self.path = path
+        self.config_path = os.path.join(path, "config")
+        self.snapshot_dir = os.path.join(path, "snapshots")
+        self.max_workers = max_workers
+        self.password = password
+
+        self.key = None
+        self.id_key = None
+        self.aes = None
+        self.config = None
+
+    def _use_key(self, data_key):
+        self.key = data_key
+        self.id_key = hmac.new(data_key, b"secure-box/chunk-id", hashlib.sha256).digest()
+        self.aes = AESGCM(data_key)
+
+    def init(self, min_size=512 * 1024, avg_size=2 * 1024 * 1024, max_size=8 * 1024 * 1024):
+        """Create an empty repository"""
+        if os.path.exists(self.config_path):
+            raise RepositoryError(f"{self.path} is already a repository")
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        os.makedirs(os.path.join(self.path, "packs"), exist_ok=True)
+
+        data_key = new_data_key()
+        slots = KeySlots.create(self.password, data_key)
+        self._use_key(data_key)
+
+        self.config = {
+            "version": REPO_VERSION,
+            "chunker": {"min": min_size, "avg": avg_size, "max": max_size},
+            "key_slots": slots.to_bytes().hex(),
+        }
+        with open(self.config_path, "w") as f:
+            json.dump(self.config, f, indent=4)
+
+        logger.info(f"Repository created: {self.path}")
+
+    def open(self):
+        """Load the configuration and check the password"""
+        if not os.path.exists(self.config_path):
+            raise RepositoryError(f"{self.path} is not a repository")
+
+        with open(self.config_path, "r") as f:
+            self.config = json.load(f)
+
+        if self.config["version"] != REPO_VERSION:
+            raise RepositoryError(f"Unsupported repository version {self.config['version']}")
+
+        try:
+            _, data_key = KeySlots(bytes.fromhex(self.config["key_slots"])).unlock(self.password)
+        except ContainerError:
+            raise RepositoryError("Wrong password for this repository")
+
+        self._use_key(data_key)
+        return self
+
+    def chunk_id(self, data):
+        """Keyed hash of a chunk; ids reveal nothing without the key"""
+        return hashlib.blake2b(data, key=self.id_key, digest_size=32).digest()
+
+    def chunker(self):
+        params = self.config["chunker"]
+        seed = hmac.new(self.key, b"secure-box/chunker", hashlib.sha256).digest()
+        return Chunker(seed, params["min"], params["avg"], params["max"])
+
+    def _seal_snapshot(self, snapshot):
+        data = zlib.compress(json.dumps(snapshot, separators=(",", ":")).encode())
+        nonce = os.urandom(12)
+        return nonce + self.aes.encrypt(nonce, data, SNAPSHOT_AAD)
+
+    def _open_snapshot(self, raw):
+        data = self.aes.decrypt(raw[:12], raw[12:], SNAPSHOT_AAD)
+        return json.loads(zlib.decompress(data))
+
+    def backup(self, folder, compression="zlib"):
+        """
+        Store a snapshot of `folder`, writing only chunks not already stored
+
+        Returns: dict with the snapshot name and dedup statistics
+        """
+        codec = get_codec(compression)
+        packs = PackStore(os.path.join(self.path, "packs"))
+        chunker = self.chunker()
+
+        members = []
+        pipe = BoundedPipe(capacity=2 * chunker.max_size)
+        thread = start_tar_producer(scan_folder(folder), pipe, members)
+
+        chunk_ids = []
+        stats = {"chunks": 0, "new_chunks": 0, "bytes": 0, "new_bytes": 0}
+        pending = set()
+        in_flight = deque()
+        window = self.max_workers * 2
+
+        def store_oldest():
+            chunk_id, future = in_flight.popleft()
+            frame = future.result()
+            packs.add(chunk_id, frame)
+            pending.discard(chunk_id)
+            stats["new_bytes"] += len(frame)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for chunk in chunker.chunks(pipe):
+                    chunk_id = self.chunk_id(chunk)
+                    chunk_ids.append(chunk_id)
+                    stats["chunks"] += 1
+                    stats["bytes"] += len(chunk)
+
+                    if chunk_id in packs or chunk_id in pending:
+                        continue
+
+                    pending.add(chunk_id)
+                    in_flight.append((chunk_id, executor.submit(seal_chunk, self.aes, chunk, codec)))
+                    stats["new_chunks"] += 1
+
+                    if len(in_flight) >= window:
+                        store_oldest()
+
+                while in_flight:
+                    store_oldest()
+        finally:
+            pipe.close_reader()
+            thread.join()
+            packs.close()
+
+        now = datetime.datetime.now()
+        snapshot = {
+            "time": now.isoformat(timespec="seconds"),
+            "source": os.path.abspath(folder),
+            "size": stats["bytes"],
+            "members": len(members),
+            "chunks": [chunk_id.hex() for chunk_id in chunk_ids],
+        }
+
+        name = f"{now:%Y%m%dT%H%M%S}-{os.urandom(4).hex()}"
+        snapshot_path = os.path.join(self.snapshot_dir, name + ".snap")
+        with open(snapshot_path + ".tmp", "wb") as f:
+            f.write(self._seal_snapshot(snapshot))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+
+        stats["snapshot"] = name
+        logger.info(
+            f"Snapshot {name}: {stats['new_chunks']}/{stats['chunks']} new chunks, "
+            f"{stats['new_bytes']} bytes written"
+        )
+        return stats
+
+    def snapshots(self):
+        """
+        List snapshots, oldest first
+
+        Returns: [(name, snapshot without its chunk list)]
+        """
+        result = []
+        for name in sorted(os.listdir(self.snapshot_dir)):
+            if not name.endswith(".snap"):
+                continue
+            snapshot = self.load_snapshot(name[:-5])
+            snapshot.pop("chunks")
+            result.append((name[:-5], snapshot))
+        return result
+
+    def load_snapshot(self, name):
+        path = os.path.join(self.snapshot_dir, name + ".snap")
+        if not os.path.exists(path):
+            raise RepositoryError(f"Snapshot {name} not found")
+
+        with open(path, "rb") as f:
+            return self._open_snapshot(f.read())
+
+    def _fetch(self, packs, chunk_id):
+        """Read, decrypt and verify one chunk"""
+        data = open_frame(self.aes, parse_frame(packs.read(chunk_id)))
+        if not hmac.compare_digest(self.chunk_id(data), chunk_id):
+            raise RepositoryError(f"Chunk {chunk_id.hex()} does not match its id")
+        return data
+
+    def restore(self, name, out_dir):
+        """
+        Restore a snapshot into `out_dir`.
+
+        Chunks are fetched and decrypted on a thread pool, reassembled in
+        order into a bounded pipe and extracted by a streaming tarfile.
+        """
+        snapshot = self.load_snapshot(name)
+        packs = PackStore(os.path.join(self.path, "packs"))
+        chunk_ids = [bytes.fromhex(chunk_id) for chunk_id in snapshot["chunks"]]
+
+        pipe = BoundedPipe(capacity=2 * self.config["chunker"]["max"])
+
+        def produce():
+            window = self.max_workers * 2
+            in_flight = deque()
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for chunk_id in chunk_ids:
+                        in_flight.append(executor.submit(self._fetch, packs, chunk_id))
+                        if len(in_flight) >= window:
+                            pipe.write(in_flight.popleft().result())
+                    while in_flight:
+                        pipe.write(in_flight.popleft().result())
+            except BaseException as e:
+                pipe.close(error=e)
+            else:
+                pipe.close()
+
+        thread = threading.Thread(target=produce, name="secure-box-restore", daemon=True)
+        thread.start()
+
+        extraction_filter = getattr(tarfile, "data_filter", None) if sys.version_info >= (3, 12) else None
+        try:
+            with tarfile.open(fileobj=pipe, mode="r|") as tar:
+                for member in tar:
+                    if extraction_filter:
+                        tar.extract(member, path=out_dir, filter=extraction_filter)
+                    else:
+                        tar.extract(member, path=out_dir)
+        finally:
+            pipe.close_reader()
+            thread.join()
+
+        logger.info(f"Snapshot {name} restored to {out_dir}")
@@ -0,0 +1,148 @@
+"""
+Single-pass folder scanner.
+
+The folder is listed once with `os.scandir`, directories in parallel, into
+a Manifest that config, the TAR writer and the progress bars all share.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import namedtuple
+from .logger import auto_logger, RateLimiter
+import hashlib
+import os
+
+
+logger = auto_logger()
+_skip_log = RateLimiter()
+
+SCAN_WORKERS = 8
+
+FileEntry = namedtuple("FileEntry", "path arcname size mode mtime mtime_ns ino")
+
+
+def _entry(path, arcname, st):
+    return FileEntry(
+        path, arcname, st.st_size, st.st_mode, st.st_mtime, st.st_mtime_ns, st.st_ino
+    )
+
+
+def _stat(entry):
+    try:
+        return entry.stat()
+    except OSError:
+        return entry.stat(follow_symlinks=False)  # broken symlink
+
+
+def _scan_dir(path):
+    """
+    List one directory
+
+    Returns: (files [(name, stat_result)], subdirectory names), both sorted
+    """
+    files = []
+    dirs = []
+
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if is_dir:
+                    # Like os.walk: symlinked directories are not descended
+                    if not entry.is_symlink():
+                        dirs.append(entry.name)
+                    continue
+
+                files.append((entry.name, _stat(entry)))
+    except NotADirectoryError:
+        pass
+    except OSError as e:
+        # A tree full of unreadable directories must not flood the log
+        if _skip_log.ready():
+            skipped = _skip_log.suppressed()
+            more = f" ({skipped} more skipped)" if skipped else ""
+            logger.warning(f"Skipping unreadable directory {path}: {e}{more}")
+
+    files.sort(key=lambda item: item[0])
+    dirs.sort()
+    return files, dirs
+
+
+class Manifest:
+    """
+    Files of a folder with their stat data, in archive order (the order of a
+    sorted top-down os.walk)
+    """
+    def __init__(self, root, entries):
+        self.root = root
+        self.entries = entries
+        self.total_size = sum(entry.size for entry in entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def fingerprint(self):
+        """
+        Digest of the sorted (path, size, mtime_ns) of every file; changes
+        whenever a file is added, removed or rewritten
+        """
+        sha = hashlib.sha256()
+        for arcname, size, mtime_ns in sorted(
+            (entry.arcname, entry.size, entry.mtime_ns) for entry in self.entries
+        ):
+            sha.update(f"{arcname}\0{size}\0{mtime_ns}\n".encode("utf-8", "surrogateescape"))
+        return sha.hexdigest()
+
+
+def scan_folder(folder, max_workers=SCAN_WORKERS):
+    """
+    Scan `folder` once, listing directories on a thread pool
+
+    Directory listing is dominated by metadata latency (especially on
+    network filesystems), so directories are listed concurrently and the
+    results assembled in walk order afterwards.
+
+    Returns: Manifest
+    """
+    listings = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_scan_dir, folder): ""}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                relative = pending.pop(future)
+                files, dirs = future.result()
+                listings[relative] = (files, dirs)
+
+                for name in dirs:
+                    sub = os.path.join(relative, name) if relative else name
+                    pending[executor.submit(_scan_dir, os.path.join(folder, sub))] = sub
+
+    entries = []
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        files, dirs = listings[relative]
+        root = os.path.join(folder, relative) if relative else folder
+
+        for name, st in files:
+            arcname = os.path.join(relative, name) if relative else name
+            entries.append(_entry(os.path.join(root, name), arcname, st))
+
+        stack.extend(
+            os.path.join(relative, name) if relative else name for name in reversed(dirs)
+        )
+
+    return Manifest(folder, entries)
+
+
+def stat_entry(path, arcname):
+    """FileEntry for a single file"""
+    return _entry(path, arcname, os.stat(path))
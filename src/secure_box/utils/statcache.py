@@ -0,0 +1,164 @@
+"""
+Stat cache sidecar for fast change detection.
+
+`<box>.manifest` is a small SQLite database next to the box holding the
+path, inode, size, mtime_ns and content hash of every archived file. While
+a file's stat data matches its row the file is taken as unchanged without
+being read; when only the stat data moved (a touch, a restore with the same
+bytes) the stored hash settles whether the content did.
+
+Hashes are computed while the TAR stream is written, so filling the cache
+never reads a file a second time.
+"""
+from .logger import auto_logger
+import hashlib
+import sqlite3
+import os
+
+
+logger = auto_logger()
+
+HASH_BUFSIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash BLOB
+) WITHOUT ROWID
+"""
+
+
+def new_hash():
+    return hashlib.sha256()
+
+
+def file_digest(path):
+    """Content hash of a file"""
+    digest = new_hash()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(HASH_BUFSIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.digest()
+
+
+def ns_to_mtime(mtime_ns):
+    """The float st_mtime that os.stat reports along with `mtime_ns`"""
+    return mtime_ns // 10 ** 9 + (mtime_ns % 10 ** 9) * 1e-9
+
+
+def cache_path(box_path):
+    return box_path + ".manifest"
+
+
+def cache_row(entry, name, digest):
+    """Row for a scanned FileEntry archived as `name`"""
+    return (name, entry.ino, entry.size, entry.mtime_ns, digest)
+
+
+class StatCache:
+    """
+    Rows of the stat cache, keyed by member name:
+    (inode, size, mtime_ns, hash)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA synchronous=OFF")  # rebuilt by the next lock if lost
+        self.db.execute(SCHEMA)
+
+    @classmethod
+    def write(cls, path, rows):
+        """
+        Replace the cache at `path` with `rows` [(name, inode, size, mtime_ns, hash)]
+
+        The database is built next to the target and renamed over it, so a
+        crash never leaves a half-written cache.
+        """
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        cache = cls(tmp_path)
+        try:
+            # Nothing to roll back in a file that is renamed into place, and
+            # inserting in key order keeps the B-tree appends sequential
+            cache.db.execute("PRAGMA journal_mode=OFF")
+            cache.update(sorted(rows))
+        finally:
+            cache.close()
+        os.replace(tmp_path, path)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def load(self):
+        """
+        The stat data of every row in one query. Hashes are only needed for
+        the few files whose stat data changed, so they are left on disk for
+        `get` and loading stays cheap for millions of rows.
+
+        Returns: {name: (inode, size, mtime_ns)}
+        """
+        cursor = self.db.execute("SELECT path, inode, size, mtime_ns FROM files")
+        cursor.arraysize = 65536
+        rows = {}
+        while True:
+            batch = cursor.fetchmany()
+            if not batch:
+                break
+            rows.update((row[0], row[1:]) for row in batch)
+        return rows
+
+    def get(self, name):
+        return self.db.execute(
+            "SELECT inode, size, mtime_ns, hash FROM files WHERE path = ?", (name,)
+        ).fetchone()
+
+    def update(self, rows):
+        """Insert or replace rows [(name, inode, size, mtime_ns, hash)]"""
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+
+    def remove(self, names):
+        with self.db:
+            self.db.executemany("DELETE FROM files WHERE path = ?", ((name,) for name in names))
+
+    def same_content(self, name, path):
+        """
+        Check a file whose stat data changed against its cached hash. A
+        matching file has its row refreshed so it is not read again.
+
+        Returns: True if the content is unchanged
+        """
+        row = self.get(name)
+        if row is None or row[3] is None:
+            return False
+
+        try:
+            st = os.stat(path)
+            if st.st_size != row[1]:
+                return False
+            digest = file_digest(path)
+        except OSError:
+            return False
+
+        if digest != row[3]:
+            return False
+
+        self.update([(name, st.st_ino, st.st_size, st.st_mtime_ns, digest)])
+        return True
@@ -2,11 +2,23 @@ from .lock import Lock
 from .tools import ASCIIBar
 from .backup import SafeBackupWriter
 from .logger import auto_logger
+from .config import unlock_auto_config
+from .container import Container, ContainerError, PlaintextReader, open_frame, open_frame_into
+from .buffers import BufferPool
+from .keys import new_data_key
+from .pipe import BoundedPipe
+from .archive import start_producer, TAR_BUFSIZE
+from .statcache import cache_path
+from .checksum import DEFAULT_SCHEME, read_checksum
+from .metrics import Metrics
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from rich.progress import Progress, TextColumn, TimeElapsedColumn
 import subprocess
 import platform
 import tempfile
 import tarfile
+import fnmatch
 import shutil
 import sys
 import os
@@ -15,16 +27,27 @@ import os
 logger = auto_logger()
 
 class Unlock(Lock):
-    def __init__(self, password, data_file="data"):
+    def __init__(self, password, data_file="data", max_workers=None):
         self.password = password
         self.data_file = data_file + ".bin"
         self.chunk_size = 8 * 1024 * 1024
+        # Password hash until a box is opened (see load_key)
         self.key = self.password_to_key(password)
+        self.key_slots = None
         self.output = data_file
         
+        if max_workers is None:
+            _, max_workers = unlock_auto_config()
+        self.max_workers = max_workers
+        self.members = None
+        self.dead = []
+        self.manifest = None
+        self.codec = None
+        self.checksum_scheme = DEFAULT_SCHEME
+        self.metrics = Metrics("unlock", self.data_file)
+        
         self.system = platform.system()
         self.temp_dir = None
-        self.enc_path = None
         self.tar_path = None
 
     def _setup_temp_directory(self):
@@ -37,17 +60,8 @@ class Unlock(Lock):
             temp_root = tempfile.gettempdir()
         
         self.temp_dir = tempfile.mkdtemp(prefix="SECURE_", dir=temp_root)
-        self.enc_path = os.path.join(self.temp_dir, "enc.bin")
-        self.tar_path = os.path.join(self.temp_dir, "data.tar")
-
-    def _copy_in_chunks(self, src, dst, chunk_size=8*1024*1024):
-        """Memory-efficient file copy"""
-        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
-            while True:
-                chunk = fsrc.read(chunk_size)
-                if not chunk:
-                    break
-                fdst.write(chunk)
+        # Next to the folder, not in it: the folder is archived again on close
+        self.tar_path = self.temp_dir + ".tar"
 
     def _cleanup_temp(self):
         """Clear temporary files"""
@@ -57,12 +71,66 @@ class Unlock(Lock):
                 func(path)
             
             shutil.rmtree(self.temp_dir, onerror=remove_readonly)
+        
+        if self.tar_path and os.path.exists(self.tar_path):
+            os.remove(self.tar_path)
+
+    def iter_frames(self, container, sha=None):
+        """
+        Read the frames of a v1 or v2 container in chunk order
+        
+        Args:
+            sha: Hasher (see checksum.py) fed every byte of the file on the
+                 way, so the checksum is computed in the same pass as decryption
+        
+        Yields: Frame
+        """
+        hashed = 0
+        for chunk_index in range(len(container.index)):
+            frame = container.read_frame(chunk_index)
+            
+            if sha is not None:
+                end = container.frame_end(chunk_index)
+                sha.update(container.view(hashed, end))
+                hashed = end
+            
+            yield frame
+        
+        if sha is not None and container.size:
+            sha.update(container.view(hashed, container.size))
+    
+    def read_checksum(self, path):
+        """Expected Checksum of a box from its sidecar, or None"""
+        return read_checksum(SafeBackupWriter(path).hash_path)
 
-    def decrypt_stream(self, in_path, out_path, key):
-        """Decrypt the encrypted file"""
+    def decrypt_stream(self, in_path, out_path, key, max_workers=None):
+        """
+        Decrypt the encrypted file
+        
+        Args:
+            key: Chunk key of a box without key slots (the password hash)
+            max_workers: Decryption threads (defaults to self.max_workers)
+        """
+        with open(out_path, "wb") as fout:
+            self.decrypt_to(in_path, fout, key, max_workers)
+
+    def decrypt_to(self, in_path, fout, key=None, max_workers=None):
+        """
+        Decrypt the box into a writable file object (file, pipe)
+        
+        The box is read in place (memory-mapped, no temporary copy) and,
+        when it has a .sha256 sidecar, hashed with the sidecar's scheme
+        during the same pass.
+        
+        Args:
+            key: Chunk key of a box without key slots (the password hash)
+            max_workers: Decryption threads (defaults to self.max_workers)
+        """
         from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-        aes = AESGCM(key)
         total_size = os.path.getsize(in_path)
+        workers = max_workers or self.max_workers
+        expected = self.read_checksum(in_path)
+        sha = expected.new_hasher() if expected else None
         
         with Progress(
             TextColumn("🔓 Decrypting "),
@@ -72,32 +140,184 @@ class Unlock(Lock):
         ) as progress:
             task = progress.add_task("decrypt", total=total_size)
             
-            with open(in_path, "rb") as fin, open(out_path, "wb") as fout:
-                while True:
-                    len_bytes = fin.read(4)
-                    if not len_bytes:
-                        break
-                    
-                    block_len = int.from_bytes(len_bytes, "big")
-                    nonce = fin.read(12)
-                    enc = fin.read(block_len)
-                    
-                    dec = aes.decrypt(nonce, enc, None)
-                    fout.write(dec)
-                    
-                    progress.update(task, advance=4 + 12 + block_len)
+            with Container(in_path) as container:
+                aes = AESGCM(self.load_key(container, legacy_key=key))
+                
+                if workers > 1:
+                    self._decrypt_parallel(container, fout, aes, workers, progress, task, sha)
+                else:
+                    buffer = bytearray(container.chunk_size or self.chunk_size)
+                    for frame in self.iter_frames(container, sha):
+                        dec = open_frame_into(aes, frame, buffer)
+                        fout.write(dec)
+                        
+                        progress.update(task, advance=container.frame_header + len(frame.data))
+        
+        if sha is not None and sha.hexdigest() != expected.hexdigest:
+            raise ContainerError(f"{in_path} does not match its {expected.scheme} checksum")
+
+    def _decrypt_parallel(self, container, fout, aes, workers, progress, task, sha=None):
+        """
+        Decrypt frames on a thread pool and write them in order.
+        
+        The reader scans frame headers and keeps at most 2 * workers frames
+        in flight, each decrypted into a buffer from a fixed pool that is
+        reused once its plaintext is written, so memory stays bounded
+        whatever the archive size.
+        """
+        window = workers * 2
+        in_flight = deque()
+        buffers = BufferPool(container.chunk_size or self.chunk_size, window)
+        
+        def write_oldest():
+            future, buffer, frame_size = in_flight.popleft()
+            try:
+                fout.write(future.result())
+            finally:
+                buffers.release(buffer)
+            progress.update(task, advance=frame_size)
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for frame in self.iter_frames(container, sha):
+                buffer = buffers.acquire()
+                future = executor.submit(open_frame_into, aes, frame, buffer)
+                in_flight.append((future, buffer, container.frame_header + len(frame.data)))
+                
+                if len(in_flight) >= window:
+                    write_oldest()
+            
+            while in_flight:
+                write_oldest()
 
-    def extract_tar_stream(self, tar_path, out_dir):
-        """Open the TAR archive with security filter"""
-        extraction_filter = None
+    def _extraction_filter(self):
+        """tarfile's data filter where available"""
         if sys.version_info >= (3, 12):
             try:
-                extraction_filter = tarfile.data_filter
+                return tarfile.data_filter
             except AttributeError:
-                extraction_filter = None
+                return None
+        return None
+
+    def extract_tar_fileobj(self, fileobj, out_dir, live=None):
+        """
+        Extract a TAR stream member by member as it is read
+        
+        Only the current member is kept: tarfile's member list is emptied
+        after each one, so memory stays flat whatever the member count.
+        
+        Args:
+            live: Header offsets of the members to extract; None extracts all.
+                  An updated box holds one TAR segment per update, so zero
+                  blocks between segments are skipped and superseded copies
+                  filtered out by offset.
+        
+        Returns: number of extracted members
+        """
+        extraction_filter = self._extraction_filter()
+        count = 0
         
-        with tarfile.open(tar_path, "r") as tar:
-            members = tar.getmembers()
+        with tarfile.open(fileobj=fileobj, mode="r|", ignore_zeros=True, bufsize=TAR_BUFSIZE) as tar:
+            while True:
+                member = tar.next()
+                if member is None:
+                    break
+                tar.members.clear()
+                
+                if live is not None and member.offset not in live:
+                    continue
+                
+                if extraction_filter:
+                    tar.extract(member, path=out_dir, filter=extraction_filter)
+                else:
+                    tar.extract(member, path=out_dir)
+                count += 1
+        
+        return count
+
+    def decrypt_extract(self, in_path, out_dir, max_workers=None):
+        """
+        Decrypt the box straight into a streaming TAR extractor.
+        
+        Decryption runs on a background thread and writes into a bounded
+        pipe that tarfile reads in stream mode, so files are extracted while
+        later chunks are still being decrypted and no plaintext TAR is ever
+        written. A checksum mismatch surfaces once the whole box was read.
+        
+        Returns: number of extracted members
+        """
+        live = self.live_offsets(in_path)
+        pipe = BoundedPipe(capacity=max(2 * self.chunk_size, TAR_BUFSIZE))
+        producer = start_producer(
+            lambda out: self.decrypt_to(in_path, out, self.key, max_workers),
+            pipe,
+            name="secure-box-decrypt",
+        )
+        
+        try:
+            return self.extract_tar_fileobj(pipe, out_dir, live)
+        finally:
+            pipe.close_reader()
+            producer.join()
+
+    def load_members(self, container):
+        """
+        Decrypt the member table of a v2 box
+        
+        Returns: [[name, start, end, size, mtime], ...] of the live members
+        """
+        meta = self.decrypt_meta(container)
+        if meta is None:
+            raise ContainerError("Box has no member table, unlock it completely instead")
+        
+        return meta["members"]
+    
+    def live_offsets(self, path):
+        """
+        Header offsets of the live members of an updated box
+        
+        Returns: set of offsets, or None when every member is live
+        """
+        with Container(path) as container:
+            meta = self.decrypt_meta(container)
+        
+        if not meta or not meta["dead"]:
+            return None
+        return {m[1] for m in meta["members"]}
+
+    def _matches(self, name, pattern):
+        """Match a member by glob, exact path or parent directory"""
+        pattern = pattern.rstrip("/")
+        return (
+            name == pattern
+            or name.startswith(pattern + "/")
+            or fnmatch.fnmatchcase(name, pattern)
+        )
+
+    def extract_paths(self, pattern, out_dir):
+        """
+        Extract the members matching `pattern` without decrypting the box.
+        
+        The member table maps every member to its byte range in the TAR
+        stream and the chunk index maps that range to encrypted chunks, so
+        only the chunks covering the requested members are read and
+        decrypted.
+        
+        Returns: names of the extracted members
+        """
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        extraction_filter = self._extraction_filter()
+        
+        with Container(self.data_file) as container:
+            aes = AESGCM(self.load_key(container))
+            members = [
+                m for m in self.load_members(container)
+                if self._matches(m[0], pattern)
+            ]
+            if not members:
+                raise FileNotFoundError(f"No file in {self.data_file} matches '{pattern}'")
+            
+            members.sort(key=lambda m: m[1])
+            reader = PlaintextReader(container, lambda frame: open_frame(aes, frame))
             
             with Progress(
                 TextColumn("📂 Extracting "),
@@ -107,12 +327,25 @@ class Unlock(Lock):
             ) as progress:
                 task = progress.add_task("extract", total=len(members))
                 
-                for member in members:
-                    if extraction_filter:
-                        tar.extract(member, path=out_dir, filter=extraction_filter)
-                    else:
-                        tar.extract(member, path=out_dir)
+                for name, start, end, size, mtime in members:
+                    reader.set_range(start, end)
+                    
+                    with tarfile.open(fileobj=reader, mode="r|") as tar:
+                        member = tar.next()
+                        if extraction_filter:
+                            tar.extract(member, path=out_dir, filter=extraction_filter)
+                        else:
+                            tar.extract(member, path=out_dir)
+                    
                     progress.update(task, advance=1)
+        
+        return [m[0] for m in members]
+
+    def load_box_settings(self):
+        """Take the chunk size and codec of the box, to lock it again alike"""
+        with Container(self.data_file) as container:
+            self.chunk_size = container.chunk_size or self.chunk_size
+            self.codec = self.box_codec(container, self.decrypt_meta(container))
 
     def open_folder(self):
         """Open the folder for user"""
@@ -129,21 +362,15 @@ class Unlock(Lock):
         
         self._setup_temp_directory()
         
-
-        logger.info("[+] Preparing decryption...")
-        self._copy_in_chunks(self.data_file, self.enc_path)
-        
-        logger.info("[+] The password is decoding...")
+        logger.info("[+] Decrypting and extracting...")
         try:
-            self.decrypt_stream(self.enc_path, self.tar_path, self.key)
+            self.decrypt_extract(self.data_file, self.temp_dir)
+            self.load_box_settings()
         except Exception as e:
             logger.warning(f"Password is wrong or data is corrupted, error: {e}")
             self._cleanup_temp()
             return
         
-        logger.info("[+] TAR extracting...")
-        self.extract_tar_stream(self.tar_path, self.temp_dir)
-        
         logger.info("[+] Folder is opened...")
         self.open_folder()
         
@@ -153,13 +380,25 @@ class Unlock(Lock):
         self.create_tar_stream(self.temp_dir, self.tar_path)
         
         logger.info("[+] Encrypting (safe)...")
-        safe = SafeBackupWriter(self.data_file)
+        current = self.read_checksum(self.data_file)
+        if current is not None:
+            self.checksum_scheme = current.scheme
+        safe = SafeBackupWriter(self.data_file, self.checksum_scheme)
 
+        if self.key_slots is None:
+            # Box from before key slots: move it to a random data key
+            self.key = new_data_key()
+        
         def encrypt_tmp(tmp_path, checkpoint):
-            self.encrypt_stream(self.tar_path, tmp_path, self.key)
+            return self.encrypt_stream(self.tar_path, tmp_path)
         
         safe.write_backup(encrypt_tmp)
 
+        # The box now holds what was edited in the temp folder, which the
+        # stat cache of the original folder no longer describes
+        if os.path.exists(cache_path(self.data_file)):
+            os.remove(cache_path(self.data_file))
+
         logger.info("Data updated successfully")
         
         self._cleanup_temp()
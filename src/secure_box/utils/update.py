@@ -0,0 +1,343 @@
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from .lock import Lock
+from .backup import SafeBackupWriter
+from .config import unlock_auto_config
+from .logger import auto_logger
+from .observer import FolderObserver
+from .pipe import BoundedPipe
+from .archive import estimate_tar_size, write_tar_stream, start_producer, TAR_BLOCK, TAR_BUFSIZE
+from .container import Container, ContainerWriter, ContainerError, PlaintextReader, open_frame, VERSION
+from .checksum import SHA256_TREE
+from .metrics import Metrics
+from .keys import new_data_key
+from .scanner import stat_entry
+from .statcache import StatCache, cache_path, cache_row, ns_to_mtime
+from .defaults import DEFAULT_COMPACT_THRESHOLD
+from contextlib import contextmanager
+import json
+import time
+import os
+
+
+logger = auto_logger()
+
+
+class Updater(Lock):
+    """
+    Bring an existing box up to date with its folder.
+
+    FolderObserver diffs the folder against the box's member table, taking
+    stat data and content hashes from the stat cache sidecar when it has
+    them, so only files whose content actually changed are re-archived. New and
+    modified files are archived into a fresh TAR segment that is encrypted
+    into new chunks after the old trailer, followed by a new member table,
+    index and trailer. Removed and superseded members move to the table's
+    dead list; unlock skips them and `compact` drops them from the box.
+    Appended and compacted chunks use the codec the box was locked with.
+
+    The old trailer stays valid until the new one is written, and the
+    original size is recorded in `<box>.update` beforehand, so a failed or
+    interrupted update is rolled back by truncating the box to that size.
+    """
+    def __init__(self, password, folder, name="data", executor="thread",
+                 compact_threshold=DEFAULT_COMPACT_THRESHOLD):
+        """
+        Args:
+            folder: Folder the box was locked from (None is enough for compact)
+        """
+        self.password = password
+        self.folder = folder
+        self.output = name + ".bin"
+        self.key = self.password_to_key(password)
+        self.key_slots = None
+
+        # The chunk size comes from the box header; sizing the workers like
+        # unlock avoids planning from a walk of the whole folder
+        _, self.max_workers = unlock_auto_config()
+        self.chunk_size = None
+        self.window = None
+        self.metrics = Metrics("update", self.output)
+        self.executor = executor
+        self.codec = None
+        self.members = None
+        self.dead = []
+        self.digests = {}
+        self.manifest = None
+
+        self.compact_threshold = compact_threshold
+        # Tree sidecars are rehashed from the first appended leaf only
+        self.checksum_scheme = SHA256_TREE
+        self.state_path = self.output + ".update"
+        self.flags = 0
+        self.entries = []
+        self._writer = None
+
+    def rollback(self):
+        """
+        Undo an interrupted update recorded in the state file
+
+        Returns: True if the box was rolled back
+        """
+        if not os.path.exists(self.state_path):
+            return False
+
+        with open(self.state_path, "r") as f:
+            size = json.load(f)["size"]
+
+        with open(self.output, "r+b") as f:
+            f.truncate(size)
+
+        os.remove(self.state_path)
+        logger.warning(f"Rolled back an unfinished update of {self.output}")
+        return True
+
+    def load_box(self):
+        """Read the chunk index and member table of the box"""
+        with Container(self.output) as container:
+            if container.version != VERSION or not container.is_complete():
+                raise ContainerError(f"{self.output} is not a complete v2 box")
+
+            meta = self.decrypt_meta(container)
+            if meta is None:
+                raise ContainerError("Box has no member table, lock it again to enable updates")
+
+            self.chunk_size = container.chunk_size
+            self.flags = container.flags
+            self.entries = list(container.index)
+
+            self.codec = self.box_codec(container, meta)
+
+        self.members = meta["members"]
+        self.dead = meta["dead"]
+
+    def plaintext_size(self):
+        return sum(length for _, length in self.entries)
+
+    def dead_ratio(self):
+        """Share of the box plaintext taken by dead members"""
+        total = self.plaintext_size()
+        if not total:
+            return 0.0
+        return sum(end - start for _, start, end, _, _ in self.dead) / total
+
+    def _full_path(self, name):
+        return os.path.join(self.folder, *name.split("/"))
+
+    def _arcname(self, path):
+        return os.path.relpath(path, self.folder).replace(os.sep, "/")
+
+    def diff(self, stat_cache=None, names=None):
+        """
+        Compare the folder with the member table
+
+        Args:
+            stat_cache: StatCache of the box; its rows replace the member
+                        table's size and mtime, and files whose stat data
+                        changed are hashed against it
+            names: Only compare these member names instead of walking the
+                   whole folder (the paths a watcher saw change)
+
+        Returns: (added, removed, modified) sets of member names
+        """
+        rows = stat_cache.load() if stat_cache is not None else {}
+        snapshot = {}
+
+        for name, _, _, size, mtime in self.members:
+            row = rows.get(name)
+            if row is None:
+                snapshot[self._full_path(name)] = (size, mtime)
+            else:
+                inode, size, mtime_ns = row
+                snapshot[self._full_path(name)] = (size, ns_to_mtime(mtime_ns), inode)
+
+        observer = FolderObserver(self.folder, initial_snapshot=snapshot, stat_cache=stat_cache)
+
+        if names is None:
+            changes = observer.check_differences()
+        else:
+            changes = observer.check_paths(self._full_path(name) for name in names)
+
+        return tuple({self._arcname(path) for path in paths} for paths in changes)
+
+    @contextmanager
+    def open_container(self, outpath, checkpoint=None):
+        """Write into the box being appended to, or a new container"""
+        if self._writer is not None:
+            yield self._writer
+            return
+
+        with super().open_container(outpath, checkpoint) as writer:
+            yield writer
+
+    def _checkpoint(self, fout, bytes_written, chunk_index):
+        """Appends are rolled back rather than resumed, so nothing is journaled"""
+        if self._writer is not None:
+            return
+        super()._checkpoint(fout, bytes_written, chunk_index)
+
+    def _encrypt_pipe(self, write, outpath, total_size):
+        """Encrypt whatever `write(pipe)` produces on a background thread"""
+        pipe = BoundedPipe(capacity=max(2 * self.chunk_size, TAR_BUFSIZE))
+        producer = start_producer(write, pipe)
+
+        try:
+            return self._encrypt_parallel(pipe, outpath, total_size, None, seekable=False)
+        finally:
+            pipe.close_reader()
+            producer.join()
+
+    def append(self, files):
+        """
+        Append a TAR segment holding `files` and the new member table
+
+        Args:
+            files: FileEntry list, may be empty when files were only removed
+
+        Returns: number of bytes added to the box
+        """
+        original_size = os.path.getsize(self.output)
+
+        with open(self.state_path, "w") as f:
+            json.dump({"size": original_size, "timestamp": time.time()}, f)
+
+        try:
+            with open(self.output, "r+b") as fout:
+                fout.seek(0, os.SEEK_END)
+                self._writer = ContainerWriter(fout, self.chunk_size, self.flags, self.entries)
+
+                if files:
+                    base = self.plaintext_size()
+                    self._encrypt_pipe(
+                        lambda pipe: write_tar_stream(files, pipe, self.members, base, self.digests),
+                        self.output,
+                        estimate_tar_size(files),
+                    )
+                else:
+                    self._writer.finish(self.encrypt_meta())
+
+                fout.flush()
+                os.fsync(fout.fileno())
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            self._writer = None
+
+        self._write_hash(original_size)
+        os.remove(self.state_path)
+        return os.path.getsize(self.output) - original_size
+
+    def _write_hash(self, changed_from):
+        """Rehash the box from the first appended byte, moving it to a tree sidecar"""
+        SafeBackupWriter(self.output).refresh_checksum(changed_from, scheme=self.checksum_scheme)
+
+    def update(self, names=None):
+        """
+        Append the changes in the folder to the box, then compact it once
+        the dead share passes `compact_threshold`
+
+        Args:
+            names: Member names known to have changed; None diffs the whole folder
+
+        Returns: stats dict
+        """
+        self.rollback()
+        self.load_box()
+
+        with StatCache(cache_path(self.output)) as stat_cache:
+            stats = self._apply_changes(stat_cache, names)
+
+        stats["dead_ratio"] = self.dead_ratio()
+        if stats["dead_ratio"] > self.compact_threshold:
+            logger.info(f"[+] Dead data at {stats['dead_ratio']:.0%}, compacting...")
+            self.compact()
+            stats["compacted"] = True
+
+        return stats
+
+    def _apply_changes(self, stat_cache, names=None):
+        """Append the folder's changes and record them in the stat cache"""
+        added, removed, modified = self.diff(stat_cache, names)
+        stats = {
+            "added": len(added),
+            "removed": len(removed),
+            "modified": len(modified),
+            "appended_bytes": 0,
+            "compacted": False,
+        }
+
+        if added or removed or modified:
+            gone = removed | modified
+            self.dead += [m for m in self.members if m[0] in gone]
+            self.members = [m for m in self.members if m[0] not in gone]
+
+            files = [stat_entry(self._full_path(name), name) for name in sorted(added | modified)]
+            self.digests = {}
+            stats["appended_bytes"] = self.append(files)
+
+            stat_cache.remove(removed)
+            stat_cache.update(
+                cache_row(entry, entry.arcname, self.digests.get(entry.arcname)) for entry in files
+            )
+            logger.info(
+                f"[✓] {self.output} updated: +{len(added)} ~{len(modified)} -{len(removed)}, "
+                f"{stats['appended_bytes']} bytes appended"
+            )
+        else:
+            logger.info(f"[✓] {self.output} is up to date")
+
+        return stats
+
+    def compact(self):
+        """
+        Rewrite the box with only its live members.
+
+        The TAR bytes of every live member (headers and padded data) are read
+        from the decrypted plaintext as they are and re-encrypted into a new
+        box, so the folder itself is not needed. The new box replaces the old
+        one through SafeBackupWriter.
+
+        Returns: number of bytes reclaimed
+        """
+        self.rollback()
+        self.load_box()
+
+        live = sorted(self.members, key=lambda m: m[1])
+        total_size = sum(end - start for _, start, end, _, _ in live) + 2 * TAR_BLOCK
+        original_size = os.path.getsize(self.output)
+
+        self.members = []
+        self.dead = []
+        aes = AESGCM(self.key)
+
+        if self.key_slots is None:
+            # Box from before key slots: the rewrite moves it to a random data key
+            self.key = new_data_key()
+
+        def copy_live(container, pipe):
+            reader = PlaintextReader(container, lambda frame: open_frame(aes, frame))
+            position = 0
+
+            for name, start, end, size, mtime in live:
+                reader.set_range(start, end)
+                while True:
+                    data = reader.read(TAR_BUFSIZE)
+                    if not data:
+                        break
+                    pipe.write(data)
+
+                self.members.append([name, position, position + end - start, size, mtime])
+                position += end - start
+
+            pipe.write(bytes(2 * TAR_BLOCK))  # end-of-archive marker
+
+        def encrypt_live(tmp_path, checkpoint):
+            with Container(self.output) as container:
+                return self._encrypt_pipe(lambda pipe: copy_live(container, pipe), tmp_path, total_size)
+
+        safe = SafeBackupWriter(self.output, self.checksum_scheme)
+        safe.write_backup(encrypt_live)
+
+        reclaimed = original_size - os.path.getsize(self.output)
+        logger.info(f"[✓] {self.output} compacted, {reclaimed} bytes reclaimed")
+        return reclaimed
@@ -0,0 +1,119 @@
+"""
+Integrity check of a box without unlocking it.
+
+Every AES-GCM frame is authenticated on a thread pool straight from the
+memory-mapped box and its plaintext is dropped, so nothing is written to
+disk. The `.sha256` sidecar is checked by a separate thread during the same
+run (a sha256-tree sidecar hashes its blocks in parallel as well).
+"""
+from .unlock import Unlock
+from .container import Container, ContainerError, open_frame
+from .checksum import hash_file
+from .logger import auto_logger
+from cryptography.exceptions import InvalidTag
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+
+logger = auto_logger()
+
+
+def authenticate_frame(aes, frame):
+    """Check the tag of one frame; the plaintext is discarded"""
+    open_frame(aes, frame)
+
+
+class Verifier(Unlock):
+    def verify(self, in_path=None, max_workers=None):
+        """
+        Authenticate every frame of a box and check its checksum sidecar
+
+        Args:
+            in_path: Box to check (defaults to the box named at construction)
+            max_workers: Verification threads (defaults to self.max_workers)
+
+        Returns: report dict {path, chunks, bytes, damaged [chunk indices],
+                 meta (False when the member table is damaged, None when
+                 there is none), checksum (None without a sidecar), scheme, ok}
+        """
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        in_path = in_path or self.data_file
+        workers = max_workers or self.max_workers
+        expected = self.read_checksum(in_path)
+        damaged = []
+
+        with ThreadPoolExecutor(max_workers=1) as hasher:
+            hashed = None
+            if expected is not None:
+                hashed = hasher.submit(hash_file, in_path, expected.scheme, expected.leaf_size)
+
+            with Container(in_path) as container:
+                aes = AESGCM(self.load_key(container))
+                chunks = len(container.index)
+                self._authenticate_parallel(container, aes, workers, damaged)
+                damaged.sort()
+                meta = self._verify_meta(container)
+                size = container.size
+
+            checksum = None
+            if hashed is not None:
+                checksum = hashed.result().hexdigest == expected.hexdigest
+
+        report = {
+            "path": in_path,
+            "chunks": chunks,
+            "bytes": size,
+            "damaged": damaged,
+            "meta": meta,
+            "checksum": checksum,
+            "scheme": expected.scheme if expected else None,
+            "ok": not damaged and meta is not False and checksum is not False,
+        }
+
+        if report["ok"]:
+            logger.info(f"[✓] {in_path}: {chunks} chunks authenticated")
+        else:
+            logger.error(
+                f"{in_path}: damaged chunks {damaged}, member table ok: {meta}, checksum ok: {checksum}"
+            )
+        return report
+
+    def _authenticate_parallel(self, container, aes, workers, damaged):
+        """
+        Authenticate frames on a thread pool, keeping at most 2 * workers in
+        flight; indices of frames that fail are appended to `damaged`
+        """
+        window = workers * 2
+        in_flight = deque()
+
+        def check_oldest():
+            chunk_index, future = in_flight.popleft()
+            try:
+                future.result()
+            except InvalidTag:
+                damaged.append(chunk_index)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk_index in range(len(container.index)):
+                try:
+                    frame = container.read_frame(chunk_index)
+                except ContainerError:
+                    damaged.append(chunk_index)
+                    continue
+
+                in_flight.append((chunk_index, executor.submit(authenticate_frame, aes, frame)))
+                if len(in_flight) >= window:
+                    check_oldest()
+
+            while in_flight:
+                check_oldest()
+
+    def _verify_meta(self, container):
+        """True when the member table authenticates, None without one (v1 boxes)"""
+        if container.read_meta() is None:
+            return None
+        try:
+            self.decrypt_meta(container)
+        except ContainerError:
+            return False
+        return True
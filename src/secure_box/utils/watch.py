@@ -0,0 +1,171 @@
+"""
+Keep a box in sync with its folder.
+
+FolderObserver collects filesystem events; changes are batched until the
+folder has been quiet for `debounce` seconds, or `max_lag` seconds after the
+first change of the batch at the latest. Each batch is applied with Updater,
+which appends only the changed files. Relocks are at least `min_interval`
+apart, so a steady stream of writes turns into one relock per interval
+instead of back-to-back ones.
+"""
+from .observer import FolderObserver
+from .update import Updater
+from .defaults import (
+    DEFAULT_COMPACT_THRESHOLD, DEFAULT_DEBOUNCE, DEFAULT_MAX_LAG, DEFAULT_MIN_INTERVAL,
+)
+from .logger import auto_logger
+import threading
+import time
+import os
+
+
+logger = auto_logger()
+
+POLL_INTERVAL = 0.2
+
+
+class Watcher:
+    def __init__(self, password, folder, name="data", debounce=DEFAULT_DEBOUNCE,
+                 max_lag=DEFAULT_MAX_LAG, min_interval=DEFAULT_MIN_INTERVAL,
+                 executor="thread", compact_threshold=DEFAULT_COMPACT_THRESHOLD, clock=time.monotonic):
+        """
+        Args:
+            debounce: Quiet seconds that close a batch
+            max_lag: Seconds after the first change of a batch by which it is
+                     relocked even if changes keep coming
+            min_interval: Minimum seconds between the start of two relocks
+            clock: Time source of the scheduling (tests)
+        """
+        if not os.path.exists(name + ".bin"):
+            raise FileNotFoundError(f"{name}.bin not found, lock the folder first")
+
+        self.password = password
+        self.folder = folder
+        self.name = name
+        self.debounce = debounce
+        self.max_lag = max_lag
+        self.min_interval = min_interval
+        self.executor = executor
+        self.compact_threshold = compact_threshold
+        self.clock = clock
+
+        self.observer = FolderObserver(folder)
+        self.pending = set()    # member names changed since the last relock
+        self.full_sync = True   # changes made while not watching are unknown
+        self.first_change = None
+        self.last_change = None
+        self.last_relock = None
+        self._seen_events = 0
+
+        self.metrics = {
+            "relocks": 0,
+            "failures": 0,
+            "files": 0,
+            "appended_bytes": 0,
+            "last_lag": 0.0,
+            "max_lag": 0.0,
+            "last_duration": 0.0,
+            "throughput": 0.0,  # appended bytes per second of the last relock
+        }
+
+    def _arcname(self, path):
+        return os.path.relpath(path, self.folder).replace(os.sep, "/")
+
+    def due(self, now):
+        """True when the current batch should be relocked at `now`"""
+        if self.last_relock is not None and now - self.last_relock < self.min_interval:
+            return False
+        if self.full_sync:
+            return True
+        if self.first_change is None:
+            return False
+
+        return (now - self.last_change >= self.debounce
+                or now - self.first_change >= self.max_lag)
+
+    def poll(self, now=None):
+        """
+        Note new events and relock when the batch is due
+
+        Returns: Updater stats of the relock, or None
+        """
+        if now is None:
+            now = self.clock()
+
+        events = self.observer.event_count
+        if events != self._seen_events:
+            self._seen_events = events
+            self.last_change = now
+            if self.first_change is None:
+                self.first_change = now
+
+        if not self.due(now):
+            return None
+        return self.relock(now)
+
+    def relock(self, now):
+        """Apply the batch of changes to the box"""
+        first_change = self.first_change
+        self.first_change = None
+        self.last_relock = now
+
+        for paths in self.observer.check_differences():
+            self.pending.update(self._arcname(path) for path in paths)
+
+        if not self.pending and not self.full_sync:
+            return None  # events without a net change (e.g. a file saved unchanged)
+
+        started = time.perf_counter()
+        try:
+            updater = Updater(
+                self.password, self.folder, self.name, executor=self.executor,
+                compact_threshold=self.compact_threshold,
+            )
+            stats = updater.update(None if self.full_sync else sorted(self.pending))
+        except Exception as e:
+            # The batch stays pending and is retried after min_interval
+            self.first_change = first_change if first_change is not None else now
+            self.metrics["failures"] += 1
+            logger.error(f"Relock of {self.name}.bin failed: {e}")
+            return None
+
+        duration = time.perf_counter() - started
+        lag = self.clock() - first_change if first_change is not None else 0.0
+        files = stats["added"] + stats["modified"] + stats["removed"]
+
+        self.pending.clear()
+        self.full_sync = False
+
+        metrics = self.metrics
+        metrics["relocks"] += 1
+        metrics["files"] += files
+        metrics["appended_bytes"] += stats["appended_bytes"]
+        metrics["last_lag"] = lag
+        metrics["max_lag"] = max(metrics["max_lag"], lag)
+        metrics["last_duration"] = duration
+        metrics["throughput"] = stats["appended_bytes"] / duration if duration else 0.0
+
+        logger.info(
+            f"[✓] Relocked {files} files, {stats['appended_bytes']} bytes in {duration:.2f}s "
+            f"(lag {lag:.1f}s, {metrics['throughput'] / 1024 / 1024:.1f} MB/s)"
+        )
+        return stats
+
+    def run(self, stop=None, poll_interval=POLL_INTERVAL):
+        """
+        Watch until `stop` (a threading.Event) is set or KeyboardInterrupt
+
+        Returns: metrics dict
+        """
+        stop = stop or threading.Event()
+        self.observer.start()
+        logger.info(f"[+] Watching {self.folder} for {self.name}.bin")
+
+        try:
+            while not stop.is_set():
+                self.poll()
+                stop.wait(poll_interval)
+        finally:
+            self.observer.stop()
+
+        return self.metrics
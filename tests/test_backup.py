@@ -1,8 +1,31 @@
 import pytest
 import os
 import json
-import time
 from secure_box.utils.backup import SafeBackupWriter
+from secure_box.utils.checksum import Checksum, hash_file
+from secure_box.utils.container import FRAME_HEADER, TAG_SIZE
+from secure_box.utils.journal import CheckpointJournal
+
+
+def write_partial(writer, frames, plain_length=100):
+    """
+    Partial output of `frames` well-formed (random) frames and their
+    checkpoint journal
+
+    Returns: size of the partial output
+    """
+    entries = []
+    with open(writer.partial_path, "wb") as f:
+        for _ in range(frames):
+            entries.append((f.tell(), plain_length))
+            enc = os.urandom(plain_length + TAG_SIZE)
+            f.write(len(enc).to_bytes(4, "big") + os.urandom(12) + enc)
+
+    journal = CheckpointJournal.from_frames(writer.journal_path, writer.partial_path, entries, FRAME_HEADER)
+    with open(writer.partial_path, "ab") as f:
+        journal.close(f)
+    return os.path.getsize(writer.partial_path)
+
 
 def test_backup_writer_initialization(temp_dir):
     out_path = os.path.join(temp_dir, "test.bin")
@@ -15,17 +38,13 @@ def test_backup_writer_initialization(temp_dir):
 
 
 
-def test_sha256_file(temp_dir):
+def test_hash_file(temp_dir):
     test_file = os.path.join(temp_dir, "test.txt")
     with open(test_file, "wb") as f:
         f.write(b"Hello World")
 
-    
-    writer = SafeBackupWriter("dummy")
-    hash_result = writer.sha256_file(test_file)
-
     expected = "a591a6d40bf420404a011733cfb7b190d62c65bf0bcda32b57b277d9ad9f146e"
-    assert hash_result == expected
+    assert hash_file(test_file).hexdigest == expected
 
 
 def test_write_state(temp_dir):
@@ -50,26 +69,39 @@ def test_checkpoint_save_and_load(temp_dir):
     out_path = os.path.join(temp_dir, "test.bin")
     writer = SafeBackupWriter(out_path)
 
-    writer.write_checkpoint(bytes_written=1024000, chunk_index=10)
-    
-    assert os.path.exists(writer.checkpoint_path)
+    size = write_partial(writer, frames=10, plain_length=1000)
+    assert os.path.exists(writer.journal_path)
 
     checkpoint = writer.load_checkpoint()
     assert checkpoint is not None
+    assert checkpoint["bytes_written"] == 10 * 1000
+    assert checkpoint["chunk_index"] == 10
+    assert checkpoint["output_offset"] == size
+    assert checkpoint["target"] == writer.partial_path
+
+
+def test_legacy_json_checkpoint_is_loaded(temp_dir):
+    out_path = os.path.join(temp_dir, "test.bin")
+    writer = SafeBackupWriter(out_path)
+
+    # Written by versions before the checkpoint journal
+    with open(writer.checkpoint_path, "w") as f:
+        json.dump({"bytes_written": 1024000, "chunk_index": 10, "target": out_path}, f)
+
+    checkpoint = writer.load_checkpoint()
     assert checkpoint["bytes_written"] == 1024000
     assert checkpoint["chunk_index"] == 10
-    assert checkpoint["target"] == out_path
 
 
 def test_checkpoint_clear(temp_dir):
     out_path = os.path.join(temp_dir, "test.bin")
     writer = SafeBackupWriter(out_path)
 
-    writer.write_checkpoint(1000, 5)
-    assert os.path.exists(writer.checkpoint_path)
+    write_partial(writer, frames=5)
+    assert os.path.exists(writer.journal_path)
 
     writer.clear_checkpoint()
-    assert not os.path.exists(writer.checkpoint_path)
+    assert not os.path.exists(writer.journal_path)
 
 
 
@@ -96,8 +128,7 @@ def test_write_backup_success(temp_dir):
     with open(writer.hash_path, "r") as f:
         saved_hash = f.read()
 
-    actual_hash = writer.sha256_file(out_path)
-    assert saved_hash == actual_hash
+    assert Checksum.parse(saved_hash) == hash_file(out_path)
 
 
 
@@ -105,23 +136,22 @@ def test_write_backup_with_resume(temp_dir):
     out_path = os.path.join(temp_dir, "backup.bin")
     writer = SafeBackupWriter(out_path)
 
-    writer.write_checkpoint(512, 1)
+    write_partial(writer, frames=1, plain_length=512)
     writer.write_state("in-progress")
 
     call_count = []
 
     def resume_writer(tmp_path, checkpoint):
         call_count.append(1)
-        if checkpoint:
-            assert checkpoint["bytes_written"] == 512
-            assert checkpoint["chunk_index"] == 1
+        assert checkpoint["bytes_written"] == 512
+        assert checkpoint["chunk_index"] == 1
         
-        with open(tmp_path, "wb") as f:
+        with open(tmp_path, "ab") as f:
             f.write(b"Resumed content")
     
     writer.write_backup(resume_writer, resume=True)
     assert len(call_count) == 1
-    assert not os.path.exists(writer.checkpoint_path)
+    assert not os.path.exists(writer.journal_path)
 
 
 def test_write_backup_failure_cleanup(temp_dir):
@@ -138,4 +168,26 @@ def test_write_backup_failure_cleanup(temp_dir):
         writer.write_backup(failing_writer)
 
 
-    assert not os.path.exists(out_path)
\ No newline at end of file
+    assert not os.path.exists(out_path)
+
+def test_resume_truncates_partial_output(temp_dir):
+    out_path = os.path.join(temp_dir, "backup.bin")
+    writer = SafeBackupWriter(out_path)
+
+    size = write_partial(writer, frames=2)
+    with open(writer.partial_path, "rb") as f:
+        checkpointed = f.read()
+    with open(writer.partial_path, "ab") as f:
+        f.write(b"garbage")
+
+    def resume_writer(tmp_path, checkpoint):
+        assert checkpoint["chunk_index"] == 2
+        assert os.path.getsize(tmp_path) == size
+        with open(tmp_path, "ab") as f:
+            f.write(b"-rest")
+
+    writer.write_backup(resume_writer, resume=True)
+
+    with open(out_path, "rb") as f:
+        assert f.read() == checkpointed + b"-rest"
+
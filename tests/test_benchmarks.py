@@ -0,0 +1,35 @@
+import os
+from bench_lock_unlock import bench_once, find_regressions
+from datasets import generate
+
+
+def row(stage, mb_s, peak_rss_mb):
+    return {
+        "dataset": "huge", "stage": stage, "chunk_size": 1024 * 1024, "workers": 4,
+        "compression": "none", "mb_s": mb_s, "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def test_find_regressions():
+    baseline = [row("lock", 100.0, 200.0), row("decrypt", 300.0, 100.0)]
+
+    # Within the threshold (and RSS growth below the slack) passes
+    assert find_regressions([row("lock", 95.0, 210.0), row("decrypt", 290.0, 110.0)], baseline, 0.1) == []
+
+    current = [row("lock", 80.0, 200.0), row("decrypt", 300.0, 150.0), row("verify", 1.0, 999.0)]
+    regressions = find_regressions(current, baseline, 0.1)
+    assert [(r["stage"], reason) for r, _, reason in regressions] == [
+        ("lock", "80.0 MB/s vs 100.0"),
+        ("decrypt", "peak RSS 150 MB vs 100"),
+    ]
+
+
+def test_bench_once_times_every_stage(temp_dir):
+    folder = os.path.join(temp_dir, "tiny")
+    size, files = generate("tiny", folder, 64 * 1024)
+
+    stages = bench_once("tiny", folder, size, files, 16 * 1024, 2, "none", temp_dir)
+
+    assert list(stages) == ["scan", "lock", "lock_tar", "verify", "decrypt", "extract"]
+    assert all(stage.wall > 0 for stage in stages.values())
+    assert sorted(os.listdir(temp_dir)) == ["tiny"]
@@ -0,0 +1,86 @@
+import pytest
+import os
+import tracemalloc
+from secure_box.utils.buffers import BufferPool, write_buffers
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+
+
+CHUNK = 64 * 1024
+
+
+def test_buffer_pool_reuses_buffers():
+    pool = BufferPool(1024, 2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert len(first) == 1024 and first is not second
+
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+@pytest.mark.skipif(not hasattr(os, "writev"), reason="no os.writev")
+def test_write_buffers_handles_partial_writes(temp_dir, monkeypatch):
+    writev = os.writev
+
+    def short_writev(fd, buffers):
+        # Never write more than 5 bytes per call
+        return writev(fd, [bytes(buffers[0][:5])])
+
+    monkeypatch.setattr(os, "writev", short_writev)
+
+    path = os.path.join(temp_dir, "out")
+    with open(path, "wb") as f:
+        f.write(b"head:")
+        write_buffers(f, [b"abc", memoryview(b"defghijkl"), bytearray(b"mn")])
+        f.write(b":tail")
+
+    with open(path, "rb") as f:
+        assert f.read() == b"head:abcdefghijklmn:tail"
+
+
+def measure_peak(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_memory_per_chunk_is_constant(workers, temp_dir, test_password):
+    """One worker: the serial paths; two: ThreadBackend and _decrypt_parallel"""
+    window = workers * 2
+    locker = Lock(test_password, temp_dir, os.path.join(temp_dir, "box"))
+    locker.chunk_size = CHUNK
+    locker.max_workers = workers
+    locker.window = window
+
+    peaks = {}
+    for chunks in (8, 16, 64):
+        src = os.path.join(temp_dir, f"plain{chunks}")
+        enc = os.path.join(temp_dir, f"box{chunks}.bin")
+        with open(src, "wb") as f:
+            f.write(os.urandom(chunks * CHUNK))
+
+        if workers == 1:
+            encrypt = measure_peak(lambda: locker.encrypt_stream(src, enc))
+        else:
+            encrypt = measure_peak(lambda: locker.encrypt_stream_parallel(src, enc))
+
+        unlocker = Unlock(test_password, os.path.join(temp_dir, f"box{chunks}"), max_workers=workers)
+        with open(os.devnull, "wb") as devnull:
+            decrypt = measure_peak(lambda: unlocker.decrypt_to(enc, devnull))
+
+        peaks[chunks] = encrypt, decrypt
+
+    # The first run pays for one-time setup (imports, key slots); then a
+    # pooled buffer per chunk in flight, plus its frame while encrypting
+    for encrypt, decrypt in (peaks[16], peaks[64]):
+        assert encrypt < (2 * window + 3) * CHUNK
+        assert decrypt < (window + 2) * CHUNK
+
+    # Four times the chunks, not four times the memory
+    assert peaks[64][0] - peaks[16][0] < CHUNK
+    assert peaks[64][1] - peaks[16][1] < CHUNK
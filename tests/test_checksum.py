@@ -0,0 +1,94 @@
+import pytest
+import os
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+from secure_box.utils.backup import SafeBackupWriter
+from secure_box.utils import checksum as checksum_module
+from secure_box.utils.checksum import (
+    Checksum, TreeHasher, SHA256, SHA256_TREE, hash_file, rehash_file, read_checksum, write_checksum,
+)
+
+
+def lock_box(folder, output_path, password, checksum):
+    locker = Lock(password, folder, output_path, checksum=checksum)
+    locker.chunk_size = 1024
+    locker.run(stream=True)
+    return output_path + ".bin"
+
+
+@pytest.mark.parametrize("scheme", [SHA256, SHA256_TREE])
+def test_inline_checksum_matches_file(scheme, sample_folder, test_password, temp_dir):
+    box = lock_box(sample_folder, os.path.join(temp_dir, "box"), test_password, scheme)
+
+    saved = read_checksum(box + ".sha256")
+    assert saved.scheme == scheme
+    assert saved == hash_file(box, scheme)
+
+
+def test_tree_hasher_matches_parallel_hash(temp_dir):
+    path = os.path.join(temp_dir, "data")
+    data = os.urandom(10 * 1000 + 7)
+    with open(path, "wb") as f:
+        f.write(data)
+
+    hasher = TreeHasher(leaf_size=1000)
+    for start in range(0, len(data), 333):
+        hasher.update(data[start:start + 333])
+
+    checksum = hash_file(path, SHA256_TREE, leaf_size=1000, workers=4)
+    assert checksum.hexdigest == hasher.hexdigest()
+    assert checksum.format() == f"sha256-tree:1000 {checksum.hexdigest}\n"
+    assert Checksum.parse(checksum.format()) == checksum
+
+
+def test_rehash_reuses_saved_leaves(temp_dir, monkeypatch):
+    path = os.path.join(temp_dir, "data")
+    with open(path, "wb") as f:
+        f.write(os.urandom(10 * 1000 + 7))
+    hash_path = path + ".sha256"
+    write_checksum(hash_path, hash_file(path, SHA256_TREE, leaf_size=1000))
+
+    with open(path, "ab") as f:
+        f.write(os.urandom(2500))
+    expected = hash_file(path, SHA256_TREE, leaf_size=1000)
+
+    hashed = []
+    hash_leaf = checksum_module._hash_leaf
+    monkeypatch.setattr(checksum_module, "_hash_leaf",
+                        lambda fd, offset, length: hashed.append(offset) or hash_leaf(fd, offset, length))
+
+    current = read_checksum(hash_path)
+    assert len(current.leaves) == 11
+    assert rehash_file(path, current, 10 * 1000 + 7, workers=1) == expected
+    assert hashed == [10000, 11000, 12000]
+
+    # Leaves that do not add up to the sidecar's root are not trusted
+    with open(hash_path + ".leaves", "wb") as f:
+        f.write(bytes(32 * 11))
+    assert read_checksum(hash_path).leaves is None
+
+
+def test_legacy_sidecar_is_sha256(temp_dir):
+    checksum = Checksum.parse("ab" * 32)
+    assert checksum.scheme == SHA256
+    assert checksum.leaf_size is None
+
+    with pytest.raises(ValueError, match="Unknown checksum scheme"):
+        Checksum.parse("md5 " + "ab" * 16)
+
+
+def test_tree_box_is_verified_on_unlock(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    box = lock_box(sample_folder, output_path, test_password, SHA256_TREE)
+
+    unlocker = Unlock(test_password, output_path)
+    assert unlocker.decrypt_extract(box, os.path.join(temp_dir, "out")) == 3
+
+    # Resuming or updating keeps the scheme the box was locked with
+    SafeBackupWriter(box).refresh_checksum()
+    assert read_checksum(box + ".sha256").scheme == SHA256_TREE
+
+    with open(box + ".sha256", "w") as f:
+        f.write(f"sha256-tree:4194304 {'0' * 64}\n")
+    with pytest.raises(ValueError, match="sha256-tree checksum"):
+        unlocker.decrypt_extract(box, os.path.join(temp_dir, "bad"))
@@ -0,0 +1,45 @@
+import subprocess
+import sys
+import os
+
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Cold start of `import secure_box.cli`, best of a few runs
+IMPORT_BUDGET_MS = 200
+HEAVY_MODULES = ("cryptography", "rich", "psutil", "yaml", "watchdog", "loguru")
+
+
+def run_python(args, cwd=None):
+    env = dict(os.environ, PYTHONPATH=SRC)
+    return subprocess.run(
+        [sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def cli_import_ms():
+    result = run_python(["-X", "importtime", "-c", "import secure_box.cli"])
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "secure_box.cli":
+            return int(fields[1]) / 1000
+    raise AssertionError("secure_box.cli missing from -X importtime output")
+
+
+def test_cli_import_budget():
+    assert min(cli_import_ms() for _ in range(3)) < IMPORT_BUDGET_MS
+
+
+def test_cli_import_skips_heavy_modules():
+    result = run_python(["-c", (
+        "import sys, secure_box.cli; "
+        "print(' '.join(sorted({m.split('.')[0] for m in sys.modules})))"
+    )])
+    loaded = set(result.stdout.split())
+    assert loaded.isdisjoint(HEAVY_MODULES)
+
+
+def test_trivial_command_leaves_no_logs(temp_dir):
+    result = run_python(["-m", "secure_box.cli", "success"], cwd=temp_dir)
+    assert "Successfully initialized" in result.stdout
+    assert os.listdir(temp_dir) == []
@@ -0,0 +1,33 @@
+import pytest
+import os
+from secure_box.utils.compress import (
+    compress_chunk, decompress_chunk, get_codec, available_codecs,
+    CODEC_NONE, CODEC_LZMA,
+)
+
+
+@pytest.mark.parametrize("name", available_codecs())
+def test_compress_roundtrip(name):
+    codec = get_codec(name)
+    data = b"secure box " * 20000
+
+    used, payload = compress_chunk(codec, data)
+    if codec != CODEC_NONE:
+        assert used == codec
+        assert len(payload) < len(data)
+
+    assert decompress_chunk(used, payload) == data
+
+
+def test_incompressible_chunk_is_stored_raw():
+    data = os.urandom(256 * 1024)
+
+    used, payload = compress_chunk(CODEC_LZMA, data)
+
+    assert used == CODEC_NONE
+    assert payload is data
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("brotli")
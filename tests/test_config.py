@@ -37,3 +37,48 @@ def test_getSystemDetails():
 
 
     
+
+
+def test_unlock_auto_config():
+    from secure_box.utils.config import unlock_auto_config
+
+    chunk_size, max_workers = unlock_auto_config()
+
+    assert chunk_size >= 4 * 1024 * 1024
+    assert max_workers >= 1
+
+
+def test_plan_keeps_every_worker_busy():
+    from secure_box.utils.config import plan_lock, CHUNKS_PER_WORKER
+
+    # 1 GB on 16 cores used to become two 512 MB chunks
+    plan = plan_lock(1024**3, 10, 16, 32 * 1024**3)
+    assert plan.max_workers == 16
+    assert 1024**3 // plan.chunk_size >= 16 * CHUNKS_PER_WORKER
+    assert plan.window == 32
+
+    # Tiny inputs stay at the minimum chunk
+    assert plan_lock(10 * 1024, 3, 8, 16 * 1024**3).chunk_size == 1024 * 1024
+
+
+def test_plan_fits_memory_budget():
+    from secure_box.utils.config import plan_lock, MEMORY_FRACTION
+
+    available = 64 * 1024**2
+    plan = plan_lock(1024**3, 10, 16, available)
+
+    assert plan.max_workers < 16
+    assert plan.window * plan.chunk_size * 2 <= available * MEMORY_FRACTION
+    assert any("workers cut" in reason for reason in plan.reasons)
+
+
+def test_manual_plan(monkeypatch):
+    import secure_box.utils.config as config
+
+    monkeypatch.setattr(config, "load_config", lambda: {
+        "mode": "manual", "manual": {"chunk_size": 16, "max_workers": 3}
+    })
+    plan = config.lock_plan(".")
+
+    assert (plan.chunk_size, plan.max_workers, plan.window) == (16 * 1024 * 1024, 3, 6)
+    assert "manual" in config.explain(plan)
@@ -0,0 +1,81 @@
+import pytest
+import os
+from secure_box.utils.container import (
+    Container, ContainerWriter, ContainerError, HEADER, INDEX_ENTRY, TRAILER, TAG_SIZE,
+)
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+
+
+def make_frame(payload_length):
+    enc = os.urandom(payload_length + TAG_SIZE)
+    return len(enc).to_bytes(4, "big") + os.urandom(12) + enc
+
+
+def test_writer_header_index_and_trailer(temp_dir):
+    path = os.path.join(temp_dir, "box.bin")
+
+    with open(path, "wb") as f:
+        writer = ContainerWriter(f, chunk_size=100)
+        writer.write_header()
+        for length in (100, 100, 42):
+            writer.write_frame(make_frame(length), length)
+        writer.finish()
+
+    with Container(path) as container:
+        assert container.version == 2
+        assert container.chunk_size == 100
+        assert container.is_complete()
+        assert [length for _, length in container.index] == [100, 100, 42]
+        assert container.plaintext_size() == 242
+
+        second_offset = HEADER.size + 4 + 12 + 100 + TAG_SIZE
+        assert container.index[1][0] == second_offset
+        assert len(container.read_frame(2).data) == 42 + TAG_SIZE
+
+    assert os.path.getsize(path) == container.index_offset + 3 * INDEX_ENTRY.size + TRAILER.size
+
+
+def test_truncated_container_is_detected(temp_dir):
+    path = os.path.join(temp_dir, "box.bin")
+
+    with open(path, "wb") as f:
+        writer = ContainerWriter(f, chunk_size=100)
+        writer.write_header()
+        writer.write_frame(make_frame(100), 100)
+        writer.finish()
+
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+
+    with Container(path) as container:
+        assert not container.is_complete()
+        with pytest.raises(ContainerError, match="truncated"):
+            container.index
+
+
+def test_unlock_reads_v1_files(temp_dir, test_password):
+    data = os.urandom(2500)
+    locker = Lock(test_password, temp_dir, os.path.join(temp_dir, "legacy"))
+
+    # v1: bare frames, no header or footer
+    v1_path = os.path.join(temp_dir, "legacy.bin")
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    aes = AESGCM(locker.password_to_key(test_password))
+    with open(v1_path, "wb") as f:
+        for i in range(0, len(data), 1000):
+            nonce = os.urandom(12)
+            enc = aes.encrypt(nonce, data[i:i + 1000], None)
+            f.write(len(enc).to_bytes(4, "big") + nonce + enc)
+
+    with Container(v1_path) as container:
+        assert container.version == 1
+        assert container.is_complete()
+        assert len(container.index) == 3
+
+    unlocker = Unlock(test_password, os.path.join(temp_dir, "legacy"))
+    out = os.path.join(temp_dir, "legacy.out")
+    unlocker.decrypt_stream(v1_path, out, unlocker.key)
+
+    with open(out, "rb") as f:
+        assert f.read() == data
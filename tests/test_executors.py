@@ -0,0 +1,39 @@
+import pytest
+import os
+from secure_box.utils.executors import resolve_executor, gil_enabled
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+
+
+def test_resolve_executor():
+    assert resolve_executor("thread", 8) == "thread"
+    assert resolve_executor("process", 8) == "process"
+    assert resolve_executor("auto", 1) == "thread"
+
+    expected = "process" if gil_enabled() else "thread"
+    assert resolve_executor("auto", 8) == expected
+
+    with pytest.raises(ValueError):
+        resolve_executor("fibers", 4)
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_backend_roundtrip(executor, temp_dir, test_password):
+    src = os.path.join(temp_dir, "plain.bin")
+    data = os.urandom(20 * 4096 + 17)
+    with open(src, "wb") as f:
+        f.write(data)
+
+    locker = Lock(test_password, temp_dir, os.path.join(temp_dir, "box"), executor=executor)
+    locker.chunk_size = 4096
+    locker.max_workers = 2
+
+    enc = os.path.join(temp_dir, "box.bin")
+    locker.encrypt_stream_parallel(src, enc)
+
+    unlocker = Unlock(test_password, os.path.join(temp_dir, "box"))
+    dec = os.path.join(temp_dir, "box.out")
+    unlocker.decrypt_stream(enc, dec, unlocker.key)
+
+    with open(dec, "rb") as f:
+        assert f.read() == data
@@ -0,0 +1,123 @@
+import pytest
+import os
+from secure_box.utils import journal
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+from secure_box.utils.backup import SafeBackupWriter
+from secure_box.utils.container import Container
+from secure_box.utils.journal import CheckpointJournal, JOURNAL_MAGIC, JOURNAL_RECORD
+
+
+def crashing_lock(folder, output_path, password, crash_after):
+    """Lock that dies after `crash_after` frames, leaving the partial output"""
+    locker = Lock(password, folder, output_path)
+    locker.chunk_size = 1024
+    locker.max_workers = 2
+    checkpoint = locker._checkpoint
+
+    def crash(fout, bytes_written, chunk_index):
+        checkpoint(fout, bytes_written, chunk_index)
+        if chunk_index == crash_after:
+            raise IOError("power cut")
+
+    locker._checkpoint = crash
+    with pytest.raises(IOError, match="power cut"):
+        locker.run(stream=True)
+    return locker
+
+
+def unlock_names(output_path, password, out_dir):
+    unlocker = Unlock(password, output_path)
+    unlocker.decrypt_extract(output_path + ".bin", out_dir)
+    return sorted(os.listdir(out_dir))
+
+
+def test_resume_from_journal(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    crashing_lock(sample_folder, output_path, test_password, crash_after=2)
+
+    safe = SafeBackupWriter(output_path + ".bin")
+    checkpoint = CheckpointJournal.recover(safe.journal_path, safe.partial_path)
+    assert checkpoint["chunk_index"] == 2
+    assert checkpoint["bytes_written"] == 2 * 1024
+    assert len(checkpoint["entries"]) == 2
+
+    # A torn frame after the last journaled one, and a record for a frame
+    # that never reached the disk
+    with open(safe.partial_path, "ab") as f:
+        f.write(b"torn frame")
+    with open(safe.journal_path, "ab") as f:
+        f.write(JOURNAL_RECORD.pack(2, checkpoint["output_offset"], checkpoint["output_offset"] + 100,
+                                    3 * 1024, 1024, bytes(16)))
+
+    locker = Lock(test_password, sample_folder, output_path)
+    locker.chunk_size = 1024
+    locker.run(stream=True, resume=True)
+
+    assert not os.path.exists(safe.journal_path)
+    assert unlock_names(output_path, test_password, os.path.join(temp_dir, "out")) == [
+        "file0.txt", "file1.txt", "file2.txt"
+    ]
+    with open(os.path.join(temp_dir, "out", "file2.txt")) as f:
+        assert f.read() == "Content 2\n" * 50
+
+
+def test_resume_after_folder_changed_starts_over(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    crashing_lock(sample_folder, output_path, test_password, crash_after=2)
+
+    # The first file is already in the partial output; rewrite it
+    with open(os.path.join(sample_folder, "file0.txt"), "w") as f:
+        f.write("Changed\n" * 80)
+
+    locker = Lock(test_password, sample_folder, output_path)
+    locker.chunk_size = 1024
+    locker.run(stream=True, resume=True)
+
+    unlock_names(output_path, test_password, os.path.join(temp_dir, "out"))
+    with open(os.path.join(temp_dir, "out", "file0.txt")) as f:
+        assert f.read() == "Changed\n" * 80
+    with open(os.path.join(temp_dir, "out", "file2.txt")) as f:
+        assert f.read() == "Content 2\n" * 50
+
+
+def test_recover_walks_back_to_verified_frame(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    crashing_lock(sample_folder, output_path, test_password, crash_after=3)
+    safe = SafeBackupWriter(output_path + ".bin")
+
+    # The last frame lost its tail: its record no longer verifies
+    size = os.path.getsize(safe.partial_path)
+    with open(safe.partial_path, "r+b") as f:
+        f.truncate(size - 5)
+
+    checkpoint = safe.load_checkpoint()
+    assert checkpoint["chunk_index"] == 2
+    assert os.path.getsize(safe.journal_path) == len(JOURNAL_MAGIC) + 2 * JOURNAL_RECORD.size
+
+    with open(safe.journal_path, "r+b") as f:
+        f.write(b"XXXX")
+    assert CheckpointJournal.recover(safe.journal_path, safe.partial_path) is None
+
+
+def test_fsyncs_are_batched(sample_folder, test_password, temp_dir, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def counting_fsync(fd):
+        synced.append(fd)
+        fsync(fd)
+
+    monkeypatch.setattr(journal.os, "fsync", counting_fsync)
+
+    output_path = os.path.join(temp_dir, "box")
+    locker = Lock(test_password, sample_folder, output_path)
+    locker.chunk_size = 64
+    locker.run(stream=True)
+
+    with Container(output_path + ".bin") as container:
+        frames = len(container.index)
+
+    # Output and journal once per batch of 64 frames, plus the final batch
+    assert frames == 160
+    assert len(synced) == 2 * 3
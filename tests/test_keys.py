@@ -0,0 +1,107 @@
+import pytest
+import os
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+from secure_box.utils.container import Container, ContainerError
+from secure_box.utils.keys import add_password, change_password, remove_password
+from secure_box.utils import checksum as checksum_module
+from secure_box.utils.checksum import SHA256_TREE, hash_file, read_checksum, write_checksum
+
+
+def lock_box(folder, output_path, password):
+    locker = Lock(password, folder, output_path)
+    locker.run(stream=True)
+    return output_path + ".bin"
+
+
+def decrypt(output_path, password, temp_dir):
+    unlocker = Unlock(password, output_path, max_workers=1)
+    out = os.path.join(temp_dir, "out.tar")
+    unlocker.decrypt_stream(output_path + ".bin", out, unlocker.key)
+    with open(out, "rb") as f:
+        return f.read()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_chunks_use_random_data_key(sample_folder, test_password, temp_dir):
+    first = lock_box(sample_folder, os.path.join(temp_dir, "a"), test_password)
+    second = lock_box(sample_folder, os.path.join(temp_dir, "b"), test_password)
+
+    with Container(first) as a, Container(second) as b:
+        assert a.read_key_slots() != b.read_key_slots()
+        unlocker = Unlock(test_password, os.path.join(temp_dir, "a"))
+        assert unlocker.load_key(a) != unlocker.password_to_key(test_password)
+
+
+def test_change_password_rewrites_only_the_header(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    path = lock_box(sample_folder, output_path, test_password)
+    plain = decrypt(output_path, test_password, temp_dir)
+    before = read(path)
+
+    change_password(path, test_password, "new password")
+
+    after = read(path)
+    with Container(path) as container:
+        data_offset = container.data_offset
+    assert len(after) == len(before)
+    assert after[data_offset:] == before[data_offset:]
+
+    assert decrypt(output_path, "new password", temp_dir) == plain
+    with pytest.raises(ContainerError, match="Password is wrong"):
+        decrypt(output_path, test_password, temp_dir)
+
+
+def test_change_password_rehashes_only_the_slot_leaf(sample_folder, test_password, temp_dir, monkeypatch):
+    output_path = os.path.join(temp_dir, "box")
+    path = lock_box(sample_folder, output_path, test_password)
+    write_checksum(path + ".sha256", hash_file(path, SHA256_TREE, leaf_size=1000))
+
+    hashed = []
+    hash_leaf = checksum_module._hash_leaf
+    monkeypatch.setattr(checksum_module, "_hash_leaf",
+                        lambda fd, offset, length: hashed.append(offset) or hash_leaf(fd, offset, length))
+
+    change_password(path, test_password, "new password")
+    assert hashed == [0]
+
+    monkeypatch.undo()
+    assert read_checksum(path + ".sha256") == hash_file(path, SHA256_TREE, leaf_size=1000)
+
+
+def test_several_passwords(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    path = lock_box(sample_folder, output_path, test_password)
+    plain = decrypt(output_path, test_password, temp_dir)
+
+    add_password(path, test_password, "second")
+    assert decrypt(output_path, "second", temp_dir) == plain
+    assert decrypt(output_path, test_password, temp_dir) == plain
+
+    with pytest.raises(ContainerError):
+        add_password(path, "wrong", "third")
+
+    remove_password(path, test_password)
+    assert decrypt(output_path, "second", temp_dir) == plain
+    with pytest.raises(ContainerError):
+        decrypt(output_path, test_password, temp_dir)
+
+    with pytest.raises(ContainerError, match="only password"):
+        remove_password(path, "second")
+
+
+def test_box_without_key_slots(temp_dir, test_password):
+    from secure_box.utils.container import ContainerWriter
+
+    path = os.path.join(temp_dir, "legacy.bin")
+    with open(path, "wb") as f:
+        writer = ContainerWriter(f, 1024)
+        writer.write_header()
+        writer.finish()
+
+    with pytest.raises(ContainerError, match="no key slots"):
+        change_password(path, test_password, "new")
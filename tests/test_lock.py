@@ -48,4 +48,140 @@ def test_lock_and_unlock_cycle(sample_folder, test_password, temp_dir):
     unlocker.decrypt_stream(enc_file, dec_file, unlocker.key)
 
     assert os.path.exists(dec_file)
-    assert os.path.getsize(dec_file) > 0
\ No newline at end of file
+    assert os.path.getsize(dec_file) > 0
+
+def test_lock_stream_without_tar(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "streamed")
+
+    locker = Lock(test_password, sample_folder, output_path)
+    locker.run(stream=True)
+
+    assert os.path.exists(output_path + ".bin")
+    assert not os.path.exists(output_path + ".tar")
+
+    from secure_box.utils.unlock import Unlock
+    import tarfile
+
+    unlocker = Unlock(test_password, output_path)
+    dec_file = os.path.join(temp_dir, "decrypted.tar")
+    unlocker.decrypt_stream(output_path + ".bin", dec_file, unlocker.key)
+
+    with tarfile.open(dec_file) as tar:
+        names = sorted(tar.getnames())
+    assert names == ["file0.txt", "file1.txt", "file2.txt"]
+
+
+
+def test_lock_stream_resume(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "resumed")
+
+    locker = Lock(test_password, sample_folder, output_path)
+    locker.chunk_size = 1024
+    locker.max_workers = 2
+    locker.run(stream=True)
+
+    with open(output_path + ".bin", "rb") as f:
+        full = f.read()
+
+    # Simulate a crash: the partial output holds the header, the first 3
+    # frames and half of a 4th one that was never checkpointed
+    from secure_box.utils.container import Container
+    with Container(output_path + ".bin") as container:
+        frames_end = container.data_offset
+    for _ in range(3):
+        frames_end += 4 + 12 + int.from_bytes(full[frames_end:frames_end + 4], "big")
+
+    from secure_box.utils.backup import SafeBackupWriter
+    from secure_box.utils.journal import CheckpointJournal
+    from secure_box.utils.container import FRAME_HEADER
+    safe = SafeBackupWriter(output_path + ".bin")
+    with open(safe.partial_path, "wb") as f:
+        f.write(full[:frames_end + 100])
+    with Container(output_path + ".bin") as container:
+        entries = list(container.index)[:3]
+    journal = CheckpointJournal.from_frames(safe.journal_path, safe.partial_path, entries, FRAME_HEADER)
+    with open(safe.partial_path, "ab") as f:
+        journal.close(f)
+    os.remove(output_path + ".bin")
+
+    locker.run(stream=True, resume=True)
+
+    with open(output_path + ".bin", "rb") as f:
+        assert f.read()[:frames_end] == full[:frames_end]
+
+    from secure_box.utils.unlock import Unlock
+    unlocker = Unlock(test_password, output_path)
+    first = os.path.join(temp_dir, "resumed.tar")
+    unlocker.decrypt_stream(output_path + ".bin", first, unlocker.key)
+
+    import tarfile
+    with tarfile.open(first) as tar:
+        assert sorted(tar.getnames()) == ["file0.txt", "file1.txt", "file2.txt"]
+        assert tar.extractfile("file1.txt").read() == b"Content 1\n" * 50
+
+
+def test_parallel_encrypt_keeps_chunk_order(temp_dir, test_password):
+    import random
+    import time
+
+    src = os.path.join(temp_dir, "plain.bin")
+    data = os.urandom(64 * 1000 + 123)
+    with open(src, "wb") as f:
+        f.write(data)
+
+    locker = Lock(test_password, temp_dir, os.path.join(temp_dir, "ordered"))
+    locker.chunk_size = 1000
+    locker.max_workers = 4
+
+    encrypt_chunk = locker._encrypt_chunk
+
+    def slow_encrypt(chunk_data, chunk_index):
+        # Finish chunks out of order on purpose
+        time.sleep(random.random() / 200)
+        return encrypt_chunk(chunk_data, chunk_index)
+
+    locker._encrypt_chunk = slow_encrypt
+
+    enc = os.path.join(temp_dir, "ordered.bin")
+    locker.encrypt_stream_parallel(src, enc)
+
+    from secure_box.utils.unlock import Unlock
+    unlocker = Unlock(test_password, os.path.join(temp_dir, "ordered"))
+    dec = os.path.join(temp_dir, "ordered.out")
+    unlocker.decrypt_stream(enc, dec, unlocker.key)
+
+    with open(dec, "rb") as f:
+        assert f.read() == data
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_lock_with_compression(executor, temp_dir, test_password):
+    folder = os.path.join(temp_dir, "data")
+    os.makedirs(folder)
+    with open(os.path.join(folder, "text.txt"), "w") as f:
+        f.write("compress me\n" * 20000)
+    with open(os.path.join(folder, "random.bin"), "wb") as f:
+        f.write(os.urandom(100 * 1024))
+
+    output_path = os.path.join(temp_dir, "packed")
+    locker = Lock(test_password, folder, output_path, executor=executor, compression="zlib")
+    locker.chunk_size = 64 * 1024
+    locker.max_workers = 2
+    locker.run(stream=True)
+
+    from secure_box.utils.container import Container, FLAG_CODECS
+    from secure_box.utils.compress import CODEC_NONE, CODEC_ZLIB
+    with Container(output_path + ".bin") as container:
+        assert container.flags & FLAG_CODECS
+        codecs = {container.read_frame(i).codec for i in range(len(container.index))}
+    assert codecs == {CODEC_NONE, CODEC_ZLIB}
+    assert os.path.getsize(output_path + ".bin") < 240 * 1024 + 100 * 1024
+
+    from secure_box.utils.unlock import Unlock
+    import tarfile
+    unlocker = Unlock(test_password, output_path, max_workers=2)
+    dec_file = os.path.join(temp_dir, "packed.tar")
+    unlocker.decrypt_stream(output_path + ".bin", dec_file, unlocker.key)
+
+    with tarfile.open(dec_file) as tar:
+        assert tar.extractfile("text.txt").read() == b"compress me\n" * 20000
@@ -22,4 +22,49 @@ def test_auto_logger_creates_log_file(temp_dir, monkeypatch):
 def test_auto_logger_multiple_calls():
     logger1 = auto_logger()
     logger2 = auto_logger()
-    assert logger1 is logger2
\ No newline at end of file
+    assert logger1 is logger2
+
+def test_rate_limiter():
+    from secure_box.utils.logger import RateLimiter
+
+    now = [0.0]
+    limiter = RateLimiter(interval=5, clock=lambda: now[0])
+    assert limiter.ready("chunk")
+    assert not limiter.ready("chunk")
+    assert not limiter.ready("chunk")
+    assert limiter.ready("other")
+
+    now[0] = 5
+    assert limiter.suppressed("chunk") == 2
+    assert limiter.ready("chunk")
+    assert limiter.suppressed("chunk") == 0
+
+    delayed = RateLimiter(interval=5, clock=lambda: now[0], delay_first=True)
+    assert not delayed.ready()
+    now[0] = 10
+    assert delayed.ready()
+
+
+@pytest.mark.parametrize("log_format", ["text", "json"])
+def test_module_log_file_is_queued_and_filtered(log_format, temp_dir, monkeypatch):
+    import secure_box.utils.logger as logger_module
+    monkeypatch.setattr(logger_module, "LOG_DIR", temp_dir)
+    monkeypatch.setattr(logger_module, "LOG_FORMAT", log_format)
+    monkeypatch.setattr(logger_module, "_sinks", {})
+
+    logger = auto_logger()
+    logger.info("from the test module")
+    logger.patch(lambda record: record.update(name="elsewhere")).info("from another module")
+    logger.complete()
+
+    for handler_id in logger_module._sinks.values():
+        logger.remove(handler_id)
+
+    with open(os.path.join(temp_dir, "test_logger.log")) as f:
+        content = f.read()
+    assert "from the test module" in content
+    assert "from another module" not in content
+    if log_format == "json":
+        import json
+        record = json.loads(content.splitlines()[0])["record"]
+        assert record["message"] == "from the test module"
@@ -0,0 +1,56 @@
+import json
+import os
+from secure_box.utils.lock import Lock
+from secure_box.utils.metrics import Metrics
+
+
+def test_lock_records_stages(sample_folder, test_password, temp_dir):
+    locker = Lock(test_password, sample_folder, os.path.join(temp_dir, "box"))
+    locker.chunk_size = 1024
+    locker.max_workers = 2
+    locker.run(stream=True)
+
+    stats = locker.metrics.to_dict()
+    for stage in ("scan", "tar", "read", "encrypt", "write", "pipeline"):
+        assert stage in stats["stages"]
+
+    stages = stats["stages"]
+    assert stages["encrypt"]["bytes"] == stages["write"]["bytes"] == stages["read"]["bytes"]
+    assert stages["encrypt"]["calls"] == stages["write"]["calls"]
+    assert stages["tar"]["bytes"] == stats["input_bytes"] == 3 * len("Content 0\n" * 50)
+    assert "checksum" not in stages   # hashed inline
+    assert stats["queues"]["chunks_in_flight"]["max"] <= 2 * 2
+    assert 0 < stats["worker_utilisation"] <= 1
+    assert stats["peak_rss_bytes"] > 0
+    assert stats["wall_s"] > 0
+
+
+def test_json_and_prometheus_export(temp_dir):
+    metrics = Metrics("lock", os.path.join(temp_dir, "box.bin"))
+    metrics.info["workers"] = 2
+    metrics.start()
+    metrics.add("pipeline", 1.0, 0.5)
+    metrics.add("encrypt", 0.75, 0.7, 1024)
+    metrics.add("encrypt", 0.75, 0.7, 1024)
+    metrics.sample_queue("chunks_in_flight", 4)
+    metrics.sample_queue("chunks_in_flight", 2)
+    metrics.stop()
+
+    json_path = os.path.join(temp_dir, "stats.json")
+    metrics.write_json(json_path)
+    with open(json_path) as f:
+        stats = json.load(f)
+    assert stats["stages"]["encrypt"] == {
+        "wall_s": 1.5, "cpu_s": 1.4, "bytes": 2048, "calls": 2, "mb_s": 2048 / 1.5 / 1024**2
+    }
+    assert stats["queues"]["chunks_in_flight"] == {"max": 4, "mean": 3.0, "samples": 2}
+    assert stats["worker_utilisation"] == 0.75
+
+    prom_path = os.path.join(temp_dir, "box.prom")
+    metrics.write_prometheus(prom_path)
+    with open(prom_path) as f:
+        lines = f.read().splitlines()
+    assert 'secure_box_stage_bytes{command="lock",box="box.bin",stage="encrypt"} 2048' in lines
+    assert 'secure_box_queue_depth_max{command="lock",box="box.bin",queue="chunks_in_flight"} 4' in lines
+    assert "# TYPE secure_box_peak_rss_bytes gauge" in lines
+    assert not os.path.exists(prom_path + ".tmp")
@@ -0,0 +1,114 @@
+import threading
+import time
+import os
+from secure_box.utils.observer import FolderObserver
+
+
+def wait_for_changes(observer, expected, timeout=5):
+    """Collect deltas until `expected` (added, removed, modified) are all seen"""
+    seen = (set(), set(), set())
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for total, delta in zip(seen, observer.check_differences()):
+            total |= delta
+        if seen == expected:
+            break
+        time.sleep(0.05)
+    return seen
+
+
+def write(path, data):
+    with open(path, "w") as f:
+        f.write(data)
+
+
+def test_check_is_delta_since_last_check(sample_folder):
+    observer = FolderObserver(sample_folder)
+    path = os.path.join(sample_folder, "file0.txt")
+    assert observer.check_differences() == (set(), set(), set())
+
+    write(path, "changed")
+    assert observer.check_differences() == (set(), set(), {path})
+    # Reported once, not on every later check
+    assert observer.check_differences() == (set(), set(), set())
+
+
+def test_events_keep_snapshot_current(sample_folder, monkeypatch):
+    observer = FolderObserver(sample_folder)
+    observer.start()
+    try:
+        observer.check_differences()
+
+        # From here on, checks must not walk the folder
+        def no_rescan(path):
+            raise AssertionError("rescanned")
+        monkeypatch.setattr(observer, "snapshot_folder", no_rescan)
+
+        os.makedirs(os.path.join(sample_folder, "sub", "deep"))
+        write(os.path.join(sample_folder, "sub", "deep", "a.txt"), "a")
+        write(os.path.join(sample_folder, "new.txt"), "new")
+        write(os.path.join(sample_folder, "file0.txt"), "changed")
+        os.remove(os.path.join(sample_folder, "file1.txt"))
+        os.rename(os.path.join(sample_folder, "file2.txt"), os.path.join(sample_folder, "moved.txt"))
+
+        expected = (
+            {os.path.join(sample_folder, name) for name in ["new.txt", "moved.txt", "sub/deep/a.txt"]},
+            {os.path.join(sample_folder, name) for name in ["file1.txt", "file2.txt"]},
+            {os.path.join(sample_folder, "file0.txt")},
+        )
+        assert wait_for_changes(observer, expected) == expected
+
+        os.rename(os.path.join(sample_folder, "sub"), os.path.join(sample_folder, "renamed"))
+        expected = (
+            {os.path.join(sample_folder, "renamed", "deep", "a.txt")},
+            {os.path.join(sample_folder, "sub", "deep", "a.txt")},
+            set(),
+        )
+        assert wait_for_changes(observer, expected) == expected
+
+        assert observer.snapshot.keys() == FolderObserver(sample_folder).snapshot.keys()
+    finally:
+        observer.stop()
+
+
+def test_overflow_falls_back_to_rescan(sample_folder):
+    observer = FolderObserver(sample_folder, max_pending=3)
+    observer.start()
+    try:
+        observer.check_differences()
+        names = [os.path.join(sample_folder, f"n{i}.txt") for i in range(10)]
+        for name in names:
+            write(name, "x")
+
+        expected = (set(names), set(), set())
+        assert wait_for_changes(observer, expected) == expected
+    finally:
+        observer.stop()
+
+
+def test_concurrent_checks_report_each_change_once(sample_folder):
+    observer = FolderObserver(sample_folder)
+    observer.start()
+    try:
+        observer.check_differences()
+        names = [os.path.join(sample_folder, f"n{i}.txt") for i in range(50)]
+        reports = []
+
+        def check():
+            for _ in range(20):
+                reports.append(observer.check_differences()[0])
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=check) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for name in names:
+            write(name, "x")
+        for thread in threads:
+            thread.join()
+        reports.append(wait_for_changes(observer, (set(names) - set().union(*reports), set(), set()))[0])
+
+        added = [path for report in reports for path in report]
+        assert sorted(added) == sorted(names)
+    finally:
+        observer.stop()
@@ -0,0 +1,69 @@
+import pytest
+import threading
+from secure_box.utils.pipe import BoundedPipe
+
+
+def test_pipe_read_write():
+    pipe = BoundedPipe(capacity=16)
+    pipe.write(b"hello ")
+    pipe.write(b"world")
+    pipe.close()
+
+    assert pipe.read(3) == b"hel"
+    assert pipe.read() == b"lo world"
+    assert pipe.read(10) == b""
+
+
+def test_pipe_backpressure():
+    pipe = BoundedPipe(capacity=8)
+    data = bytes(range(256)) * 64
+
+    def produce():
+        for i in range(0, len(data), 5):
+            pipe.write(data[i:i + 5])
+            assert pipe._size <= 8 + 5
+        pipe.close()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+
+    received = bytearray()
+    buffer = bytearray(7)
+    while True:
+        n = pipe.readinto(buffer)
+        if n == 0:
+            break
+        received += buffer[:n]
+
+    producer.join()
+    assert bytes(received) == data
+
+
+def test_pipe_forwards_producer_error():
+    pipe = BoundedPipe()
+    pipe.write(b"partial")
+    pipe.close(error=RuntimeError("tar failed"))
+
+    with pytest.raises(RuntimeError, match="tar failed"):
+        pipe.read(100)
+
+
+def test_pipe_closed_reader_unblocks_writer():
+    pipe = BoundedPipe(capacity=4)
+    pipe.write(b"full")
+
+    errors = []
+
+    def produce():
+        try:
+            pipe.write(b"more")
+        except BrokenPipeError as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    pipe.close_reader()
+    producer.join(timeout=5)
+
+    assert not producer.is_alive()
+    assert len(errors) == 1
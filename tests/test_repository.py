@@ -0,0 +1,125 @@
+import pytest
+import os
+import io
+import random
+import hashlib
+from secure_box.utils import repository as repository_module
+from secure_box.utils.repository import Repository, RepositoryError, Chunker, PackStore, PACK_ENTRY
+
+
+SMALL = dict(min_size=1024, avg_size=4096, max_size=16 * 1024)
+
+
+def make_folder(root):
+    rng = random.Random(0)
+    os.makedirs(root, exist_ok=True)
+    for i in range(4):
+        with open(os.path.join(root, f"file{i}.bin"), "wb") as f:
+            f.write(rng.randbytes(64 * 1024))
+    return root
+
+
+def test_chunker_resynchronises_after_insert():
+    rng = random.Random(1)
+    data = rng.randbytes(200 * 1024)
+    chunker = Chunker(b"seed", 1024, 4096, 16 * 1024)
+
+    original = list(chunker.chunks(io.BytesIO(data)))
+    shifted = list(chunker.chunks(io.BytesIO(b"inserted" + data)))
+
+    assert b"".join(original) == data
+    assert all(len(chunk) <= 16 * 1024 for chunk in original)
+    # Only the chunks around the insertion change
+    assert len(set(original) - set(shifted)) <= 2
+
+
+def test_vector_and_scalar_chunkers_cut_alike(monkeypatch):
+    pytest.importorskip("numpy")
+    data = random.Random(2).randbytes(300 * 1024)
+    vector = list(Chunker(b"seed", 1024, 4096, 16 * 1024).chunks(io.BytesIO(data)))
+
+    monkeypatch.setattr(repository_module, "numpy", None)
+    scalar = list(Chunker(b"seed", 1024, 4096, 16 * 1024).chunks(io.BytesIO(data)))
+
+    assert [len(chunk) for chunk in vector] == [len(chunk) for chunk in scalar]
+
+
+def test_backup_deduplicates_and_restores(temp_dir, test_password):
+    repo_path = os.path.join(temp_dir, "repo")
+    folder = make_folder(os.path.join(temp_dir, "data"))
+
+    repository = Repository(repo_path, test_password, max_workers=2)
+    repository.init(**SMALL)
+    repository.open()
+
+    first = repository.backup(folder)
+    assert first["new_chunks"] > 0
+
+    with open(os.path.join(folder, "file2.bin"), "ab") as f:
+        f.write(b"a small change")
+
+    second = repository.backup(folder)
+    assert second["new_chunks"] < second["chunks"] / 4
+    assert second["new_bytes"] < first["new_bytes"] / 4
+
+    assert len(repository.snapshots()) == 2
+
+    out_dir = os.path.join(temp_dir, "restored")
+    repository.restore(second["snapshot"], out_dir)
+
+    for i in range(4):
+        with open(os.path.join(folder, f"file{i}.bin"), "rb") as f1, \
+                open(os.path.join(out_dir, f"file{i}.bin"), "rb") as f2:
+            assert f1.read() == f2.read()
+
+
+def test_wrong_repository_password(temp_dir, test_password):
+    repo_path = os.path.join(temp_dir, "repo")
+    Repository(repo_path, test_password).init(**SMALL)
+
+    with pytest.raises(RepositoryError, match="Wrong password"):
+        Repository(repo_path, "not the password").open()
+
+
+def test_repository_key_is_wrapped_in_key_slots(temp_dir, test_password):
+    repo_path = os.path.join(temp_dir, "repo")
+    Repository(repo_path, test_password).init(**SMALL)
+
+    with open(os.path.join(repo_path, "config")) as f:
+        config = f.read()
+    assert "key_slots" in config
+
+    repository = Repository(repo_path, test_password).open()
+    assert repository.key != hashlib.sha256(test_password.encode()).digest()
+
+
+def test_index_entries_past_the_pack_are_dropped(temp_dir, test_password):
+    repo_path = os.path.join(temp_dir, "repo")
+    folder = make_folder(os.path.join(temp_dir, "data"))
+
+    repository = Repository(repo_path, test_password, max_workers=2)
+    repository.init(**SMALL)
+    repository.open()
+    repository.backup(folder)
+
+    # A crash after the index write reached the disk but not the pack data
+    packs_dir = os.path.join(repo_path, "packs")
+    pack_path = os.path.join(packs_dir, "00000001.pack")
+    with open(pack_path, "r+b") as f:
+        f.truncate(os.path.getsize(pack_path) // 2)
+
+    packs = PackStore(packs_dir)
+    assert packs.entries
+    assert all(offset + length <= os.path.getsize(pack_path) for _, offset, length in packs.entries.values())
+    assert os.path.getsize(os.path.join(packs_dir, "00000001.idx")) == len(packs.entries) * PACK_ENTRY.size
+
+    # The next backup stores the lost chunks again
+    stats = repository.backup(folder)
+    assert stats["new_chunks"] > 0
+
+    out_dir = os.path.join(temp_dir, "restored")
+    repository.restore(stats["snapshot"], out_dir)
+    for i in range(4):
+        with open(os.path.join(folder, f"file{i}.bin"), "rb") as f1, \
+                open(os.path.join(out_dir, f"file{i}.bin"), "rb") as f2:
+            assert f1.read() == f2.read()
@@ -0,0 +1,60 @@
+import pytest
+import os
+from secure_box.utils.scanner import scan_folder, stat_entry
+
+
+def walk_order(folder):
+    """Reference: the sorted os.walk order the archive used to follow"""
+    paths = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for file in sorted(files):
+            paths.append(os.path.join(root, file))
+    return paths
+
+
+def test_scan_matches_walk_order(temp_dir):
+    folder = os.path.join(temp_dir, "tree")
+    for sub in ["b", "a/z", "a/y", "c"]:
+        os.makedirs(os.path.join(folder, sub))
+    for i, rel in enumerate(["1.txt", "0.txt", "a/f", "a/z/g", "a/y/h", "b/i", "c/j"]):
+        with open(os.path.join(folder, rel), "wb") as f:
+            f.write(b"x" * i)
+    os.symlink(os.path.join(folder, "a"), os.path.join(folder, "link"))
+
+    manifest = scan_folder(folder, max_workers=3)
+
+    assert [entry.path for entry in manifest] == walk_order(folder)
+    assert manifest.total_size == sum(range(7))
+
+    entry = next(e for e in manifest if e.arcname == os.path.join("a", "z", "g"))
+    assert entry == stat_entry(entry.path, entry.arcname)
+
+
+def test_scan_missing_or_file(temp_dir, sample_file):
+    assert len(scan_folder(sample_file)) == 0
+    assert len(scan_folder(os.path.join(temp_dir, "missing"))) == 0
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_lock_scans_folder_once(stream, sample_folder, test_password, temp_dir, monkeypatch):
+    import secure_box.utils.lock as lock_module
+    import secure_box.utils.config as config_module
+
+    scans = []
+    real_scan = lock_module.scan_folder
+
+    def counting_scan(folder):
+        scans.append(folder)
+        return real_scan(folder)
+
+    def no_walk(folder):
+        raise AssertionError("folder walked again")
+
+    monkeypatch.setattr(lock_module, "scan_folder", counting_scan)
+    monkeypatch.setattr(config_module, "get_folder_size", no_walk)
+
+    locker = lock_module.Lock(test_password, sample_folder, os.path.join(temp_dir, "box"))
+    locker.run(stream=stream)
+
+    assert scans == [sample_folder]
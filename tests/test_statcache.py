@@ -0,0 +1,151 @@
+import pytest
+import os
+from secure_box.utils import statcache
+from secure_box.utils.statcache import StatCache, cache_path, file_digest, ns_to_mtime
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+from secure_box.utils.update import Updater
+from secure_box.utils.observer import FolderObserver
+
+
+def lock_folder(folder, output_path, password, stream=True):
+    locker = Lock(password, folder, output_path)
+    locker.chunk_size = 16 * 1024
+    locker.run(stream=stream)
+
+
+def count_digests(monkeypatch):
+    calls = []
+
+    def counting_digest(path):
+        calls.append(path)
+        return file_digest(path)
+
+    monkeypatch.setattr(statcache, "file_digest", counting_digest)
+    return calls
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_lock_writes_stat_cache(stream, sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    lock_folder(sample_folder, output_path, test_password, stream)
+
+    with StatCache(cache_path(output_path + ".bin")) as cache:
+        rows = cache.load()
+        assert sorted(rows) == ["file0.txt", "file1.txt", "file2.txt"]
+        for name, (inode, size, mtime_ns) in rows.items():
+            st = os.stat(os.path.join(sample_folder, name))
+            assert (inode, size, mtime_ns) == (st.st_ino, st.st_size, st.st_mtime_ns)
+            assert cache.get(name)[3] == file_digest(os.path.join(sample_folder, name))
+
+
+def test_touched_file_is_not_appended(sample_folder, test_password, temp_dir, monkeypatch):
+    output_path = os.path.join(temp_dir, "box")
+    lock_folder(sample_folder, output_path, test_password)
+    calls = count_digests(monkeypatch)
+
+    # Unchanged stat data: nothing is read
+    stats = Updater(test_password, sample_folder, output_path).update()
+    assert stats["appended_bytes"] == 0
+    assert calls == []
+
+    touched = os.path.join(sample_folder, "file1.txt")
+    os.utime(touched, ns=(0, os.stat(touched).st_mtime_ns + 5 * 10 ** 9))
+
+    stats = Updater(test_password, sample_folder, output_path).update()
+    assert stats["modified"] == 0
+    assert stats["appended_bytes"] == 0
+    assert calls == [touched]
+
+    # The refreshed row spares the next run from hashing it again
+    Updater(test_password, sample_folder, output_path).update()
+    assert calls == [touched]
+
+    with open(touched, "a") as f:
+        f.write("more\n")
+    stats = Updater(test_password, sample_folder, output_path).update()
+    assert stats["modified"] == 1
+
+    with StatCache(cache_path(output_path + ".bin")) as cache:
+        assert cache.get("file1.txt")[3] == file_digest(touched)
+
+
+def test_resume_from_tar_does_not_trust_the_folder(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    locker = Lock(test_password, sample_folder, output_path)
+    locker.chunk_size = 1024
+    checkpoint = locker._checkpoint
+
+    def crash(fout, bytes_written, chunk_index):
+        checkpoint(fout, bytes_written, chunk_index)
+        if chunk_index == 2:
+            raise IOError("power cut")
+
+    locker._checkpoint = crash
+    with pytest.raises(IOError, match="power cut"):
+        locker.run()
+
+    # The TAR being encrypted still holds the old content
+    changed = os.path.join(sample_folder, "file0.txt")
+    with open(changed, "w") as f:
+        f.write("Changed 0\n" * 50)
+
+    locker = Lock(test_password, sample_folder, output_path)
+    locker.chunk_size = 1024
+    locker.run(resume=True)
+    assert not os.path.exists(cache_path(output_path + ".bin"))
+
+    stats = Updater(test_password, sample_folder, output_path).update()
+    assert stats["modified"] > 0
+
+    out_dir = os.path.join(temp_dir, "out")
+    Unlock(test_password, output_path).decrypt_extract(output_path + ".bin", out_dir)
+    with open(os.path.join(out_dir, "file0.txt")) as f:
+        assert f.read() == "Changed 0\n" * 50
+
+    # The update wrote a fresh cache
+    with StatCache(cache_path(output_path + ".bin")) as cache:
+        assert cache.get("file0.txt")[3] == file_digest(changed)
+
+
+def test_observer_uses_cached_hashes(sample_folder, temp_dir):
+    path = os.path.join(temp_dir, "cache.manifest")
+    observer = FolderObserver(sample_folder)
+    rows = [
+        (os.path.basename(p), ino, size, 0, file_digest(p))
+        for p, (size, mtime, ino) in observer.snapshot.items()
+    ]
+    StatCache.write(path, rows)
+
+    for p in observer.snapshot:
+        os.utime(p, (1, 1))
+    with open(os.path.join(sample_folder, "file2.txt"), "w") as f:
+        f.write("Content 9\n" * 50)
+
+    with StatCache(path) as cache:
+        observer.stat_cache = cache
+        added, removed, modified = observer.check_differences()
+
+    assert (added, removed) == (set(), set())
+    assert modified == {os.path.join(sample_folder, "file2.txt")}
+
+
+def test_stat_cache_rows(temp_dir):
+    path = os.path.join(temp_dir, "cache.manifest")
+    StatCache.write(path, [("a", 1, 2, 3, b"h"), ("b/c", 4, 5, 6, None)])
+    StatCache.write(path, [("a", 1, 2, 3, b"h"), ("b/c", 4, 5, 6, None)])
+
+    with StatCache(path) as cache:
+        assert cache.load() == {"a": (1, 2, 3), "b/c": (4, 5, 6)}
+        assert cache.get("a") == (1, 2, 3, b"h")
+        cache.remove(["a"])
+        cache.update([("d", 7, 8, 9, b"x")])
+        assert len(cache) == 2
+        assert cache.get("a") is None
+
+    for mtime_ns in [0, 1, 999_999_999, 1_700_000_000_123_456_789, -1_500_000_001]:
+        path = os.path.join(temp_dir, "t")
+        open(path, "w").close()
+        os.utime(path, ns=(0, mtime_ns))
+        st = os.stat(path)
+        assert ns_to_mtime(st.st_mtime_ns) == st.st_mtime
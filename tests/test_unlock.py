@@ -4,6 +4,8 @@ import os
 import tarfile
 from secure_box.utils.unlock import Unlock
 from secure_box.utils.lock import Lock
+from secure_box.utils.container import Container, FLAG_CODECS
+from secure_box.utils.compress import CODEC_ZLIB
 
 
 def test_unlock_initialization(test_password):
@@ -23,27 +25,12 @@ def test_unlock_temp_directory_setup(test_password, temp_dir):
     
     assert unlocker.temp_dir is not None
     assert os.path.exists(unlocker.temp_dir)
-    assert unlocker.enc_path is not None
     assert unlocker.tar_path is not None
     
     # Cleanup
     unlocker._cleanup_temp()
     assert not os.path.exists(unlocker.temp_dir)
-
-
-def test_copy_in_chunks(test_password, sample_file, temp_dir):
-    """Chunk'lar halinde kopyalama testi"""
-    unlocker = Unlock(test_password, "dummy")
-    
-    dest = os.path.join(temp_dir, "copied.txt")
-    unlocker._copy_in_chunks(sample_file, dest, chunk_size=1024)
-    
-    # Dosya kopyalandı mı?
-    assert os.path.exists(dest)
-    
-    # İçerik aynı mı?
-    with open(sample_file, "rb") as f1, open(dest, "rb") as f2:
-        assert f1.read() == f2.read()
+    assert not os.path.exists(unlocker.tar_path)
 
 
 def test_decrypt_stream(sample_folder, test_password, temp_dir):
@@ -68,7 +55,7 @@ def test_decrypt_stream(sample_folder, test_password, temp_dir):
     assert tarfile.is_tarfile(dec_file)
 
 
-def test_extract_tar_stream(sample_folder, test_password, temp_dir):
+def test_extract_tar_fileobj(sample_folder, test_password, temp_dir):
     """TAR extract testi"""
     # Encrypt -> Decrypt yap
     output_path = os.path.join(temp_dir, "encrypted")
@@ -85,7 +72,8 @@ def test_extract_tar_stream(sample_folder, test_password, temp_dir):
     extract_dir = os.path.join(temp_dir, "extracted")
     os.makedirs(extract_dir)
     
-    unlocker.extract_tar_stream(dec_file, extract_dir)
+    with open(dec_file, "rb") as f:
+        assert unlocker.extract_tar_fileobj(f, extract_dir) == 3
     
     # Dosyalar extract edildi mi?
     extracted_files = os.listdir(extract_dir)
@@ -112,4 +100,172 @@ def test_wrong_password_decrypt(sample_folder, test_password, temp_dir):
     
     # Hata bekliyoruz (cryptography exception)
     with pytest.raises(Exception):  # InvalidTag veya benzeri
-        unlocker.decrypt_stream(enc_file, dec_file, unlocker.key)
\ No newline at end of file
+        unlocker.decrypt_stream(enc_file, dec_file, unlocker.key)
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_decrypt_stream_workers(workers, test_password, temp_dir):
+    src = os.path.join(temp_dir, "plain.bin")
+    data = os.urandom(30 * 1000 + 7)
+    with open(src, "wb") as f:
+        f.write(data)
+
+    output_path = os.path.join(temp_dir, "encrypted")
+    locker = Lock(test_password, temp_dir, output_path)
+    locker.chunk_size = 1000
+    enc_file = output_path + ".bin"
+    locker.encrypt_stream(src, enc_file, locker.key)
+
+    unlocker = Unlock(test_password, output_path, max_workers=workers)
+    dec_file = os.path.join(temp_dir, "decrypted.bin")
+    unlocker.decrypt_stream(enc_file, dec_file, unlocker.key)
+
+    with open(dec_file, "rb") as f:
+        assert f.read() == data
+
+
+def test_decrypt_stream_detects_truncation(test_password, temp_dir):
+    src = os.path.join(temp_dir, "plain.bin")
+    with open(src, "wb") as f:
+        f.write(os.urandom(5000))
+
+    output_path = os.path.join(temp_dir, "encrypted")
+    locker = Lock(test_password, temp_dir, output_path)
+    locker.chunk_size = 1000
+    enc_file = output_path + ".bin"
+    locker.encrypt_stream(src, enc_file, locker.key)
+
+    with open(enc_file, "r+b") as f:
+        f.truncate(os.path.getsize(enc_file) - 10)
+
+    unlocker = Unlock(test_password, output_path, max_workers=2)
+    with pytest.raises(ValueError, match="truncated"):
+        unlocker.decrypt_stream(enc_file, os.path.join(temp_dir, "out"), unlocker.key)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_extract_single_path(stream, test_password, temp_dir, monkeypatch):
+    folder = os.path.join(temp_dir, "data")
+    os.makedirs(os.path.join(folder, "etc"))
+    with open(os.path.join(folder, "big.bin"), "wb") as f:
+        f.write(os.urandom(50 * 1024))
+    with open(os.path.join(folder, "etc", "app.conf"), "w") as f:
+        f.write("key = value\n")
+    with open(os.path.join(folder, "etc", "other.conf"), "w") as f:
+        f.write("other\n")
+
+    output_path = os.path.join(temp_dir, "box")
+    locker = Lock(test_password, folder, output_path)
+    locker.chunk_size = 4096
+    locker.run(use_threading=False, stream=stream)
+
+    unlocker = Unlock(test_password, output_path)
+    decrypted = []
+
+    from secure_box.utils.container import Container
+    read_frame = Container.read_frame
+
+    def counting_read_frame(self, chunk_index):
+        decrypted.append(chunk_index)
+        return read_frame(self, chunk_index)
+
+    monkeypatch.setattr(Container, "read_frame", counting_read_frame)
+
+    out_dir = os.path.join(temp_dir, "out")
+    names = unlocker.extract_paths("etc/app.conf", out_dir)
+
+    assert names == ["etc/app.conf"]
+    with open(os.path.join(out_dir, "etc", "app.conf")) as f:
+        assert f.read() == "key = value\n"
+    assert not os.path.exists(os.path.join(out_dir, "big.bin"))
+    # 50 KB of data spans 13+ chunks, the small file needs at most two
+    assert 1 <= len(set(decrypted)) <= 2
+
+    names = unlocker.extract_paths("etc/*.conf", os.path.join(temp_dir, "glob"))
+    assert names == ["etc/app.conf", "etc/other.conf"]
+
+    with pytest.raises(FileNotFoundError):
+        unlocker.extract_paths("missing.txt", out_dir)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_decrypt_stream_verifies_checksum(workers, sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "encrypted")
+    Lock(test_password, sample_folder, output_path).run(stream=True)
+
+    enc_file = output_path + ".bin"
+    unlocker = Unlock(test_password, output_path, max_workers=workers)
+    unlocker.decrypt_stream(enc_file, os.path.join(temp_dir, "ok.tar"), unlocker.key)
+
+    with open(enc_file + ".sha256", "w") as f:
+        f.write("0" * 64)
+
+    with pytest.raises(ValueError, match="checksum"):
+        unlocker.decrypt_stream(enc_file, os.path.join(temp_dir, "bad.tar"), unlocker.key)
+
+
+def test_run_reads_box_in_place(sample_folder, test_password, temp_dir, monkeypatch):
+    output_path = os.path.join(temp_dir, "encrypted")
+    Lock(test_password, sample_folder, output_path).run(stream=True)
+
+    unlocker = Unlock(test_password, output_path)
+    opened = []
+
+    monkeypatch.setattr(unlocker, "open_folder", lambda: opened.append(os.listdir(unlocker.temp_dir)))
+    monkeypatch.setattr("builtins.input", lambda prompt="": "")
+
+    unlocker.run()
+
+    assert "file1.txt" in opened[0]
+    assert not os.path.exists(unlocker.temp_dir)
+    assert not os.path.exists(unlocker.tar_path)
+
+    # The box is written back with the same key slots
+    again = Unlock(test_password, output_path)
+    again.decrypt_stream(output_path + ".bin", os.path.join(temp_dir, "again.tar"), again.key)
+    assert tarfile.is_tarfile(os.path.join(temp_dir, "again.tar"))
+
+
+def test_run_relocks_with_the_box_settings(sample_folder, test_password, temp_dir, monkeypatch):
+    output_path = os.path.join(temp_dir, "encrypted")
+    locker = Lock(test_password, sample_folder, output_path, compression="zlib")
+    locker.chunk_size = 4096
+    locker.run(stream=True)
+
+    unlocker = Unlock(test_password, output_path)
+    monkeypatch.setattr(unlocker, "open_folder", lambda: None)
+    monkeypatch.setattr("builtins.input", lambda prompt="": "")
+    unlocker.run()
+
+    with Container(output_path + ".bin") as container:
+        assert container.chunk_size == 4096
+        assert container.flags & FLAG_CODECS
+        assert container.read_frame(0).codec == CODEC_ZLIB
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_decrypt_extract_pipeline(workers, test_password, temp_dir):
+    folder = os.path.join(temp_dir, "data")
+    os.makedirs(os.path.join(folder, "nested"))
+    files = {"big.bin": os.urandom(40 * 1024), "nested/small.txt": b"small\n"}
+    for name, content in files.items():
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(content)
+
+    output_path = os.path.join(temp_dir, "box")
+    locker = Lock(test_password, folder, output_path)
+    locker.chunk_size = 4096
+    locker.run(stream=True)
+
+    unlocker = Unlock(test_password, output_path, max_workers=workers)
+    out_dir = os.path.join(temp_dir, "out")
+    assert unlocker.decrypt_extract(output_path + ".bin", out_dir) == 2
+
+    for name, content in files.items():
+        with open(os.path.join(out_dir, name), "rb") as f:
+            assert f.read() == content
+    assert sorted(os.listdir(temp_dir)) == sorted(["data", "out", "box.bin", "box.bin.sha256", "box.bin.state", "box.bin.manifest"])
+
+    with open(output_path + ".bin.sha256", "w") as f:
+        f.write("0" * 64)
+    with pytest.raises(ValueError, match="checksum"):
+        unlocker.decrypt_extract(output_path + ".bin", os.path.join(temp_dir, "bad"))
@@ -0,0 +1,184 @@
+import pytest
+import os
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+from secure_box.utils import backup, lock
+from secure_box.utils.update import Updater
+from secure_box.utils.container import Container
+from secure_box.utils.compress import CODEC_ZLIB
+from secure_box.utils.checksum import SHA256_TREE, hash_file, read_checksum
+
+
+def make_folder(temp_dir):
+    folder = os.path.join(temp_dir, "data")
+    os.makedirs(os.path.join(folder, "sub"))
+    with open(os.path.join(folder, "big.bin"), "wb") as f:
+        f.write(os.urandom(200 * 1024))
+    with open(os.path.join(folder, "keep.txt"), "w") as f:
+        f.write("keep\n")
+    with open(os.path.join(folder, "sub", "old.txt"), "w") as f:
+        f.write("old\n")
+    return folder
+
+
+def lock_folder(folder, output_path, password, compression="none"):
+    locker = Lock(password, folder, output_path, compression=compression)
+    locker.chunk_size = 16 * 1024
+    locker.run(stream=True)
+
+
+def unlock_to(output_path, password, temp_dir, name):
+    unlocker = Unlock(password, output_path, max_workers=2)
+    out_dir = os.path.join(temp_dir, name)
+
+    unlocker.decrypt_extract(output_path + ".bin", out_dir)
+    return out_dir
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def change_folder(folder):
+    with open(os.path.join(folder, "keep.txt"), "w") as f:
+        f.write("changed\n")
+    with open(os.path.join(folder, "new.txt"), "w") as f:
+        f.write("new\n")
+    os.remove(os.path.join(folder, "sub", "old.txt"))
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_update_appends_only_changes(compression, test_password, temp_dir):
+    folder = make_folder(temp_dir)
+    output_path = os.path.join(temp_dir, "box")
+    lock_folder(folder, output_path, test_password, compression)
+    size_before = os.path.getsize(output_path + ".bin")
+
+    change_folder(folder)
+    updater = Updater(test_password, folder, output_path, compact_threshold=1.0)
+    stats = updater.update()
+
+    assert (stats["added"], stats["modified"], stats["removed"]) == (1, 1, 1)
+    assert not stats["compacted"]
+    # The 200 KB file is not rewritten
+    assert 0 < stats["appended_bytes"] < 50 * 1024
+    assert os.path.getsize(output_path + ".bin") == size_before + stats["appended_bytes"]
+
+    with Container(output_path + ".bin") as container:
+        assert container.is_complete()
+
+    # Updated boxes move to a sha256-tree sidecar
+    saved = read_checksum(output_path + ".bin.sha256")
+    assert saved.scheme == SHA256_TREE
+    assert saved == hash_file(output_path + ".bin", SHA256_TREE)
+
+    out_dir = unlock_to(output_path, test_password, temp_dir, "out")
+    assert read(os.path.join(out_dir, "keep.txt")) == b"changed\n"
+    assert read(os.path.join(out_dir, "new.txt")) == b"new\n"
+    assert read(os.path.join(out_dir, "big.bin")) == read(os.path.join(folder, "big.bin"))
+    assert not os.path.exists(os.path.join(out_dir, "sub", "old.txt"))
+
+    unlocker = Unlock(test_password, output_path)
+    streamed = os.path.join(temp_dir, "streamed")
+    assert unlocker.decrypt_extract(output_path + ".bin", streamed) == 3
+    assert read(os.path.join(streamed, "keep.txt")) == b"changed\n"
+    assert not os.path.exists(os.path.join(streamed, "sub", "old.txt"))
+
+    unlocker.extract_paths("keep.txt", os.path.join(temp_dir, "single"))
+    assert read(os.path.join(temp_dir, "single", "keep.txt")) == b"changed\n"
+
+    # Nothing left to do on a second run
+    stats = Updater(test_password, folder, output_path).update()
+    assert stats["appended_bytes"] == 0
+
+
+def test_update_does_not_rehash_the_whole_box(test_password, temp_dir, monkeypatch):
+    folder = make_folder(temp_dir)
+    output_path = os.path.join(temp_dir, "box")
+    locker = Lock(test_password, folder, output_path, checksum=SHA256_TREE)
+    locker.chunk_size = 16 * 1024
+    locker.run(stream=True)
+
+    hashed = []
+
+    def spy(path, *args, **kwargs):
+        hashed.append(path)
+        return hash_file(path, *args, **kwargs)
+
+    monkeypatch.setattr(lock, "hash_file", spy)
+    monkeypatch.setattr(backup, "hash_file", spy)
+
+    change_folder(folder)
+    stats = Updater(test_password, folder, output_path, compact_threshold=1.0).update()
+
+    assert stats["added"] == 1
+    assert hashed == []
+    assert read_checksum(output_path + ".bin.sha256") == hash_file(output_path + ".bin", SHA256_TREE)
+
+
+def test_compact_drops_dead_members(test_password, temp_dir):
+    folder = make_folder(temp_dir)
+    output_path = os.path.join(temp_dir, "box")
+    lock_folder(folder, output_path, test_password)
+
+    with open(os.path.join(folder, "big.bin"), "wb") as f:
+        f.write(os.urandom(10 * 1024))
+
+    # big.bin is now dead weight beyond the threshold
+    stats = Updater(test_password, folder, output_path, compact_threshold=0.5).update()
+    assert stats["dead_ratio"] > 0.5
+    assert stats["compacted"]
+
+    updater = Updater(test_password, None, output_path)
+    updater.load_box()
+    assert updater.dead == []
+    assert os.path.getsize(output_path + ".bin") < 100 * 1024
+
+    out_dir = unlock_to(output_path, test_password, temp_dir, "out")
+    assert read(os.path.join(out_dir, "big.bin")) == read(os.path.join(folder, "big.bin"))
+    assert read(os.path.join(out_dir, "sub", "old.txt")) == b"old\n"
+
+
+def test_compact_keeps_the_box_codec(test_password, temp_dir):
+    folder = os.path.join(temp_dir, "text")
+    os.makedirs(folder)
+    for i in range(3):
+        with open(os.path.join(folder, f"file{i}.txt"), "w") as f:
+            f.write(f"line {i}\n" * 20000)
+    output_path = os.path.join(temp_dir, "box")
+    lock_folder(folder, output_path, test_password, "zlib")
+    size_before = os.path.getsize(output_path + ".bin")
+
+    updater = Updater(test_password, None, output_path)
+    updater.compact()
+
+    assert os.path.getsize(output_path + ".bin") <= size_before
+    with Container(output_path + ".bin") as container:
+        assert container.read_frame(0).codec == CODEC_ZLIB
+
+
+def test_failed_update_is_rolled_back(test_password, temp_dir, monkeypatch):
+    folder = make_folder(temp_dir)
+    output_path = os.path.join(temp_dir, "box")
+    lock_folder(folder, output_path, test_password)
+    original = read(output_path + ".bin")
+
+    change_folder(folder)
+    updater = Updater(test_password, folder, output_path)
+    encrypt = updater._encrypt_parallel
+
+    def failing_encrypt(fin, outpath, total_size, checkpoint, seekable):
+        updater._writer.fout.write(b"half written frame")
+        raise IOError("disk full")
+
+    monkeypatch.setattr(updater, "_encrypt_parallel", failing_encrypt)
+
+    with pytest.raises(IOError, match="disk full"):
+        updater.update()
+
+    assert read(output_path + ".bin") == original
+    assert not os.path.exists(updater.state_path)
+
+    monkeypatch.setattr(updater, "_encrypt_parallel", encrypt)
+    assert updater.update()["added"] == 1
@@ -0,0 +1,87 @@
+import pytest
+import os
+from secure_box.utils.lock import Lock
+from secure_box.utils.verify import Verifier
+from secure_box.utils.container import Container
+from secure_box.utils.checksum import SHA256_TREE
+
+
+def lock_box(folder, output_path, password, checksum="sha256"):
+    locker = Lock(password, folder, output_path, checksum=checksum)
+    locker.chunk_size = 1024
+    locker.run(stream=True)
+    return output_path + ".bin"
+
+
+def flip_byte(path, offset):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_intact_box(workers, sample_folder, test_password, temp_dir):
+    box = lock_box(sample_folder, os.path.join(temp_dir, "box"), test_password)
+    before = sorted(os.listdir(temp_dir))
+
+    report = Verifier(test_password, os.path.join(temp_dir, "box"), max_workers=workers).verify()
+    assert report["ok"]
+    assert report["damaged"] == []
+    assert report["meta"] is True
+    assert report["checksum"] is True
+    with Container(box) as container:
+        assert report["chunks"] == len(container.index)
+
+    # Nothing is extracted or left behind
+    assert sorted(os.listdir(temp_dir)) == before
+
+
+def test_damaged_chunks_are_reported(sample_folder, test_password, temp_dir):
+    box = lock_box(sample_folder, os.path.join(temp_dir, "box"), test_password, SHA256_TREE)
+    with Container(box) as container:
+        offsets = [container.frame_end(i) - 1 for i in (1, 3)]
+    for offset in offsets:
+        flip_byte(box, offset)
+
+    report = Verifier(test_password, os.path.join(temp_dir, "box"), max_workers=3).verify()
+    assert not report["ok"]
+    assert report["damaged"] == [1, 3]
+    assert report["meta"] is True
+    assert report["checksum"] is False
+    assert report["scheme"] == SHA256_TREE
+
+
+def test_damaged_member_table(sample_folder, test_password, temp_dir):
+    box = lock_box(sample_folder, os.path.join(temp_dir, "box"), test_password)
+    with Container(box) as container:
+        container.index
+        meta_end = container.meta_offset + container.meta_length
+    flip_byte(box, meta_end - 1)
+    os.remove(box + ".sha256")
+
+    report = Verifier(test_password, os.path.join(temp_dir, "box")).verify()
+    assert report["damaged"] == []
+    assert report["meta"] is False
+    assert report["checksum"] is None
+    assert not report["ok"]
+
+
+def test_v1_box_without_member_table(temp_dir, test_password):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    locker = Lock(test_password, temp_dir, os.path.join(temp_dir, "legacy"))
+    aes = AESGCM(locker.password_to_key(test_password))
+
+    # v1: bare frames, no header, member table or footer
+    with open(os.path.join(temp_dir, "legacy.bin"), "wb") as f:
+        for _ in range(3):
+            nonce = os.urandom(12)
+            enc = aes.encrypt(nonce, os.urandom(1000), None)
+            f.write(len(enc).to_bytes(4, "big") + nonce + enc)
+
+    report = Verifier(test_password, os.path.join(temp_dir, "legacy")).verify()
+    assert report["chunks"] == 3
+    assert report["damaged"] == []
+    assert report["meta"] is None
+    assert report["ok"]
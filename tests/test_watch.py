@@ -0,0 +1,94 @@
+import pytest
+import time
+import os
+from secure_box.utils.lock import Lock
+from secure_box.utils.unlock import Unlock
+from secure_box.utils.watch import Watcher
+from secure_box.utils import update
+
+
+def lock_folder(folder, output_path, password):
+    locker = Lock(password, folder, output_path)
+    locker.chunk_size = 16 * 1024
+    locker.run(stream=True)
+
+
+def wait_for_events(watcher, count):
+    deadline = time.time() + 5
+    while watcher.observer.event_count - watcher._seen_events < count and time.time() < deadline:
+        time.sleep(0.02)
+
+
+def write(path, data):
+    with open(path, "w") as f:
+        f.write(data)
+
+
+@pytest.fixture
+def watcher(sample_folder, test_password, temp_dir):
+    output_path = os.path.join(temp_dir, "box")
+    lock_folder(sample_folder, output_path, test_password)
+
+    watcher = Watcher(test_password, sample_folder, output_path, debounce=2, max_lag=6,
+                      min_interval=5, clock=lambda: 0.0)
+    watcher.observer.start()
+    yield watcher
+    watcher.observer.stop()
+
+
+def test_bursts_are_batched(watcher, sample_folder, test_password, temp_dir):
+    # The first poll syncs whatever changed while nothing was watching
+    assert watcher.poll(now=0)["appended_bytes"] == 0
+
+    write(os.path.join(sample_folder, "a.txt"), "a")
+    write(os.path.join(sample_folder, "b.txt"), "b")
+    wait_for_events(watcher, 1)
+
+    assert watcher.poll(now=1) is None   # within min_interval
+    assert watcher.poll(now=4) is None   # quiet for 3s, but still within min_interval
+    stats = watcher.poll(now=5.5)
+    assert stats["added"] == 2
+    assert watcher.metrics["relocks"] == 2
+    assert watcher.pending == set()
+
+    unlocker = Unlock(test_password, watcher.name)
+    out_dir = os.path.join(temp_dir, "out")
+    assert unlocker.decrypt_extract(watcher.name + ".bin", out_dir) == 5
+
+
+def test_lag_is_bounded_under_steady_writes(watcher, sample_folder):
+    watcher.poll(now=0)
+    path = os.path.join(sample_folder, "file0.txt")
+
+    relocked = []
+    for step in range(10):
+        now = 10 + step
+        write(path, f"version {step}")
+        wait_for_events(watcher, 1)
+        if watcher.poll(now=now) is not None:
+            relocked.append(now)
+
+    # Never quiet for the debounce, so max_lag (6s after the first change at 10) decides,
+    # and min_interval keeps the relocks apart
+    assert relocked == [16]
+    assert watcher.metrics["files"] == 1
+
+
+def test_failed_relock_is_retried(watcher, sample_folder, monkeypatch):
+    watcher.poll(now=0)
+    write(os.path.join(sample_folder, "a.txt"), "a")
+    wait_for_events(watcher, 1)
+
+    def failing_update(self, names=None):
+        raise IOError("disk full")
+
+    original = update.Updater.update
+    monkeypatch.setattr(update.Updater, "update", failing_update)
+    assert watcher.poll(now=10) is None
+    assert watcher.poll(now=12.5) is None
+    assert watcher.metrics["failures"] == 1
+    assert watcher.pending == {"a.txt"}
+
+    monkeypatch.setattr(update.Updater, "update", original)
+    assert watcher.poll(now=15) is None  # min_interval
+    assert watcher.poll(now=17.5)["added"] == 1